@@ -0,0 +1,215 @@
+"""
+Anomaly detection over pool and protocol metric histories.
+
+After each ingest, the latest value of every series in the snapshot is
+scored against its last ``ANOMALY_WINDOW_DAYS`` days of daily history (see
+``defi.history``) in one vectorized pass: the whole window is a
+``series x days`` matrix, and rolling median, MAD, mean and standard
+deviation are column reductions over it. The robust z-score
+``(value - median) / (1.4826 * MAD)`` drives the rules, so a few earlier
+spikes in a series don't mask a new one; the classic z-score is kept in the
+flag details.
+
+Rules, each also requiring a minimum relative move against the median:
+
+* ``tvl_drain``: pool or protocol TVL far below its baseline,
+* ``apy_spike``: pool APY far above its baseline,
+* ``mcap_crash``: protocol market cap far below its baseline,
+* ``fast_drain``: protocol TVL down sharply over 1h/1d per DeFiLlama's own
+  ``change_1h``/``change_1d``, which needs no history (protocols with at
+  least ``ANOMALY_MIN_TVL``).
+
+Flags of each run are stored in ``AnomalyFlag`` with the dataset generation
+they were computed for.
+"""
+
+import logging
+import time
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .history import load_window, record_daily_history, window_bounds
+from .models import AnomalyFlag
+from .snapshots import load_snapshot
+
+logger = logging.getLogger(__name__)
+
+MAD_SCALE = 1.4826  # Makes MAD comparable to a standard deviation
+
+# Dataset -> (snapshot key column, label column, [(kind, metric, direction,
+# minimum relative change, smallest deviation scale in the metric's unit)])
+ANOMALY_RULES = {
+    "yield_data": (
+        "pool",
+        "symbol",
+        [
+            ("tvl_drain", "tvlUsd", -1, -0.3, 1000.0),
+            ("apy_spike", "apy", 1, 0.5, 1.0),
+        ],
+    ),
+    "risk_metrics": (
+        "slug",
+        "name",
+        [
+            ("tvl_drain", "tvl", -1, -0.3, 1000.0),
+            ("mcap_crash", "mcap", -1, -0.3, 1000.0),
+        ],
+    ),
+}
+
+
+def robust_scores(current, window, min_scale=0.0):
+    """
+    Score each row's ``current`` value against its ``window`` row.
+
+    Returns (score, zscore, median, observations); scores are NaN where the
+    series has fewer than ANOMALY_MIN_HISTORY observations.
+    """
+    observations = np.count_nonzero(~np.isnan(window), axis=1)
+    enough = observations >= settings.ANOMALY_MIN_HISTORY
+    window = window[enough]
+    score = np.full(current.shape, np.nan)
+    zscore = np.full(current.shape, np.nan)
+    median = np.full(current.shape, np.nan)
+    if not window.size:
+        return score, zscore, median, observations
+
+    med = np.nanmedian(window, axis=1)
+    mad = np.nanmedian(np.abs(window - med[:, None]), axis=1)
+    # Flat series have MAD 0; fall back to a small fraction of the level
+    scale = np.maximum(MAD_SCALE * mad, settings.ANOMALY_MIN_SCALE * np.abs(med))
+    scale = np.maximum(scale, min_scale)
+    mean = np.nanmean(window, axis=1)
+    std = np.nanstd(window, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        score[enough] = (current[enough] - med) / scale
+        zscore[enough] = (current[enough] - mean) / std
+    median[enough] = med
+    return score, zscore, median, observations
+
+
+def detect_anomalies(dataset, snapshot):
+    """Score ``snapshot`` against history and return unsaved AnomalyFlags."""
+    key_column, label_column, rules = ANOMALY_RULES[dataset]
+    labels = snapshot.categories[label_column]
+    label_codes = np.asarray(snapshot[label_column])
+    key_labels = np.array(snapshot.categories[key_column], dtype=str)
+    keys = key_labels[np.asarray(snapshot[key_column])]
+    outlier = np.asarray(snapshot["outlier"]) if dataset == "yield_data" else None
+
+    start, end = window_bounds(settings.ANOMALY_WINDOW_DAYS)
+    history_keys, matrices = load_window(
+        dataset, [rule[1] for rule in rules], start, end
+    )
+    # Snapshot rows with history, and their row in the history matrices
+    position = np.searchsorted(history_keys, keys)
+    found = position < len(history_keys)
+    found[found] = history_keys[position[found]] == keys[found]
+    rows = np.flatnonzero(found)
+    position = position[rows]
+
+    now = timezone.now()
+    flags = []
+    for kind, metric, direction, min_change, min_scale in rules:
+        current = np.asarray(snapshot[metric], dtype=np.float64)[rows]
+        window = matrices[metric][position]
+        score, zscore, median, observations = robust_scores(current, window, min_scale)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            change = (current - median) / np.abs(median)
+            hits = (direction * score >= settings.ANOMALY_THRESHOLD) & (
+                direction * change >= direction * min_change
+            )
+        if metric == "apy":
+            hits &= current >= settings.ANOMALY_MIN_APY
+        for i in np.flatnonzero(hits):
+            row = rows[i]
+            details = {
+                "zscore": float(zscore[i]) if np.isfinite(zscore[i]) else None,
+                "observations": int(observations[i]),
+                "window_days": settings.ANOMALY_WINDOW_DAYS,
+            }
+            if outlier is not None:
+                details["upstream_outlier"] = bool(outlier[row])
+            flags.append(
+                AnomalyFlag(
+                    dataset=dataset,
+                    generation=snapshot.generation,
+                    kind=kind,
+                    key=keys[row],
+                    label=labels[label_codes[row]],
+                    metric=metric,
+                    value=float(current[i]),
+                    baseline=float(median[i]),
+                    # A zero baseline has no relative change
+                    change=float(change[i]) if np.isfinite(change[i]) else None,
+                    score=float(score[i]),
+                    severity=abs(float(score[i])),
+                    details=details,
+                    detected_at=now,
+                )
+            )
+
+    if dataset == "risk_metrics":
+        flags.extend(_fast_drains(snapshot, keys, labels, label_codes, now))
+    return flags
+
+
+def _fast_drains(snapshot, keys, labels, label_codes, now):
+    flags = []
+    tvl = np.asarray(snapshot["tvl"])
+    for column, limit in (
+        ("change_1h", settings.ANOMALY_FAST_DRAIN_1H),
+        ("change_1d", settings.ANOMALY_FAST_DRAIN_1D),
+    ):
+        change = np.asarray(snapshot[column])  # Percent
+        with np.errstate(invalid="ignore"):
+            hits = (change <= -limit) & (tvl >= settings.ANOMALY_MIN_TVL)
+        for row in np.flatnonzero(hits):
+            flags.append(
+                AnomalyFlag(
+                    dataset="risk_metrics",
+                    generation=snapshot.generation,
+                    kind="fast_drain",
+                    key=keys[row],
+                    label=labels[label_codes[row]],
+                    metric=column,
+                    value=float(change[row]),
+                    change=float(change[row]) / 100,
+                    score=float(change[row]) / limit,
+                    severity=abs(float(change[row])) / limit,
+                    details={"tvl": float(tvl[row])},
+                    detected_at=now,
+                )
+            )
+    return flags
+
+
+def run_anomaly_detection(dataset):
+    """Record today's history and store this generation's flags; never raises."""
+    if dataset not in ANOMALY_RULES:
+        return
+    try:
+        snapshot = load_snapshot(dataset)
+        if snapshot is None:
+            return
+        record_daily_history(dataset, snapshot)
+        start = time.perf_counter()
+        flags = detect_anomalies(dataset, snapshot)
+        elapsed = time.perf_counter() - start
+        with transaction.atomic():
+            AnomalyFlag.objects.filter(
+                dataset=dataset, generation=snapshot.generation
+            ).delete()
+            AnomalyFlag.objects.bulk_create(flags, batch_size=500)
+            AnomalyFlag.objects.filter(
+                detected_at__lt=timezone.now()
+                - timedelta(days=settings.ANOMALY_RETENTION_DAYS)
+            ).delete()
+        logger.info(
+            f"Anomaly detection {dataset}@{snapshot.generation}: "
+            f"{len(flags)} flags over {snapshot.rows} series in {elapsed * 1000:.0f}ms"
+        )
+    except Exception:
+        logger.exception(f"Error detecting {dataset} anomalies")
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class DefiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "defi"
+
+    def ready(self):
+        from .db import configure_sqlite_connection
+        from .instrumentation import install_query_recorder
+
+        connection_created.connect(configure_sqlite_connection)
+        connection_created.connect(install_query_recorder)
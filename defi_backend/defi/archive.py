@@ -0,0 +1,131 @@
+"""
+Content-addressed archive of raw upstream payloads.
+
+Every successfully downloaded body is hashed (SHA-256) and stored gzipped
+once under ``PAYLOAD_ARCHIVE_DIR/<hash[:2]>/<hash>.json.gz``; a ``RawPayload``
+row per dataset and distinct body records when it was first and last seen.
+When a body is identical to the one a dataset last ingested, the fetch skips
+parsing, writing and re-serializing altogether.
+
+Archived bodies can be fed back through ingestion with the
+``replay_payload`` management command, e.g. to rebuild derived tables after
+a schema or mapping change, without calling the upstream APIs. Bodies not
+seen for ``PAYLOAD_ARCHIVE_RETENTION_DAYS`` are pruned, except the one each
+dataset currently holds.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from .models import RawPayload
+
+logger = logging.getLogger(__name__)
+
+
+def payload_path(sha256):
+    return os.path.join(settings.PAYLOAD_ARCHIVE_DIR, sha256[:2], f"{sha256}.json.gz")
+
+
+def _write_blob(sha256, body):
+    path = payload_path(sha256)
+    if os.path.exists(path):
+        return  # Same content already archived, possibly for another dataset
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wb", compresslevel=6) as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def archive_payload(dataset, body, source=""):
+    """
+    Archive ``body`` for ``dataset``; return ``(RawPayload, unchanged)``.
+
+    ``unchanged`` is true when the body is the one the dataset last ingested.
+    Archive errors are logged and never fail the fetch: the payload is then
+    returned as ``None`` and treated as changed.
+    """
+    if not settings.PAYLOAD_ARCHIVE_ENABLED:
+        return None, False
+    try:
+        sha256 = hashlib.sha256(body).hexdigest()
+        now = timezone.now()
+        payload = RawPayload.objects.filter(dataset=dataset, sha256=sha256).first()
+        if payload is None:
+            _write_blob(sha256, body)
+            payload = RawPayload.objects.create(
+                dataset=dataset,
+                sha256=sha256,
+                size=len(body),
+                source=source[:500],
+                first_seen_at=now,
+                last_seen_at=now,
+            )
+            prune_archive()
+        else:
+            payload.last_seen_at = now
+            payload.fetch_count += 1
+            payload.save(update_fields=["last_seen_at", "fetch_count"])
+            if not os.path.exists(payload_path(sha256)):
+                _write_blob(sha256, body)
+        current = last_ingested(dataset)
+        return payload, current is not None and current.sha256 == sha256
+    except Exception:
+        logger.exception(f"Error archiving {dataset} payload")
+        return None, False
+
+
+def mark_ingested(payload):
+    """Record that ``payload`` is now the dataset's ingested version."""
+    if payload is None:
+        return
+    payload.ingested_at = timezone.now()
+    payload.save(update_fields=["ingested_at"])
+
+
+def last_ingested(dataset):
+    return (
+        RawPayload.objects.filter(dataset=dataset, ingested_at__isnull=False)
+        .order_by("-ingested_at")
+        .first()
+    )
+
+
+def load_payload(payload):
+    """The raw body of an archived payload."""
+    with gzip.open(payload_path(payload.sha256), "rb") as f:
+        return f.read()
+
+
+def prune_archive():
+    """Drop payloads not seen within the retention period and their files."""
+    cutoff = timezone.now() - timedelta(days=settings.PAYLOAD_ARCHIVE_RETENTION_DAYS)
+    current = RawPayload.objects.filter(ingested_at__isnull=False).values("dataset")
+    current = current.annotate(latest=Max("ingested_at"))
+    keep = set()
+    for row in current:
+        keep.update(
+            RawPayload.objects.filter(
+                dataset=row["dataset"], ingested_at=row["latest"]
+            ).values_list("pk", flat=True)
+        )
+    expired = RawPayload.objects.filter(last_seen_at__lt=cutoff).exclude(pk__in=keep)
+    hashes = set(expired.values_list("sha256", flat=True))
+    if not hashes:
+        return
+    expired.delete()
+    # Blobs are shared between datasets; only remove unreferenced ones
+    referenced = set(
+        RawPayload.objects.filter(sha256__in=hashes).values_list("sha256", flat=True)
+    )
+    for sha256 in hashes - referenced:
+        try:
+            os.remove(payload_path(sha256))
+        except FileNotFoundError:
+            pass
+    logger.info(f"Pruned {len(hashes - referenced)} archived payloads")
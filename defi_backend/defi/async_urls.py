@@ -0,0 +1,37 @@
+from django.urls import path
+from .async_views import (
+    fetch_yield_data,
+    get_yield_data,
+    fetch_governance_data,
+    get_governance_data,
+    fetch_risk_metrics,
+    get_risk_metrics,
+    get_risk_metric,
+    get_risk_metric_history,
+    fetch_on_chain_data,
+    get_on_chain_data,
+    fetch_risk_scores,
+    get_risk_scores,
+    fetch_technical_data,
+    get_technical_data,
+    export_dataset,
+)
+
+# Same routes as defi.urls, served by async views (deploy under ASGI)
+urlpatterns = [
+    path("fetch-yield/", fetch_yield_data),
+    path("yield-data/", get_yield_data),
+    path("fetch-governance/", fetch_governance_data),
+    path("governance-data/", get_governance_data),
+    path("fetch-risk/", fetch_risk_metrics),
+    path("risk-metrics/", get_risk_metrics),
+    path("risk-metrics/<str:slug>/", get_risk_metric),
+    path("risk-metrics/<str:slug>/history/", get_risk_metric_history),
+    path("fetch-on-chain/", fetch_on_chain_data),
+    path("on-chain-data/", get_on_chain_data),
+    path("fetch-risk-scores/", fetch_risk_scores),
+    path("risk-scores/", get_risk_scores),
+    path("fetch-technical/", fetch_technical_data),
+    path("technical-data/", get_technical_data),
+    path("export/<str:dataset>.<str:fmt>", export_dataset),
+]
@@ -0,0 +1,599 @@
+"""
+Async counterparts of the views in ``views.py``.
+
+Served through the ASGI entry point, these never park a worker thread on an
+upstream request: HTTP goes through the shared ``httpx`` client (rate limited
+per host by ``defi.upstream``) and reads use
+the async ORM and cache APIs, so one worker overlaps many in-flight requests.
+Writes still run through the shared ingest functions in a thread.
+"""
+
+import asyncio
+import logging
+import math
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .models import (
+    YieldData,
+    GovernanceProposal,
+    RiskMetric,
+    OnChainData,
+    ProtocolHistory,
+    RiskScore,
+    TechnicalData,
+)
+from .serializers import (
+    YieldDataSerializer,
+    GovernanceProposalSerializer,
+    RiskMetricSerializer,
+    OnChainDataSerializer,
+    RiskScoreSerializer,
+    TechnicalDataSerializer,
+)
+from .ingest import (
+    ingest_dataset,
+    ingest_yield_data,
+    ingest_governance_data,
+    ingest_on_chain_data,
+    ingest_technical_data,
+    refresh_cache,
+)
+from .instrumentation import timed
+from .projection import select_fields, project_rows, model_field_names
+from .export import (
+    EXPORT_DATASETS,
+    EXPORT_FORMATS,
+    COLUMNAR_FORMATS,
+    astream_export,
+    pyarrow,
+)
+from .archive import archive_payload, mark_ingested
+from .telemetry import async_ingest_run
+from .upstream import UpstreamError, afetch, upstream_url
+from .yield_index import parse_yield_query, yield_index
+from .views import (
+    StandardPagination,
+    GOVERNANCE_QUERY,
+    since_delta,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def render_json(data, **kwargs):
+    """JsonResponse whose encoding time is reported as the "render" stage."""
+    with timed("render"):
+        return JsonResponse(data, encoder=JSONEncoder, **kwargs)
+
+
+def upstream_unavailable(error):
+    """See ``views.upstream_unavailable``."""
+    response = JsonResponse({"error": str(error), "stale": True}, status=503)
+    response["Retry-After"] = str(math.ceil(error.retry_after))
+    return response
+
+
+def get_page_size(request):
+    """``StandardPagination.get_page_size`` for a plain Django request."""
+    try:
+        page_size = int(request.GET[StandardPagination.page_size_query_param])
+        if page_size <= 0:
+            raise ValueError
+        return min(page_size, StandardPagination.max_page_size)
+    except (KeyError, ValueError):
+        return StandardPagination.page_size
+
+
+async def paginate(request, queryset, extra=None):
+    """Async equivalent of ``StandardPagination``.
+
+    Accepts a ``.values()`` queryset or an already materialized sequence such
+    as a yield index selection; ``extra`` is added to the response body.
+    """
+    page_size = get_page_size(request)
+
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 0
+    if hasattr(queryset, "acount"):
+        count = await queryset.acount()
+    else:
+        count = len(queryset)
+    last_page = max(1, -(-count // page_size))
+    if page < 1 or page > last_page:
+        return JsonResponse({"detail": "Invalid page."}, status=404)
+
+    offset = (page - 1) * page_size
+    if hasattr(queryset, "acount"):
+        rows = [obj async for obj in queryset[offset : offset + page_size]]
+    else:
+        rows = queryset[offset : offset + page_size]
+    url = request.build_absolute_uri()
+    if page == 1:
+        previous_url = None
+    elif page == 2:
+        previous_url = remove_query_param(url, "page")
+    else:
+        previous_url = replace_query_param(url, "page", page - 1)
+    return render_json(
+        {
+            "count": count,
+            "next": (
+                replace_query_param(url, "page", page + 1) if page < last_page else None
+            ),
+            "previous": previous_url,
+            "results": rows,
+            **(extra or {}),
+        }
+    )
+
+
+async def since_response(request, dataset, rows, fields, cached_data=None):
+    """Async equivalent of ``views._since_response``."""
+    try:
+        data = await sync_to_async(since_delta)(
+            request.GET,
+            request.build_absolute_uri(),
+            dataset,
+            rows,
+            fields,
+            get_page_size(request),
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if not data["full"]:
+        return render_json(data)
+    if cached_data:
+        rows = project_rows(cached_data, fields)
+    else:
+        rows = rows.values(*fields)
+    return await paginate(request, rows, data)
+
+
+async def fetch_and_cache_data(url, model, serializer, cache_key):
+    async with async_ingest_run(cache_key) as run:
+        try:
+            with run.stage("download"):
+                response = await afetch(url)
+            run.downloaded(len(response.content))
+            if response.status_code == 200:
+                with run.stage("archive"):
+                    archived, unchanged = await sync_to_async(archive_payload)(
+                        cache_key, response.content, url
+                    )
+                if unchanged:
+                    run.skip_unchanged()
+                    await sync_to_async(refresh_cache)(cache_key, model, serializer)
+                    return True
+                with run.stage("parse"):
+                    payload = response.json()
+                if await sync_to_async(ingest_dataset)(
+                    payload, model, serializer, cache_key, run
+                ):
+                    await sync_to_async(mark_ingested)(archived)
+                    return True
+                return False
+            else:
+                logger.error(f"Failed to fetch data from {url}: {response.status_code}")
+                run.fail(f"HTTP {response.status_code}")
+                return False
+        except UpstreamError as e:
+            logger.warning(f"Not fetching {url}: {e}")
+            run.fail(e)
+            raise
+        except Exception as e:
+            logger.exception(f"Error fetching data from {url}")
+            run.fail(e)
+            return False
+
+
+# Yield Data Endpoints
+@require_GET
+async def fetch_yield_data(request):
+    """Fetch yield farming data from DeFiLlama API and update database."""
+    async with async_ingest_run("yield_data") as run:
+        try:
+            with run.stage("download"):
+                response = await afetch(upstream_url("pools"))
+            run.downloaded(len(response.content))
+            if response.status_code == 200:
+                with run.stage("archive"):
+                    archived, unchanged = await sync_to_async(archive_payload)(
+                        "yield_data", response.content, str(response.url)
+                    )
+                if unchanged:
+                    run.skip_unchanged()
+                    await sync_to_async(refresh_cache)(
+                        "yield_data", YieldData, YieldDataSerializer
+                    )
+                    return JsonResponse({"message": "Yield data unchanged"})
+                with run.stage("parse"):
+                    payload = response.json()
+                await sync_to_async(ingest_yield_data)(payload, run)
+                await sync_to_async(mark_ingested)(archived)
+                return JsonResponse({"message": "Yield data updated successfully!"})
+            else:
+                logger.error(f"Failed to fetch yield data: {response.status_code}")
+                run.fail(f"HTTP {response.status_code}")
+                return JsonResponse({"error": "Failed to fetch data"}, status=500)
+        except UpstreamError as e:
+            logger.warning(f"Not fetching yield data: {e}")
+            run.fail(e)
+            return upstream_unavailable(e)
+        except Exception as e:
+            logger.exception("Error fetching yield data")
+            run.fail(e)
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+@require_GET
+async def get_yield_data(request):
+    try:
+        fields = select_fields(YieldData, request.GET.get("fields"))
+        query = parse_yield_query(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    if "since" in request.GET:
+        rows = YieldData.objects.filter(**query.filter_kwargs()).order_by(
+            *query.order_by()
+        )
+        return await since_response(request, "yield_data", rows, fields)
+
+    index = await sync_to_async(yield_index.get)()
+    if index is not None and index.supports(query):
+        data = index.query(query, fields)
+    else:
+        data = (
+            YieldData.objects.filter(**query.filter_kwargs())
+            .order_by(*query.order_by())
+            .values(*fields)
+        )
+    return await paginate(request, data)
+
+
+# Governance Data Endpoints
+@require_GET
+async def fetch_governance_data(request):
+    """Fetch governance data from Snapshot API."""
+    async with async_ingest_run("governance_data") as run:
+        try:
+            with run.stage("download"):
+                response = await afetch(
+                    upstream_url("snapshot_proposals"),
+                    "POST",
+                    json={"query": GOVERNANCE_QUERY},
+                )
+            run.downloaded(len(response.content))
+            if response.status_code == 200:
+                with run.stage("archive"):
+                    archived, unchanged = await sync_to_async(archive_payload)(
+                        "governance_data", response.content, str(response.url)
+                    )
+                if unchanged:
+                    run.skip_unchanged()
+                    await sync_to_async(refresh_cache)(
+                        "governance_data",
+                        GovernanceProposal,
+                        GovernanceProposalSerializer,
+                    )
+                    return JsonResponse({"message": "Governance data unchanged"})
+                with run.stage("parse"):
+                    payload = response.json()
+                await sync_to_async(ingest_governance_data)(payload, run)
+                await sync_to_async(mark_ingested)(archived)
+                return JsonResponse(
+                    {"message": "Governance data updated successfully!"}
+                )
+            else:
+                logger.error(f"Failed to fetch governance data: {response.status_code}")
+                run.fail(f"HTTP {response.status_code}")
+                return JsonResponse({"error": "Failed to fetch data"}, status=500)
+        except UpstreamError as e:
+            logger.warning(f"Not fetching governance data: {e}")
+            run.fail(e)
+            return upstream_unavailable(e)
+        except Exception as e:
+            logger.exception("Error fetching governance data")
+            run.fail(e)
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+@require_GET
+async def get_governance_data(request):
+    try:
+        fields = select_fields(GovernanceProposal, request.GET.get("fields"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    cached_data = await cache.aget("governance_data")
+    if "since" in request.GET:
+        rows = GovernanceProposal.objects.order_by("-created_at")
+        return await since_response(
+            request, "governance_data", rows, fields, cached_data
+        )
+    if cached_data:
+        return render_json(project_rows(cached_data, fields), safe=False)
+
+    data = GovernanceProposal.objects.order_by("-created_at").values(*fields)
+    return await paginate(request, data)
+
+
+# Risk Metrics Endpoints
+@require_GET
+async def fetch_risk_metrics(request):
+    try:
+        fetched = await fetch_and_cache_data(
+            upstream_url("protocols"), RiskMetric, RiskMetricSerializer, "risk_metrics"
+        )
+    except UpstreamError as e:
+        return upstream_unavailable(e)
+    if fetched:
+        return JsonResponse({"message": "Risk metrics updated successfully!"})
+    else:
+        return JsonResponse({"error": "Failed to fetch data"}, status=500)
+
+
+@require_GET
+async def get_risk_metrics(request):
+    try:
+        fields = select_fields(RiskMetric, request.GET.get("fields"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    cached_data = await cache.aget("risk_metrics")
+    if "since" in request.GET:
+        rows = RiskMetric.objects.order_by("-mcap")
+        return await since_response(request, "risk_metrics", rows, fields, cached_data)
+    if cached_data:
+        return render_json(project_rows(cached_data, fields), safe=False)
+
+    # Default ordering field
+    ordering_field = request.GET.get("ordering", "-mcap")
+
+    # Validate that the ordering field exists in the model
+    valid_fields = [f.name for f in RiskMetric._meta.get_fields()]
+    if ordering_field.lstrip("-") not in valid_fields:
+        return JsonResponse(
+            {"error": f"Invalid ordering field: {ordering_field}"}, status=400
+        )
+
+    data = RiskMetric.objects.order_by(ordering_field).values(*fields)
+    return await paginate(request, data)
+
+
+@require_GET
+async def get_risk_metric(request, slug):
+    data = await RiskMetric.objects.filter(slug=slug).afirst()
+    if data is None:
+        return JsonResponse({"error": "Protocol not found"}, status=404)
+    with timed("serialize"):
+        data = RiskMetricSerializer(data).data
+    return render_json(data)
+
+
+@require_GET
+async def get_risk_metric_history(request, slug):
+    """Async equivalent of ``views.get_risk_metric_history``."""
+    history = ProtocolHistory.objects.filter(protocol=slug).order_by("date")
+    for param, lookup in (("start", "date__gte"), ("end", "date__lt")):
+        if param in request.GET:
+            day = parse_date(request.GET[param])
+            if day is None:
+                return JsonResponse({"error": f"{param} must be a date"}, status=400)
+            history = history.filter(**{lookup: day})
+    rows = [row async for row in history.values_list("date", "tvl", "mcap")]
+    if not rows:
+        return JsonResponse({"error": "No history for this protocol"}, status=404)
+    dates, tvl, mcap = zip(*rows)
+    return render_json(
+        {
+            "slug": slug,
+            "dates": [day.isoformat() for day in dates],
+            "tvl": tvl,
+            "mcap": mcap,
+        }
+    )
+
+
+# On-Chain Data Endpoints
+async def _get_json(label, url, run, unavailable, **kwargs):
+    """
+    Decoded JSON at ``url``, or None; errors of throttled or down hosts are
+    appended to ``unavailable``.
+    """
+    try:
+        response = await afetch(url, **kwargs)
+        run.downloaded(len(response.content))
+        if response.status_code == 200:
+            with run.stage("parse"):
+                return response.json()
+    except UpstreamError as e:
+        logger.warning(f"{label} data not fetched: {e}")
+        unavailable.append(e)
+    except Exception as e:
+        logger.error(f"{label} data fetch failed: {e}")
+    return None
+
+
+@require_GET
+async def fetch_on_chain_data(request):
+    async with async_ingest_run("on_chain_data") as run:
+        # Both upstreams are independent, so fetch them concurrently
+        unavailable = []
+        with run.stage("download"):
+            tvl, market = await asyncio.gather(
+                _get_json("TVL", upstream_url("charts"), run, unavailable),
+                _get_json(
+                    "CoinGecko",
+                    upstream_url("coingecko_defi"),
+                    run,
+                    unavailable,
+                    headers={"x-cg-api-key": settings.COINGECKO_API_KEY},
+                ),
+            )
+        data = {}
+        if tvl is not None:
+            data["tvl"] = tvl
+        if market is not None:
+            data["market"] = market
+
+        if not data:
+            run.fail("All data fetches failed")
+            if unavailable:
+                return upstream_unavailable(unavailable[0])
+            return JsonResponse({"error": "All data fetches failed"}, status=500)
+
+        try:
+            await sync_to_async(ingest_on_chain_data)(data, run)
+            if unavailable:
+                return JsonResponse(
+                    {
+                        "message": "On-chain data partially updated",
+                        "error": str(unavailable[0]),
+                        "stale": True,
+                    }
+                )
+            return JsonResponse({"message": "On-chain data updated successfully!"})
+        except Exception as e:
+            logger.exception("Error saving on-chain data")
+            run.fail(e)
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+@require_GET
+async def get_on_chain_data(request):
+    cached_data = await cache.aget("on_chain_data")
+    if cached_data:
+        return render_json(cached_data, safe=False)
+
+    data = await OnChainData.objects.afirst()
+    with timed("serialize"):
+        data = OnChainDataSerializer(data).data
+    return render_json(data)
+
+
+# Risk Scores Endpoints
+@require_GET
+async def fetch_risk_scores(request):
+    try:
+        fetched = await fetch_and_cache_data(
+            upstream_url("protocols"), RiskScore, RiskScoreSerializer, "risk_scores"
+        )
+    except UpstreamError as e:
+        return upstream_unavailable(e)
+    if fetched:
+        return JsonResponse({"message": "Risk scores updated successfully!"})
+    else:
+        return JsonResponse({"error": "Failed to fetch data"}, status=500)
+
+
+@require_GET
+async def get_risk_scores(request):
+    try:
+        fields = select_fields(RiskScore, request.GET.get("fields"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    cached_data = await cache.aget("risk_scores")
+    if "since" in request.GET:
+        rows = RiskScore.objects.order_by("-risk_score")
+        return await since_response(request, "risk_scores", rows, fields, cached_data)
+    if cached_data:
+        return render_json(project_rows(cached_data, fields), safe=False)
+
+    data = RiskScore.objects.order_by("-risk_score").values(*fields)
+    return await paginate(request, data)
+
+
+# Technical Data Endpoints
+async def _get_payload(name, run):
+    """(decoded payload, None), or (None, error) if its host is unavailable."""
+    try:
+        response = await afetch(upstream_url(name))
+    except UpstreamError as e:
+        logger.warning(f"Technical data source {name} not fetched: {e}")
+        return None, e
+    run.downloaded(len(response.content))
+    with run.stage("parse"):
+        return response.json(), None
+
+
+@require_GET
+async def fetch_technical_data(request):
+    async with async_ingest_run("technical_data") as run:
+        try:
+            with run.stage("download"):
+                (price_data, price_error), (protocol_data, protocol_error) = (
+                    await asyncio.gather(
+                        _get_payload("coingecko_price", run),
+                        _get_payload("protocols", run),
+                    )
+                )
+            # A source that is throttled or down keeps its last good data
+            unavailable = price_error or protocol_error
+            if price_error and protocol_error:
+                run.fail(unavailable)
+                return upstream_unavailable(unavailable)
+            await sync_to_async(ingest_technical_data)(protocol_data, price_data, run)
+            if unavailable:
+                return JsonResponse(
+                    {
+                        "message": "Technical data partially updated",
+                        "error": str(unavailable),
+                        "stale": True,
+                    }
+                )
+            return JsonResponse({"message": "Technical data updated successfully!"})
+        except Exception as e:
+            logger.exception("Error fetching technical data")
+            run.fail(e)
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+@require_GET
+async def get_technical_data(request):
+    cached_data = await cache.aget("technical_data")
+    if cached_data:
+        return render_json(cached_data, safe=False)
+
+    data = await TechnicalData.objects.afirst()
+    with timed("serialize"):
+        data = TechnicalDataSerializer(data).data
+    return render_json(data)
+
+
+# Bulk Export Endpoints
+@require_GET
+async def export_dataset(request, dataset, fmt):
+    """Async equivalent of ``views.export_dataset``."""
+    model = EXPORT_DATASETS.get(dataset)
+    if model is None:
+        return JsonResponse({"error": f"Unknown dataset: {dataset}"}, status=404)
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({"error": f"Unsupported format: {fmt}"}, status=400)
+    if fmt in COLUMNAR_FORMATS and pyarrow is None:
+        return JsonResponse(
+            {"error": f"{fmt} export requires pyarrow to be installed"}, status=501
+        )
+
+    requested = request.GET.get("fields")
+    try:
+        fields = (
+            select_fields(model, requested) if requested else model_field_names(model)
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        astream_export(model, fields, fmt), content_type=EXPORT_FORMATS[fmt]
+    )
+    response["Content-Disposition"] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
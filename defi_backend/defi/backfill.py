@@ -0,0 +1,382 @@
+"""
+Resumable backfill of daily history from per-key upstream endpoints.
+
+A ``Backfill`` names a job, the keys it covers (every pool, say), the URL
+holding one key's history and how to turn that payload into history rows.
+``run_backfill`` fetches the keys with at most ``concurrency`` requests in
+flight through its own ``defi.upstream.UpstreamClient`` allowing ``rate``
+requests a second per host, which retries timeouts, 429s and 5xx responses
+with backoff and honours ``Retry-After``; a key it gives up on is failed.
+
+One writer bulk-inserts the parsed rows ``BACKFILL_BATCH_SIZE`` keys at a
+time and checkpoints those keys in ``BackfillCheckpoint`` in the same
+transaction, so an interrupted run resumes with exactly the keys whose rows
+were not stored. Keys that kept failing are checkpointed as failed and tried
+again by the next run.
+
+Incremental jobs fetch every key on each run instead and only keep the days
+after the last one checkpointed for it, so after the first (full) run they
+tail the upstream history.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+from .correlations import refresh_correlations
+from .history import HISTORY_SOURCES, clear_window_cache
+from .models import BackfillCheckpoint, RiskMetric, YieldData
+from .upstream import UpstreamClient, UpstreamError, upstream_url
+
+logger = logging.getLogger(__name__)
+
+EPOCH = date(1970, 1, 1)
+
+
+class BackfillError(Exception):
+    """A key's history could not be fetched."""
+
+
+class Backfill:
+    job = None
+    dataset = None  # defi.history.HISTORY_SOURCES entry the history goes to
+    incremental = False  # Refetch done keys for the days after their last one
+    default_days = None  # BACKFILL_DAYS
+
+    def __init__(self, days=None):
+        # Days of history kept, ending yesterday: today's row is the live
+        # ingest's (see defi.history.record_daily_history)
+        if days is None:
+            days = self.default_days
+        if days is None:
+            days = settings.BACKFILL_DAYS
+        self.end = timezone.now().date()
+        self.start = self.end - timedelta(days=days) if days else date.min
+        self.model, key_field, _, fields = HISTORY_SOURCES[self.dataset]
+        self.columns = (key_field, "date") + fields
+        self.through = {}  # Key -> last day stored, from the checkpoints
+
+    def keys(self):
+        raise NotImplementedError
+
+    def url(self, key):
+        raise NotImplementedError
+
+    def parse(self, key, payload):
+        """
+        History of ``key`` in ``payload``: one tuple per day in range, in
+        ``columns`` order with the date as an ISO string.
+        """
+        raise NotImplementedError
+
+    def first_day(self, key):
+        """First day of ``key``'s history this run keeps."""
+        through = self.through.get(key)
+        if through is None or through < self.start:
+            return self.start
+        return through + timedelta(days=1)
+
+    def store(self, rows):
+        """Insert rows, keeping days already recorded (live or by a past run)."""
+        self.model.objects.bulk_create(
+            [self.model(**dict(zip(self.columns, row))) for row in rows],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+    def finish(self):
+        clear_window_cache(self.dataset)
+
+
+class YieldHistoryBackfill(Backfill):
+    """Daily TVL and APY of every published pool from /chart/{pool}."""
+
+    job = "yield_history"
+    dataset = "yield_data"
+
+    def keys(self):
+        return list(YieldData.objects.order_by("pool").values_list("pool", flat=True))
+
+    def url(self, key):
+        return upstream_url("pool_chart", key)
+
+    def parse(self, key, payload):
+        start, days = self.first_day(key), {}
+        for point in payload.get("data") or []:
+            try:
+                day = date.fromisoformat(str(point["timestamp"])[:10])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if start <= day < self.end:
+                # Charts can hold several points a day; the last one wins
+                days[day] = point
+        return [
+            (
+                key,
+                day.isoformat(),
+                _float(point.get("tvlUsd")),
+                _float(point.get("apy")),
+                _float(point.get("apyBase")),
+            )
+            for day, point in sorted(days.items())
+        ]
+
+
+class ProtocolHistoryBackfill(Backfill):
+    """
+    Daily TVL of every protocol from /protocol/{slug}: its full history on
+    the first run, the days after the last one stored on later runs.
+    """
+
+    job = "protocol_history"
+    dataset = "risk_metrics"
+    incremental = True
+    default_days = 0  # All of it
+
+    def keys(self):
+        return list(
+            RiskMetric.objects.exclude(slug=None)
+            .exclude(slug="")
+            .order_by("slug")
+            .values_list("slug", flat=True)
+            .distinct()
+        )
+
+    def url(self, key):
+        return upstream_url("protocol", key)
+
+    def parse(self, key, payload):
+        start, days = self.first_day(key), {}
+        for point in payload.get("tvl") or []:
+            try:
+                # Unix seconds; the UTC day is a whole number of days in
+                day = EPOCH + timedelta(days=int(point["date"]) // 86400)
+            except (KeyError, TypeError, ValueError, OverflowError):
+                continue
+            if start <= day < self.end:
+                days[day] = point
+        # /protocol only has the current market cap, not its history
+        return [
+            (key, day.isoformat(), _float(point.get("totalLiquidityUSD")), None)
+            for day, point in sorted(days.items())
+        ]
+
+    def finish(self):
+        super().finish()
+        refresh_correlations()
+
+
+BACKFILLS = {
+    backfill.job: backfill
+    for backfill in (YieldHistoryBackfill, ProtocolHistoryBackfill)
+}
+
+
+def _float(value):
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class BackfillStats:
+    def __init__(self, keys, client):
+        self.keys = keys
+        self.done = 0
+        self.failed = 0
+        self.rows = 0
+        self.client = client
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def requests(self):
+        return self.client.totals()["requests"]
+
+    @property
+    def retries(self):
+        return self.client.totals()["retries"]
+
+    @property
+    def throttled(self):
+        return self.client.totals()["throttled"]
+
+    @property
+    def waited(self):
+        """Seconds spent waiting on the rate limiter."""
+        return self.client.totals()["throttle_wait_seconds"]
+
+    def as_dict(self):
+        return {
+            "keys": self.keys,
+            "done": self.done,
+            "failed": self.failed,
+            "rows": self.rows,
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "throttle_wait_seconds": round(self.waited, 2),
+            "seconds": round(self.elapsed, 2),
+        }
+
+
+async def _fetch(upstream, http, url):
+    """
+    Decoded JSON at ``url``. The client is the only retry layer: what it
+    gives up on (including requests an open breaker skips) fails the key.
+    """
+    try:
+        response = await upstream.afetch(url, client=http)
+    except UpstreamError as e:
+        raise BackfillError(str(e))
+    if response.status_code != 200:
+        raise BackfillError(f"HTTP {response.status_code}")
+    try:
+        return response.json()
+    except ValueError as e:
+        raise BackfillError(f"{type(e).__name__}: {e}")
+
+
+def _checkpoint(backfill, key, rows, error):
+    rows = rows or ()
+    return BackfillCheckpoint(
+        job=backfill.job,
+        key=key,
+        status="failed" if error else "done",
+        rows=len(rows),
+        # Rows are in date order; a key with no new days keeps its last one
+        through=(
+            date.fromisoformat(rows[-1][1]) if rows else backfill.through.get(key)
+        ),
+        error=error or "",
+        updated_at=timezone.now(),
+    )
+
+
+def _write(backfill, results):
+    """Store a batch of (key, rows, error) and checkpoint its keys."""
+    rows = [row for _, key_rows, _ in results for row in key_rows or ()]
+    checkpoints = [_checkpoint(backfill, *result) for result in results]
+    with transaction.atomic(using="default"):
+        backfill.store(rows)
+        BackfillCheckpoint.objects.bulk_create(
+            checkpoints,
+            update_conflicts=True,
+            unique_fields=["job", "key"],
+            update_fields=["status", "rows", "through", "error", "updated_at"],
+        )
+
+
+async def _run(backfill, keys, concurrency, stats, progress):
+    queue = asyncio.Queue()
+    for key in keys:
+        queue.put_nowait(key)
+    # Bounded, so fetching pauses while the writer catches up
+    results = asyncio.Queue(maxsize=concurrency * 4)
+    write = sync_to_async(_write)
+
+    async def worker(client):
+        while True:
+            try:
+                key = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                payload = await _fetch(stats.client, client, backfill.url(key))
+                await results.put((key, backfill.parse(key, payload), None))
+            except BackfillError as e:
+                await results.put((key, None, str(e)))
+            except Exception as e:
+                logger.exception(f"Error backfilling {backfill.job} {key}")
+                await results.put((key, None, f"{type(e).__name__}: {e}"))
+
+    async def writer():
+        batch = []
+        while True:
+            result = await results.get()
+            if result is not None:
+                batch.append(result)
+            if batch and (result is None or len(batch) >= settings.BACKFILL_BATCH_SIZE):
+                await write(backfill, batch)
+                for _, rows, error in batch:
+                    if error is None:
+                        stats.done += 1
+                        stats.rows += len(rows)
+                    else:
+                        stats.failed += 1
+                batch = []
+                if progress:
+                    progress(stats)
+            if result is None:
+                return
+
+    async def fetch_all(client):
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        await results.put(None)
+
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(
+        timeout=settings.UPSTREAM_TIMEOUT, limits=limits
+    ) as client:
+        fetching = asyncio.ensure_future(fetch_all(client))
+        try:
+            await writer()
+        finally:
+            # A failed write stops the run (its keys stay unchecked); stop
+            # fetching before the client closes
+            fetching.cancel()
+            await asyncio.gather(fetching, return_exceptions=True)
+
+
+def run_backfill(
+    backfill, concurrency=None, rate=None, restart=False, keys=None, progress=None
+):
+    """
+    Fetch and store the history of every key not checkpointed as done (every
+    key for incremental jobs, from scratch with ``restart``) and return the
+    run's BackfillStats.
+    """
+    if settings.BACKFILL_MAX_ATTEMPTS < 1:
+        raise ImproperlyConfigured("BACKFILL_MAX_ATTEMPTS must be at least 1")
+    concurrency = concurrency or settings.BACKFILL_CONCURRENCY
+    rate = settings.BACKFILL_RATE if rate is None else rate
+    checkpoints = BackfillCheckpoint.objects.using("default").filter(job=backfill.job)
+    if restart:
+        checkpoints.delete()
+    backfill.through = dict(
+        checkpoints.exclude(through=None).values_list("key", "through")
+    )
+    done = set()
+    if not backfill.incremental:
+        done.update(checkpoints.filter(status="done").values_list("key", flat=True))
+    if keys is None:
+        keys = backfill.keys()
+    pending = [key for key in keys if key not in done]
+    client = UpstreamClient(
+        default_rate=rate,
+        default_burst=concurrency,
+        attempts=settings.BACKFILL_MAX_ATTEMPTS,
+        backoff=settings.BACKFILL_BACKOFF,
+    )
+    stats = BackfillStats(len(pending), client)
+    logger.info(f"Backfilling {backfill.job}: {len(pending)} keys, {len(done)} done")
+    try:
+        if pending:
+            asyncio.run(_run(backfill, pending, concurrency, stats, progress))
+    finally:
+        # Even a partial run changed the history behind cached windows
+        if stats.rows:
+            backfill.finish()
+    logger.info(f"Backfilled {backfill.job}: {stats.as_dict()}")
+    return stats
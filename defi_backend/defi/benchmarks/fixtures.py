@@ -0,0 +1,291 @@
+"""
+Upstream payload fixtures for benchmarks and offline runs.
+
+``manage.py record_fixtures`` saves real responses from DeFiLlama, CoinGecko
+and Snapshot as gzipped JSON in ``BENCHMARK_FIXTURE_DIR``. When a recording
+is missing, a deterministic synthetic payload with the same shape and
+realistic sizes (20k pools, 3k protocols) is generated instead, so results
+stay comparable between commits on machines without network access.
+"""
+
+import gzip
+import json
+import os
+import random
+import uuid
+from datetime import datetime, time, timedelta, timezone
+from django.conf import settings
+
+CHAINS = (
+    "Ethereum",
+    "Arbitrum",
+    "Base",
+    "BSC",
+    "Polygon",
+    "Optimism",
+    "Solana",
+    "Avalanche",
+    "Tron",
+    "Sui",
+)
+CATEGORIES = ("Dexes", "Lending", "Liquid Staking", "CDP", "Yield", "Bridge", "RWA")
+STABLE_SYMBOLS = ("USDC", "USDT", "DAI", "FRAX", "USDE", "PYUSD")
+VOLATILE_SYMBOLS = ("WETH", "WBTC", "SOL", "ARB", "OP", "AVAX", "LINK", "UNI")
+
+
+def _address(rng):
+    return "0x" + "".join(rng.choice("0123456789abcdef") for _ in range(40))
+
+
+def _maybe(rng, value, probability=0.8):
+    return value if rng.random() < probability else None
+
+
+def synthetic_pools(count=20000, seed=0):
+    rng = random.Random(seed)
+    projects = [f"project-{i}" for i in range(600)]
+    pools = []
+    for _ in range(count):
+        stable = rng.random() < 0.3
+        tokens = rng.sample(STABLE_SYMBOLS if stable else VOLATILE_SYMBOLS, 2)
+        # YieldData.apyBase is NOT NULL, so unlike live data it is always set
+        apy_base = rng.lognormvariate(1, 1.2)
+        apy_reward = _maybe(rng, rng.lognormvariate(0.5, 1.5), 0.4)
+        pools.append(
+            {
+                "chain": rng.choice(CHAINS),
+                "project": rng.choice(projects),
+                "symbol": "-".join(tokens),
+                "tvlUsd": rng.lognormvariate(12, 2.5),
+                "apyBase": apy_base,
+                "apyReward": apy_reward,
+                "apy": apy_base + (apy_reward or 0),
+                "rewardTokens": (
+                    [_address(rng) for _ in range(rng.randint(1, 2))]
+                    if apy_reward
+                    else None
+                ),
+                "pool": str(uuid.UUID(int=rng.getrandbits(128))),
+                "apyPct1D": _maybe(rng, rng.gauss(0, 1)),
+                "apyPct7D": _maybe(rng, rng.gauss(0, 3)),
+                "apyPct30D": _maybe(rng, rng.gauss(0, 6)),
+                "stablecoin": stable,
+                "ilRisk": "no" if stable else "yes",
+                "exposure": rng.choice(("single", "multi")),
+                "predictions": {
+                    "predictedClass": rng.choice(("Stable/Up", "Down")),
+                    "predictedProbability": rng.randint(50, 99),
+                    "binnedConfidence": rng.randint(1, 3),
+                },
+                "poolMeta": _maybe(rng, f"{rng.randint(1, 52)} weeks lock", 0.2),
+                "mu": rng.lognormvariate(1, 1),
+                "sigma": rng.uniform(0, 2),
+                "count": rng.randint(1, 1500),
+                "outlier": rng.random() < 0.02,
+                "underlyingTokens": [_address(rng) for _ in tokens],
+                "il7d": _maybe(rng, rng.uniform(0, 1), 0.2),
+                "apyBase7d": _maybe(rng, rng.lognormvariate(1, 1), 0.3),
+                "apyMean30d": rng.lognormvariate(1, 1),
+                "volumeUsd1d": _maybe(rng, rng.lognormvariate(11, 2), 0.3),
+                "volumeUsd7d": _maybe(rng, rng.lognormvariate(13, 2), 0.3),
+                "apyBaseInception": _maybe(rng, rng.lognormvariate(1, 1), 0.1),
+            }
+        )
+    return {"status": "success", "data": pools}
+
+
+def synthetic_protocols(count=3000, seed=1):
+    rng = random.Random(seed)
+    protocols = []
+    for i in range(count):
+        chains = rng.sample(CHAINS, rng.randint(1, 6))
+        chain_tvls = {}
+        for chain in chains:
+            tvl = rng.lognormvariate(14, 2.5)
+            chain_tvls[chain] = tvl
+            if rng.random() < 0.3:
+                chain_tvls[f"{chain}-borrowed"] = tvl * rng.uniform(0.1, 0.8)
+            if rng.random() < 0.2:
+                chain_tvls[f"{chain}-staking"] = tvl * rng.uniform(0.01, 0.3)
+        tvl = sum(v for k, v in chain_tvls.items() if "-" not in k)
+        name = f"Protocol {i}"
+        protocols.append(
+            {
+                "id": str(i),
+                "name": name,
+                "address": _maybe(rng, _address(rng), 0.5),
+                "symbol": f"P{i}",
+                "url": f"https://protocol{i}.example.org",
+                "description": " ".join(
+                    rng.choice(("lending", "yield", "vault", "swap", "stable"))
+                    for _ in range(rng.randint(20, 60))
+                ),
+                "chain": chains[0] if len(chains) == 1 else "Multi-Chain",
+                "logo": f"https://icons.llama.fi/protocol-{i}.png",
+                "audits": str(rng.randint(0, 3)),
+                "audit_note": None,
+                "gecko_id": _maybe(rng, f"protocol-{i}", 0.4),
+                "cmcId": _maybe(rng, str(rng.randint(1000, 30000)), 0.3),
+                "category": rng.choice(CATEGORIES),
+                "chains": chains,
+                "module": f"protocol-{i}/index.js",
+                "twitter": f"protocol{i}",
+                "oracles": rng.sample(("Chainlink", "Pyth", "RedStone"), 1),
+                "forkedFrom": [],
+                "listedAt": 1600000000 + rng.randint(0, 10**8),
+                "slug": f"protocol-{i}",
+                "tvl": tvl,
+                "chainTvls": chain_tvls,
+                "change_1h": _maybe(rng, rng.gauss(0, 0.5)),
+                "change_1d": _maybe(rng, rng.gauss(0, 3)),
+                "change_7d": _maybe(rng, rng.gauss(0, 8)),
+                "tokenBreakdowns": {},
+                "mcap": _maybe(rng, tvl * rng.uniform(0.1, 3), 0.5),
+                "hallmarks": [
+                    [1600000000 + rng.randint(0, 10**8), "Launch on new chain"]
+                    for _ in range(rng.randint(0, 3))
+                ],
+            }
+        )
+    return protocols
+
+
+def synthetic_charts(days=2000, seed=2):
+    rng = random.Random(seed)
+    tvl = 1e9
+    points = []
+    for day in range(days):
+        tvl *= 1 + rng.gauss(0.001, 0.03)
+        points.append({"date": str(1530000000 + day * 86400), "totalLiquidityUSD": tvl})
+    return points
+
+
+def synthetic_coingecko_defi(seed=3):
+    rng = random.Random(seed)
+    return {
+        "data": {
+            "defi_market_cap": f"{rng.uniform(5e10, 2e11):.2f}",
+            "eth_market_cap": f"{rng.uniform(2e11, 5e11):.2f}",
+            "defi_to_eth_ratio": f"{rng.uniform(10, 50):.4f}",
+            "trading_volume_24h": f"{rng.uniform(2e9, 2e10):.2f}",
+            "defi_dominance": f"{rng.uniform(2, 6):.4f}",
+            "top_coin_name": "Lido Staked Ether",
+            "top_coin_defi_dominance": rng.uniform(10, 30),
+        }
+    }
+
+
+def synthetic_coingecko_price(seed=4):
+    rng = random.Random(seed)
+    return {"ethereum": {"usd": rng.uniform(1500, 4500), "usd_24h_vol": 1.5e10}}
+
+
+def synthetic_snapshot_proposals(seed=5):
+    rng = random.Random(seed)
+    return {
+        "data": {
+            "proposals": [
+                {
+                    "id": "0x" + "%064x" % rng.getrandbits(256),
+                    "title": f"[ARFC] Proposal {i}",
+                    "state": rng.choice(("closed", "active")),
+                    "space": {
+                        "id": rng.choice(("aave.eth", "compound-governance.eth"))
+                    },
+                }
+                for i in range(10)
+            ]
+        }
+    }
+
+
+def synthetic_pool_chart(key, days=800, seed=6):
+    """Daily chart of one pool up to yesterday, as served by /chart/{pool}."""
+    rng = random.Random(f"{seed}:{key}")
+    tvl = 10 ** rng.uniform(3, 8)
+    apy = rng.uniform(0.5, 20)
+    end = datetime.combine(datetime.now(timezone.utc).date(), time(), timezone.utc)
+    points = []
+    for day in range(rng.randint(days // 10, days), 0, -1):
+        tvl *= 1 + rng.gauss(0.001, 0.04)
+        apy = max(0.0, apy * (1 + rng.gauss(0, 0.05)))
+        points.append(
+            {
+                "timestamp": (end - timedelta(days=day))
+                .isoformat(timespec="milliseconds")
+                .replace("+00:00", "Z"),
+                "tvlUsd": round(tvl),
+                "apy": apy,
+                "apyBase": _maybe(rng, apy * 0.7),
+                "apyReward": None,
+                "il7d": None,
+                "apyBase7d": None,
+            }
+        )
+    return {"status": "success", "data": points}
+
+
+def synthetic_protocol(key, days=2000, seed=7):
+    """One protocol's TVL history up to now, as served by /protocol/{slug}."""
+    rng = random.Random(f"{seed}:{key}")
+    tvl = 10 ** rng.uniform(5, 10)
+    now = int(datetime.now(timezone.utc).timestamp())
+    today = now - now % 86400
+    points = []
+    for day in range(rng.randint(days // 10, days), 0, -1):
+        tvl *= 1 + rng.gauss(0.001, 0.03)
+        points.append({"date": today - day * 86400, "totalLiquidityUSD": tvl})
+    # DeFiLlama ends the daily series with the current value
+    points.append({"date": now, "totalLiquidityUSD": tvl})
+    return {
+        "id": str(rng.randint(1, 10**5)),
+        "name": key.replace("-", " ").title(),
+        "slug": key,
+        "tvl": points,
+        "chainTvls": {"Ethereum": {"tvl": points}},
+        "currentChainTvls": {"Ethereum": tvl},
+        "mcap": _maybe(rng, tvl * rng.uniform(0.1, 3), 0.5),
+    }
+
+
+# Fixture name (see defi.upstream.UPSTREAM_ENDPOINTS) -> synthetic generator
+FIXTURES = {
+    "pools": synthetic_pools,
+    "protocols": synthetic_protocols,
+    "charts": synthetic_charts,
+    "coingecko_defi": synthetic_coingecko_defi,
+    "coingecko_price": synthetic_coingecko_price,
+    "snapshot_proposals": synthetic_snapshot_proposals,
+}
+
+# Per-key endpoints -> synthetic generator taking the key; recordings of
+# these are served for every key
+KEYED_FIXTURES = {
+    "pool_chart": synthetic_pool_chart,
+    "protocol": synthetic_protocol,
+}
+
+
+def fixture_path(name):
+    return os.path.join(settings.BENCHMARK_FIXTURE_DIR, f"{name}.json.gz")
+
+
+def load_fixture_bytes(name, key=None):
+    """Raw JSON body of a fixture: the recording if present, else synthetic."""
+    path = fixture_path(name)
+    if os.path.exists(path):
+        with gzip.open(path, "rb") as f:
+            return f.read()
+    if key is not None:
+        return json.dumps(KEYED_FIXTURES[name](key)).encode()
+    return json.dumps(FIXTURES[name]()).encode()
+
+
+def fixture_source(name):
+    return "recorded" if os.path.exists(fixture_path(name)) else "synthetic"
+
+
+def save_fixture_bytes(name, body):
+    os.makedirs(settings.BENCHMARK_FIXTURE_DIR, exist_ok=True)
+    with gzip.open(fixture_path(name), "wb") as f:
+        f.write(body)
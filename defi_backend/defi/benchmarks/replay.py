@@ -0,0 +1,225 @@
+"""
+Local stand-in for the upstream APIs, serving benchmark fixtures.
+
+Requests are routed by path suffix (see ``defi.upstream.UPSTREAM_ENDPOINTS``),
+so a single server can replace DeFiLlama, CoinGecko and Snapshot at once.
+Per-key endpoints such as ``/chart/{key}`` and ``/protocol/{key}`` get a synthetic payload generated
+from the key, so history backfills can run against it too.
+Each request can be delayed, throttled to a bandwidth limit, answered with a
+429 or 5xx, or have its body cut short, with configurable probabilities, to
+reproduce the upstream conditions ingestion sees in production.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+from defi.upstream import UPSTREAM_ENDPOINTS
+from .fixtures import FIXTURES, KEYED_FIXTURES, load_fixture_bytes
+
+CHUNK_SIZE = 64 * 1024
+
+
+def add_fault_arguments(parser):
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Mean time to first byte, ms"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Latency standard deviation, ms"
+    )
+    parser.add_argument(
+        "--bandwidth", type=float, default=0.0, help="KiB/s per response, 0 = no limit"
+    )
+    parser.add_argument(
+        "--error-429", type=float, default=0.0, help="Fraction answered with 429"
+    )
+    parser.add_argument(
+        "--retry-after", type=int, default=1, help="Retry-After sent with 429s, s"
+    )
+    parser.add_argument(
+        "--error-5xx", type=float, default=0.0, help="Fraction answered with 5xx"
+    )
+    parser.add_argument(
+        "--truncate", type=float, default=0.0, help="Fraction with truncated bodies"
+    )
+    parser.add_argument("--seed", type=int, help="Seed for reproducible faults")
+
+
+class FaultProfile:
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        bandwidth=0.0,
+        error_429=0.0,
+        retry_after=1,
+        error_5xx=0.0,
+        truncate=0.0,
+        seed=None,
+    ):
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.bandwidth = bandwidth * 1024
+        self.error_429 = error_429
+        self.retry_after = retry_after
+        self.error_5xx = error_5xx
+        self.truncate = truncate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(
+            latency=options["latency"],
+            jitter=options["jitter"],
+            bandwidth=options["bandwidth"],
+            error_429=options["error_429"],
+            retry_after=options["retry_after"],
+            error_5xx=options["error_5xx"],
+            truncate=options["truncate"],
+            seed=options["seed"],
+        )
+
+    def draw(self, body_size):
+        """Return (outcome, delay seconds, bytes to send) for one request."""
+        with self._lock:
+            delay = max(0.0, self._rng.gauss(self.latency, self.jitter))
+            roll = self._rng.random()
+            if roll < self.error_429:
+                return "429", delay, None
+            roll -= self.error_429
+            if roll < self.error_5xx:
+                return self._rng.choice(("500", "502", "503")), delay, None
+            roll -= self.error_5xx
+            if roll < self.truncate:
+                return "truncated", delay, self._rng.randrange(body_size or 1)
+            return "200", delay, body_size
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._serve()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._serve()
+
+    def _serve(self):
+        server = self.server
+        name, key = server.route(urlsplit(self.path).path)
+        if name is None:
+            self._send_json(404, {"error": f"No fixture for {self.path}"})
+            return
+
+        body = server.body(name, key)
+        outcome, delay, size = server.faults.draw(len(body))
+        server.record(name, outcome)
+        time.sleep(delay)
+        if outcome == "429":
+            self._send_json(
+                429,
+                {"error": "Too Many Requests"},
+                {"Retry-After": str(server.faults.retry_after)},
+            )
+            return
+        if size is None:
+            self._send_json(int(outcome), {"error": "Upstream error"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if size < len(body):
+            # Advertise the full length, then drop the connection mid-body
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        try:
+            for offset in range(0, size, CHUNK_SIZE):
+                chunk = body[offset : min(offset + CHUNK_SIZE, size)]
+                self.wfile.write(chunk)
+                if server.faults.bandwidth:
+                    time.sleep(len(chunk) / server.faults.bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, faults, verbose=False):
+        super().__init__(address, ReplayHandler)
+        self.faults = faults
+        self.verbose = verbose
+        self.bodies = {name: load_fixture_bytes(name) for name in FIXTURES}
+        self.routes = {
+            path.split("?")[0]: name
+            for name, (_, path) in UPSTREAM_ENDPOINTS.items()
+            if name in FIXTURES
+        }
+        # "/chart/{key}" -> ("/chart/", "pool_chart")
+        self.keyed_routes = [
+            (path.split("{")[0], name)
+            for name, (_, path) in UPSTREAM_ENDPOINTS.items()
+            if name in KEYED_FIXTURES
+        ]
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, path):
+        """(fixture name, key or None) serving ``path``, or (None, None)."""
+        for prefix, name in self.keyed_routes:
+            head, _, key = path.rstrip("/").rpartition("/")
+            if key and f"{head}/".endswith(prefix):
+                return name, unquote(key)
+        for suffix, name in self.routes.items():
+            if path.rstrip("/").endswith(suffix):
+                return name, None
+        return None, None
+
+    def body(self, name, key=None):
+        if key is None:
+            return self.bodies[name]
+        return load_fixture_bytes(name, key)
+
+    def record(self, name, outcome):
+        with self._stats_lock:
+            self.stats[f"{name} {outcome}"] += 1
+
+    def base_url_settings(self):
+        """Settings that point every upstream endpoint at this server."""
+        return {
+            "DEFILLAMA_YIELDS_URL": self.base_url,
+            "DEFILLAMA_API_URL": self.base_url,
+            "COINGECKO_API_URL": f"{self.base_url}/api/v3",
+            "SNAPSHOT_HUB_URL": self.base_url,
+        }
+
+    def start(self):
+        """Serve from a daemon thread; stop with ``shutdown()``."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
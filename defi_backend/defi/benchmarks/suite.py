@@ -0,0 +1,249 @@
+"""
+Ingest and read benchmarks driven by upstream fixtures.
+
+Each ingest benchmark decodes a fixture body and feeds it to the same ingest
+function the fetch views use, recording parse time, ingest time, rows/sec,
+SQL queries and peak Python memory. Read benchmarks hit the API through the
+Django test client and record p50/p99 latency, response size and queries per
+request. Fetch benchmarks call the fetch endpoints against the local replay
+server, optionally with injected upstream faults.
+"""
+
+import json
+import statistics
+import time
+import tracemalloc
+from collections import Counter
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from defi.ingest import (
+    ingest_dataset,
+    ingest_yield_data,
+    ingest_governance_data,
+    ingest_on_chain_data,
+    ingest_technical_data,
+)
+from defi.models import (
+    IngestRun,
+    YieldData,
+    GovernanceProposal,
+    RiskMetric,
+    OnChainData,
+    RiskScore,
+    TechnicalData,
+)
+from defi.serializers import RiskMetricSerializer, RiskScoreSerializer
+from .fixtures import load_fixture_bytes
+
+# Benchmark name -> (fixtures fed to the ingest function, function, model)
+INGESTS = {
+    "yield_data": (("pools",), ingest_yield_data, YieldData),
+    "risk_metrics": (
+        ("protocols",),
+        lambda protocols: ingest_dataset(
+            protocols, RiskMetric, RiskMetricSerializer, "risk_metrics"
+        ),
+        RiskMetric,
+    ),
+    "risk_scores": (
+        ("protocols",),
+        lambda protocols: ingest_dataset(
+            protocols, RiskScore, RiskScoreSerializer, "risk_scores"
+        ),
+        RiskScore,
+    ),
+    "governance_data": (
+        ("snapshot_proposals",),
+        ingest_governance_data,
+        GovernanceProposal,
+    ),
+    "on_chain_data": (
+        ("charts", "coingecko_defi"),
+        lambda tvl, market: ingest_on_chain_data({"tvl": tvl, "market": market}),
+        OnChainData,
+    ),
+    "technical_data": (
+        ("protocols", "coingecko_price"),
+        ingest_technical_data,
+        TechnicalData,
+    ),
+}
+
+# Benchmark name -> API path; "{slug}" is filled with a stored protocol slug
+READS = {
+    "yield-data": "/api/yield-data/",
+    "yield-data-filtered": "/api/yield-data/?chain=Ethereum&stablecoin=true&ordering=-apy",
+    "yield-data-db-ordering": "/api/yield-data/?ordering=symbol",
+    "governance-data": "/api/governance-data/",
+    "risk-metrics": "/api/risk-metrics/",
+    "risk-metric-detail": "/api/risk-metrics/{slug}/",
+    "risk-scores": "/api/risk-scores/",
+    "on-chain-data": "/api/on-chain-data/",
+    "technical-data": "/api/technical-data/",
+    "aggregate-tvl-by-project": (
+        "/api/analytics/yield-data/aggregate/?metric=tvlUsd&group_by=project"
+    ),
+    "summary": "/api/summary/",
+    "distribution-apy-by-chain": (
+        "/api/analytics/yield-data/distribution/?metric=apy&group_by=chain"
+    ),
+    "histogram-tvl": "/api/analytics/yield-data/histogram/?metric=tvlUsd&scale=log",
+}
+
+# Benchmark name -> fetch endpoint, run against the replay server
+FETCHES = {
+    "yield": "/api/fetch-yield/",
+    "governance": "/api/fetch-governance/",
+    "risk": "/api/fetch-risk/",
+    "on-chain": "/api/fetch-on-chain/",
+    "risk-scores": "/api/fetch-risk-scores/",
+    "technical": "/api/fetch-technical/",
+}
+FETCHES.update(
+    {f"async-{name}": f"/api/async{path[4:]}" for name, path in list(FETCHES.items())}
+)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class QueryCounter:
+    """Capture queries on every database alias at once."""
+
+    def __enter__(self):
+        self.contexts = [CaptureQueriesContext(c) for c in connections.all()]
+        for context in self.contexts:
+            context.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        for context in self.contexts:
+            context.__exit__(*exc_info)
+
+    @property
+    def count(self):
+        return sum(len(context) for context in self.contexts)
+
+    @property
+    def sql_seconds(self):
+        return sum(
+            float(query["time"])
+            for context in self.contexts
+            for query in context.captured_queries
+        )
+
+
+def run_ingest(name, repeat=3):
+    fixture_names, function, model = INGESTS[name]
+    bodies = [load_fixture_bytes(f) for f in fixture_names]
+    parse_times, ingest_times, query_counts, sql_times = [], [], [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payloads = [json.loads(body) for body in bodies]
+        parsed = time.perf_counter()
+        with QueryCounter() as queries:
+            function(*payloads)
+        done = time.perf_counter()
+        parse_times.append(parsed - start)
+        ingest_times.append(done - parsed)
+        query_counts.append(queries.count)
+        sql_times.append(queries.sql_seconds)
+
+    # Stage breakdown of the last timed pass; benchmarks are named by dataset
+    run = IngestRun.objects.filter(dataset=name).latest("started_at")
+
+    # Separate pass: tracemalloc slows allocation-heavy code considerably
+    tracemalloc.start()
+    function(*[json.loads(body) for body in bodies])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    rows = model.objects.count()
+    ingest_s = statistics.median(ingest_times)
+    return {
+        "bytes": sum(len(body) for body in bodies),
+        "rows": rows,
+        "parse_s": statistics.median(parse_times),
+        "ingest_s": ingest_s,
+        "rows_per_s": rows / ingest_s if ingest_s else None,
+        "queries": statistics.median(query_counts),
+        "sql_s": statistics.median(sql_times),
+        "peak_bytes": peak,
+        "stages": {
+            stage: getattr(run, f"{stage}_seconds")
+            for stage in ("normalize", "write", "publish")
+        },
+        "rejected": run.rows_rejected,
+    }
+
+
+def run_read(path, iterations=200):
+    client = Client()
+    client.get(path)  # Warm caches and indexes
+    latencies, query_counts = [], []
+    status = size = None
+    for _ in range(iterations):
+        with QueryCounter() as queries:
+            start = time.perf_counter()
+            response = client.get(path)
+            latencies.append(time.perf_counter() - start)
+        query_counts.append(queries.count)
+        status, size = response.status_code, len(response.content)
+    return {
+        "path": path,
+        "status": status,
+        "bytes": size,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "queries_per_request": statistics.fmean(query_counts),
+    }
+
+
+def run_fetch(path, requests=5):
+    """Time a fetch endpoint end to end: upstream download, parse and ingest."""
+    client = Client()
+    latencies, statuses = [], Counter()
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(path)
+        latencies.append(time.perf_counter() - start)
+        statuses[str(response.status_code)] += 1
+    return {
+        "path": path,
+        "statuses": dict(statuses),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+    }
+
+
+def read_paths():
+    slug = (
+        RiskMetric.objects.exclude(slug=None).values_list("slug", flat=True).first()
+        or "missing"
+    )
+    return {name: path.format(slug=slug) for name, path in READS.items()}
+
+
+def compare(old, new):
+    """Yield (section, name, metric, old, new) for metrics present in both runs."""
+    metrics = {
+        "ingest": ("ingest_s", "parse_s", "peak_bytes", "queries"),
+        "reads": ("p50_ms", "p99_ms", "queries_per_request"),
+        "fetch": ("p50_ms", "p99_ms", "max_ms"),
+    }
+    for section, keys in metrics.items():
+        for name, result in new.get(section, {}).items():
+            previous = old.get(section, {}).get(name)
+            if previous is None:
+                continue
+            for key in keys:
+                if key in result and key in previous:
+                    yield section, name, key, previous[key], result[key]
@@ -0,0 +1,349 @@
+"""
+Two-tier cache backend.
+
+A bounded in-process LRU sits in front of a shared cache alias (file, SQLite
+or Redis). Values read from the shared tier are kept locally until they are
+evicted to stay under a byte budget, expire, or another worker writes the
+same key.
+
+Every write bumps a generation counter and logs the key it wrote under that
+generation in the shared tier. The counter lives in the shared tier when its
+``incr`` is atomic (Redis, memcached, local memory); file and database caches
+``incr`` by reading and rewriting the value, so two workers writing at once
+could log under the same number and one write would never be invalidated.
+For those the counter is a ``CacheGeneration`` row bumped in the database.
+
+Each worker checks the counter at most once per ``GENERATION_CHECK_INTERVAL``
+seconds and drops its local copies of the keys written since it last looked;
+only when that log is incomplete (entries expired, or more than
+``INVALIDATION_LOG_SIZE`` writes behind) does it drop its whole local tier.
+
+Values are stored in the shared tier with their expiry time, so a local copy
+never outlives the shared entry; it is also kept at most ``LOCAL_TIMEOUT``
+seconds. Plain integers are stored bare so the shared tier can ``incr`` them,
+and are always read from the shared tier.
+
+Locally held values are shared between callers, so treat them as read-only.
+"""
+
+import pickle
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.db.models import F
+from .instrumentation import record_cache_lookup
+
+GENERATION_KEY = "two_tier:generation"
+# Writes a worker can fall behind by and still invalidate key by key
+INVALIDATION_LOG_SIZE = 1000
+_MISSING = object()
+# Shared tiers whose incr can't interleave with another worker's
+ATOMIC_INCR_BACKENDS = (LocMemCache, BaseMemcachedCache, RedisCache)
+
+# A value in the shared tier and when it expires there (None: never)
+Stamped = namedtuple("Stamped", ["value", "expires_at"])
+
+
+def _log_key(generation):
+    return f"{GENERATION_KEY}:{generation}"
+
+
+class TierStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
+
+
+class TwoTierCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options.get("SHARED", "shared")
+        self._max_bytes = int(options.get("MAX_BYTES", 64 * 1024 * 1024))
+        self._check_interval = float(options.get("GENERATION_CHECK_INTERVAL", 1.0))
+        self._local_timeout = float(options.get("LOCAL_TIMEOUT", 60))
+        # "shared" or "database"; by default whichever is atomic
+        self._counter = options.get("COUNTER")
+        self._local = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._generation = None
+        self._checked_at = float("-inf")
+        self._lock = threading.RLock()
+        self.local_stats = TierStats()
+        self.shared_stats = TierStats()
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # Generation handling
+
+    def _sync_generation(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self._check_interval:
+            return
+        self._catch_up(self._read_generation())
+        self._checked_at = now
+
+    def _counter_in_shared(self):
+        if self._counter is None:
+            self._counter = (
+                "shared"
+                if isinstance(self.shared, ATOMIC_INCR_BACKENDS)
+                else "database"
+            )
+        return self._counter == "shared"
+
+    def _read_generation(self):
+        if self._counter_in_shared():
+            return self.shared.get(GENERATION_KEY, 0)
+        from .models import CacheGeneration
+
+        generation = (
+            CacheGeneration.objects.using("default")
+            .filter(name=self._shared_alias)
+            .values_list("value", flat=True)
+            .first()
+        )
+        return generation or 0
+
+    def _next_generation(self):
+        """Allocate a generation number no other writer gets."""
+        if not self._counter_in_shared():
+            from .models import CacheGeneration
+
+            counters = CacheGeneration.objects.using("default")
+            with transaction.atomic(using="default"):
+                counters.get_or_create(name=self._shared_alias)
+                counters.filter(name=self._shared_alias).update(value=F("value") + 1)
+                return counters.get(name=self._shared_alias).value
+        try:
+            return self.shared.incr(GENERATION_KEY)
+        except ValueError:
+            if not self.shared.add(GENERATION_KEY, 1, None):
+                return self.shared.incr(GENERATION_KEY)
+            return 1
+
+    def _catch_up(self, generation):
+        """Drop the local copies of keys written up to ``generation``."""
+        with self._lock:
+            known = self._generation
+        if known == generation:
+            return
+        written = None
+        if known is not None and 0 < generation - known <= INVALIDATION_LOG_SIZE:
+            log_keys = [_log_key(n) for n in range(known + 1, generation + 1)]
+            written = self.shared.get_many(log_keys)
+            if len(written) < len(log_keys):
+                written = None  # Expired or not logged yet: can't tell what changed
+        with self._lock:
+            if written is None:
+                self._clear_local()
+            else:
+                for key in written.values():
+                    if key in self._local:
+                        self._local_delete(key)
+                        self._invalidations += 1
+            self._generation = generation
+
+    def _bump_generation(self, local_key):
+        """Log a write of ``local_key`` so other workers drop their copies."""
+        self._sync_generation(force=True)
+        generation = self._next_generation()
+        self.shared.set(_log_key(generation), local_key)
+        # Writes by other workers since the sync above
+        self._catch_up(generation - 1)
+        with self._lock:
+            self._generation = generation
+            self._checked_at = time.monotonic()
+
+    # Local tier
+
+    def _clear_local(self):
+        self._local.clear()
+        self._bytes = 0
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            value, size, expires_at = entry
+            if expires_at <= time.time():
+                self._local_delete(key)
+                return _MISSING
+            self._local.move_to_end(key)
+            return value
+
+    def _local_set(self, key, value, expires_at):
+        """Keep ``value`` locally until the shared entry expires at the latest."""
+        expires_at = min(
+            time.time() + self._local_timeout,
+            float("inf") if expires_at is None else expires_at,
+        )
+        size = len(pickle.dumps(value, self.pickle_protocol))
+        with self._lock:
+            self._local_delete(key)
+            if size > self._max_bytes or expires_at <= time.time():
+                return
+            self._local[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, (_, evicted_size, _) = self._local.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def _local_delete(self, key):
+        entry = self._local.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _stamp(self, value, timeout):
+        """The shared tier's copy of ``value``; integers stay incr-able."""
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        return Stamped(value, self.get_backend_timeout(timeout))
+
+    def _from_shared(self, local_key, stored):
+        """Unwrap a shared value, keeping stamped ones locally."""
+        if isinstance(stored, Stamped):
+            self._local_set(local_key, stored.value, stored.expires_at)
+            return stored.value
+        return stored
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self._sync_generation()
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            self.local_stats.hits += 1
+            record_cache_lookup(1, 0)
+            return value
+        self.local_stats.misses += 1
+
+        stored = self.shared.get(key, _MISSING, version=version)
+        if stored is _MISSING:
+            self.shared_stats.misses += 1
+            record_cache_lookup(0, 1)
+            return default
+        self.shared_stats.hits += 1
+        record_cache_lookup(1, 0)
+        return self._from_shared(local_key, stored)
+
+    def get_many(self, keys, version=None):
+        self._sync_generation()
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._local_get(self.make_and_validate_key(key, version=version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self.local_stats.hits += len(found)
+        self.local_stats.misses += len(missing)
+        lookups = len(found) + len(missing)
+        if missing:
+            # One round trip to the shared tier for everything not held locally
+            shared_values = self.shared.get_many(missing, version=version)
+            self.shared_stats.hits += len(shared_values)
+            self.shared_stats.misses += len(missing) - len(shared_values)
+            for key, stored in shared_values.items():
+                found[key] = self._from_shared(
+                    self.make_and_validate_key(key, version=version), stored
+                )
+        record_cache_lookup(len(found), lookups - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        stored = self._stamp(value, timeout)
+        self.shared.set(key, stored, timeout, version=version)
+        self._bump_generation(local_key)
+        self._from_shared(local_key, stored)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        stored = self._stamp(value, timeout)
+        if not self.shared.add(key, stored, timeout, version=version):
+            return False
+        self._bump_generation(local_key)
+        self._from_shared(local_key, stored)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        stored = self.shared.get(key, _MISSING, version=version)
+        if stored is _MISSING:
+            return False
+        if not isinstance(stored, Stamped):
+            return self.shared.touch(key, timeout, version=version)
+        # Rewritten with the new expiry; other workers' copies expire no later
+        # than the old one, so they need not be invalidated
+        stored = Stamped(stored.value, self.get_backend_timeout(timeout))
+        self.shared.set(key, stored, timeout, version=version)
+        self._from_shared(local_key, stored)
+        return True
+
+    def delete(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        deleted = self.shared.delete(key, version=version)
+        with self._lock:
+            self._local_delete(local_key)
+        self._bump_generation(local_key)
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self.shared.incr(key, delta, version=version)
+        with self._lock:
+            self._local_delete(local_key)
+        self._bump_generation(local_key)
+        return value
+
+    def clear(self):
+        self.shared.clear()
+        with self._lock:
+            self._clear_local()
+            self._generation = None
+            self._checked_at = float("-inf")
+
+    def stats(self):
+        """Per-tier hit rates plus local memory usage."""
+        with self._lock:
+            local = {
+                **self.local_stats.as_dict(),
+                "entries": len(self._local),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+        return {
+            "generation": self._generation,
+            "local": local,
+            "shared": {
+                **self.shared_stats.as_dict(),
+                "backend": type(self.shared).__name__,
+            },
+        }
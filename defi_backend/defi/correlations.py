@@ -0,0 +1,231 @@
+"""
+Correlation matrix of daily protocol TVL returns.
+
+After each ingest of /protocols, the ``CORRELATION_PROTOCOLS`` largest
+protocols by TVL are lined up on their last ``CORRELATION_WINDOW_DAYS`` days
+of TVL history (``defi.history``) plus today's value from the snapshot, and
+the Pearson correlation of every pair's daily log returns is taken over the
+days both have. The sums it needs are matrix products over the whole returns
+matrix, computed in row blocks to bound memory.
+
+The matrix is written to ``SNAPSHOT_DIR/correlations/<generation>.npz`` for
+the snapshot generation it describes and loaded once per worker, so
+correlation requests only read one row of it. A backfill rebuilds the matrix
+of the same generation, so workers reload it whenever the file is rewritten.
+"""
+
+import logging
+import os
+import numpy as np
+from django.conf import settings
+from .history import load_window, window_bounds
+from .snapshots import load_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class Correlations:
+    def __init__(self, generation, slugs, names, matrix, observations, build=None):
+        self.generation = generation
+        self.build = build  # Which write of the stored file this is
+        self.slugs = slugs
+        self.names = names
+        self.matrix = matrix
+        self.observations = observations
+        self._index = {slug: i for i, slug in enumerate(slugs.tolist())}
+
+    def __contains__(self, slug):
+        return slug in self._index
+
+    def top(self, slug, k, negative=False):
+        """The ``k`` protocols most (or most negatively) correlated with ``slug``."""
+        i = self._index[slug]
+        row = self.matrix[i].astype(np.float64)
+        candidates = np.flatnonzero(~np.isnan(row))
+        candidates = candidates[candidates != i]
+        k = min(k, candidates.size)
+        if k == 0:
+            return []
+        values = row[candidates] if negative else -row[candidates]
+        # argpartition picks the k extremes in O(n); only those are sorted
+        picked = candidates[np.argpartition(values, k - 1)[:k]]
+        picked = picked[np.argsort(row[picked] if negative else -row[picked])]
+        return [
+            {
+                "slug": str(self.slugs[j]),
+                "name": str(self.names[j]),
+                "correlation": float(row[j]),
+                "days": int(self.observations[i, j]),
+            }
+            for j in picked
+        ]
+
+    def submatrix(self, slugs):
+        rows = [self._index[slug] for slug in slugs]
+        return self.matrix[np.ix_(rows, rows)].astype(np.float64)
+
+
+def returns_matrix(snapshot):
+    """(slugs, names, daily log TVL returns) of the largest protocols."""
+    tvl = np.asarray(snapshot["tvl"], dtype=np.float64)
+    ranked = np.flatnonzero(~np.isnan(tvl))
+    count = min(settings.CORRELATION_PROTOCOLS, ranked.size)
+    if count == 0:
+        return np.array([], dtype=str), np.array([], dtype=str), np.empty((0, 0))
+    top = ranked[np.argpartition(-tvl[ranked], count - 1)[:count]]
+    top = top[np.argsort(-tvl[top], kind="stable")]
+    slugs = np.array(snapshot.categories["slug"], dtype=str)[
+        np.asarray(snapshot["slug"])[top]
+    ]
+    names = np.array(snapshot.categories["name"], dtype=str)[
+        np.asarray(snapshot["name"])[top]
+    ]
+
+    start, end = window_bounds(settings.CORRELATION_WINDOW_DAYS)
+    keys, matrices = load_window("risk_metrics", ["tvl"], start, end)
+    levels = np.full((count, settings.CORRELATION_WINDOW_DAYS + 1), np.nan)
+    if len(keys):
+        position = np.searchsorted(keys, slugs)
+        position[position >= len(keys)] = 0
+        found = keys[position] == slugs
+        levels[found, :-1] = matrices["tvl"][position[found]]
+    levels[:, -1] = tvl[top]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        levels[levels <= 0] = np.nan
+        returns = np.diff(np.log(levels), axis=1)
+    return slugs, names, returns
+
+
+def correlate(returns, block_size=None, dtype=None):
+    """
+    Pairwise-complete Pearson correlations of the rows of ``returns`` (NaN =
+    missing day), and the number of days each pair has in common.
+    """
+    block_size = block_size or settings.CORRELATION_BLOCK_SIZE
+    dtype = dtype or (np.float32 if settings.CORRELATION_FLOAT32 else np.float64)
+    present = ~np.isnan(returns)
+    # Centering and scaling rows first keeps float32 sums well conditioned;
+    # correlations don't change under either
+    days = present.sum(axis=1, keepdims=True)
+    x = np.where(present, returns, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = np.where(present, x - x.sum(axis=1, keepdims=True) / days, 0)
+        x /= np.sqrt((x * x).sum(axis=1, keepdims=True) / days)
+    x = np.where(np.isfinite(x), x, 0).astype(dtype)
+    squares = x * x
+    present = present.astype(dtype)
+
+    n = len(returns)
+    matrix = np.empty((n, n), dtype=dtype)
+    observations = np.empty((n, n), dtype=np.int32)
+    for start in range(0, n, block_size):
+        block = slice(start, start + block_size)
+        # Sums over the days both rows have: counts, x_i, x_j, x_i^2, x_j^2, x_i*x_j
+        common = present[block] @ present.T
+        sum_i = x[block] @ present.T
+        sum_j = present[block] @ x.T
+        cov = common * (x[block] @ x.T) - sum_i * sum_j
+        var_i = common * (squares[block] @ present.T) - sum_i * sum_i
+        var_j = common * (present[block] @ squares.T) - sum_j * sum_j
+        with np.errstate(invalid="ignore", divide="ignore"):
+            matrix[block] = cov / np.sqrt(var_i * var_j)
+        observations[block] = common
+    matrix[observations < settings.CORRELATION_MIN_DAYS] = np.nan
+    np.clip(matrix, -1, 1, out=matrix)
+    return matrix, observations
+
+
+def _dir():
+    return os.path.join(settings.SNAPSHOT_DIR, "correlations")
+
+
+def _path(generation):
+    return os.path.join(_dir(), f"{generation}.npz")
+
+
+def _build_id(path):
+    """Identifies one write of ``path``; every store replaces the file."""
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def build_correlations(snapshot):
+    slugs, names, returns = returns_matrix(snapshot)
+    matrix, observations = correlate(returns)
+    return Correlations(snapshot.generation, slugs, names, matrix, observations)
+
+
+def store_correlations(correlations):
+    """Write the matrix for its generation and drop other generations'."""
+    os.makedirs(_dir(), exist_ok=True)
+    path = _path(correlations.generation)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(
+        tmp_path,
+        slugs=correlations.slugs,
+        names=correlations.names,
+        matrix=correlations.matrix,
+        observations=correlations.observations,
+    )
+    os.replace(tmp_path, path)
+    correlations.build = _build_id(path)
+    for name in os.listdir(_dir()):
+        if name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(_dir(), name))
+            except OSError:
+                pass
+
+
+def refresh_correlations():
+    """Recompute the matrix for the current protocols; never fails the ingest."""
+    try:
+        snapshot = load_snapshot("risk_metrics")
+        if snapshot is None:
+            return
+        correlations = build_correlations(snapshot)
+        store_correlations(correlations)
+        _loaded["risk_metrics"] = correlations
+        logger.info(
+            f"Correlations for risk_metrics@{snapshot.generation}: "
+            f"{len(correlations.slugs)} protocols"
+        )
+    except Exception:
+        logger.exception("Error computing protocol TVL correlations")
+
+
+_loaded = {}
+
+
+def load_correlations():
+    """Correlations of the current protocol snapshot, built if not stored yet."""
+    snapshot = load_snapshot("risk_metrics")
+    if snapshot is None:
+        return None
+    path = _path(snapshot.generation)
+    try:
+        build = _build_id(path)
+    except OSError:
+        build = None
+    correlations = _loaded.get("risk_metrics")
+    if (
+        correlations is not None
+        and correlations.generation == snapshot.generation
+        and correlations.build == build
+    ):
+        return correlations
+    try:
+        with np.load(path) as stored:
+            correlations = Correlations(
+                snapshot.generation,
+                stored["slugs"],
+                stored["names"],
+                stored["matrix"],
+                stored["observations"],
+                build,
+            )
+    except (OSError, ValueError, KeyError):
+        correlations = build_correlations(snapshot)
+        store_correlations(correlations)
+    _loaded["risk_metrics"] = correlations
+    return correlations
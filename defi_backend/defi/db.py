@@ -0,0 +1,30 @@
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Persistent, database-wide settings that only the writer connection may change
+WRITER_PRAGMAS = ("journal_mode",)
+
+
+def apply_sqlite_profile(cursor, profile, read_only=False):
+    """Apply a SQLITE_PROFILE-style dict of PRAGMAs through a DB-API cursor."""
+    for pragma, value in profile.items():
+        if read_only and pragma in WRITER_PRAGMAS:
+            continue
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    if read_only:
+        cursor.execute("PRAGMA query_only=ON")
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """``connection_created`` handler applying settings.SQLITE_PROFILE."""
+    if connection.vendor != "sqlite" or not settings.SQLITE_PROFILE:
+        return
+    read_only = (
+        connection.alias == settings.DATABASE_READ_ALIAS
+        and connection.alias != "default"
+    )
+    with connection.cursor() as cursor:
+        apply_sqlite_profile(cursor, settings.SQLITE_PROFILE, read_only)
+    logger.debug(f"Applied SQLite profile to {connection.alias}")
@@ -0,0 +1,143 @@
+"""
+Delta sync of keyed datasets.
+
+Publishing a generation of a dataset with a key field (``DATASET_KEYS``)
+upserts one ``RowChange`` marker per inserted, updated or removed row: the
+generation it last changed in, the generation it was inserted in and whether
+it is now deleted. The table holds one small marker per row, so list
+endpoints answer ``?since=<generation>`` with only the rows whose marker is
+newer, reading those rows by key. Those answers come a page of keys at a
+time, in key order; a client syncs from the ``generation`` of the first page,
+so rows that change while it pages are sent again next time.
+
+Markers of deleted rows are compacted away once they are
+``DELTA_RETENTION_GENERATIONS`` generations old; a client asking for a
+generation from before that gets the full dataset instead, as it does when
+more than ``DELTA_MAX_ROWS`` rows changed.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from .models import DatasetGeneration, RowChange
+
+# Keys per ``key__in`` query, below SQLite's bound parameter limit
+KEY_BATCH_SIZE = 500
+
+
+def _batches(keys):
+    keys = list(keys)
+    for start in range(0, len(keys), KEY_BATCH_SIZE):
+        yield keys[start : start + KEY_BATCH_SIZE]
+
+
+def record_row_changes(dataset, generation, inserted, updated, removed):
+    """Upsert the markers of the rows a generation changed (keys as given)."""
+    changes = {}
+    for keys, change in (
+        (inserted, "inserted"),
+        (updated, "updated"),
+        (removed, "deleted"),
+    ):
+        changes.update((str(key), change) for key in keys if key is not None)
+    if not changes:
+        return
+    # Runs inside publish_generation's transaction: read where it writes
+    tracked = RowChange.objects.using("default").filter(dataset=dataset)
+    if generation > 1 and not tracked.exists():
+        # Changes before tracking started are unknown: older clients resync
+        DatasetGeneration.objects.filter(dataset=dataset).update(
+            compacted_through=generation - 1
+        )
+    created = {}
+    for batch in _batches(changes):
+        created.update(
+            tracked.filter(key__in=batch).values_list("key", "created_generation")
+        )
+
+    markers = [
+        RowChange(
+            dataset=dataset,
+            key=key,
+            generation=generation,
+            # Rows changed before tracking started count as always present
+            created_generation=(
+                generation if change == "inserted" else created.get(key, 0)
+            ),
+            deleted=change == "deleted",
+        )
+        for key, change in changes.items()
+    ]
+    with transaction.atomic():
+        for batch in _batches(changes):
+            tracked.filter(key__in=batch).delete()
+        RowChange.objects.bulk_create(markers, batch_size=1000)
+        _compact(dataset, generation)
+
+
+def _compact(dataset, generation):
+    floor = generation - settings.DELTA_RETENTION_GENERATIONS
+    if floor <= 0:
+        return
+    compacted, _ = RowChange.objects.filter(
+        dataset=dataset, deleted=True, generation__lte=floor
+    ).delete()
+    if compacted:
+        DatasetGeneration.objects.filter(
+            dataset=dataset, compacted_through__lt=floor
+        ).update(compacted_through=floor)
+
+
+def delta_since(dataset, since, after=None, limit=None):
+    """
+    What changed in ``dataset`` after generation ``since``: a dict with the
+    current ``generation`` and ``full=True`` when only the full dataset can
+    bring the client up to date, else the ``inserted``, ``updated`` and
+    ``deleted`` row keys. With a ``limit`` only that many keys after the key
+    ``after`` are returned, and ``next`` is the key to continue after (None
+    on the last page).
+    """
+    state = (
+        DatasetGeneration.objects.filter(dataset=dataset)
+        .values("generation", "compacted_through")
+        .first()
+    ) or {"generation": 0, "compacted_through": 0}
+    generation = state["generation"]
+    if since > generation or since < state["compacted_through"]:
+        return {"generation": generation, "full": True}
+
+    changed = RowChange.objects.filter(dataset=dataset, generation__gt=since)
+    if changed.values("pk")[settings.DELTA_MAX_ROWS : settings.DELTA_MAX_ROWS + 1]:
+        return {"generation": generation, "full": True}
+    if after is not None:
+        changed = changed.filter(key__gt=after)
+    markers = changed.order_by("key").values_list(
+        "key", "created_generation", "deleted"
+    )
+    if limit is not None:
+        markers = list(markers[: limit + 1])
+    delta = {
+        "generation": generation,
+        "full": False,
+        "inserted": [],
+        "updated": [],
+        "deleted": [],
+        "next": None,
+    }
+    if limit is not None and len(markers) > limit:
+        markers = markers[:limit]
+        delta["next"] = markers[-1][0]
+    for key, created_generation, deleted in markers:
+        if created_generation > since:
+            if not deleted:  # Rows both added and removed since are skipped
+                delta["inserted"].append(key)
+        else:
+            delta["deleted" if deleted else "updated"].append(key)
+    return delta
+
+
+def rows_for_keys(rows, key_field, keys):
+    """Rows of the ``rows`` queryset whose ``key_field`` is in ``keys``."""
+    found = []
+    for batch in _batches(keys):
+        found.extend(rows.filter(**{f"{key_field}__in": batch}))
+    return found
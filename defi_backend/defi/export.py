@@ -0,0 +1,240 @@
+"""
+Streaming encoders for bulk exports.
+
+Rows are read in chunks of ``EXPORT_CHUNK_SIZE`` and each chunk is encoded
+and handed to ``StreamingHttpResponse`` as soon as it is ready, so memory
+stays flat regardless of table size and the first bytes go out before the
+last row is read. ``stream_export`` reads from one ``.iterator()`` cursor for
+WSGI; ``astream_export`` is an async iterator for ASGI, which would otherwise
+buffer a sync one whole, and reads and encodes each page by primary key in a
+worker thread. Parquet and Arrow need ``pyarrow``.
+"""
+
+import csv
+import io
+import json
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import models
+from rest_framework.utils.encoders import JSONEncoder
+from .models import ProtocolHistory, RiskMetric, YieldData, YieldHistory
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Columnar formats are optional
+    pyarrow = None
+
+# Datasets that can be exported, by URL name
+EXPORT_DATASETS = {
+    "yield-data": YieldData,
+    "risk-metrics": RiskMetric,
+    "yield-history": YieldHistory,
+    "protocol-history": ProtocolHistory,
+}
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+_json = JSONEncoder()
+
+
+def _chunks(model, fields):
+    rows = (
+        model.objects.order_by("pk")
+        .values_list(*fields)
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+    while True:
+        chunk = list(islice(rows, settings.EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _json_columns(model, fields):
+    return {
+        i
+        for i, name in enumerate(fields)
+        if isinstance(model._meta.get_field(name), models.JSONField)
+    }
+
+
+class NdjsonEncoder:
+    def __init__(self, model, fields):
+        self.fields = fields
+
+    def start(self):
+        return ""
+
+    def encode(self, chunk):
+        return "".join(
+            _json.encode(dict(zip(self.fields, row))) + "\n" for row in chunk
+        )
+
+    def finish(self):
+        return ""
+
+
+class CsvEncoder:
+    def __init__(self, model, fields):
+        self.fields = fields
+        self.json_columns = _json_columns(model, fields)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def _drain(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    def start(self):
+        self.writer.writerow(self.fields)
+        return self._drain()
+
+    def encode(self, chunk):
+        for row in chunk:
+            if self.json_columns:
+                row = [
+                    json.dumps(value) if i in self.json_columns else value
+                    for i, value in enumerate(row)
+                ]
+            self.writer.writerow(row)
+        return self._drain()
+
+    def finish(self):
+        return ""
+
+
+class _ChunkSink:
+    """File-like object pyarrow writes into; drained after every batch."""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_type(field):
+    if isinstance(field, models.BooleanField):
+        return pyarrow.bool_()
+    if isinstance(field, (models.IntegerField, models.AutoField)):
+        return pyarrow.int64()
+    if isinstance(field, models.FloatField):
+        return pyarrow.float64()
+    if isinstance(field, models.DateTimeField):
+        return pyarrow.timestamp("us", tz="UTC")
+    if isinstance(field, models.DateField):
+        return pyarrow.date32()
+    # Text and JSON columns (JSON is exported as its encoded string)
+    return pyarrow.string()
+
+
+def arrow_schema(model, fields):
+    return pyarrow.schema(
+        [(name, _arrow_type(model._meta.get_field(name))) for name in fields]
+    )
+
+
+class ColumnarEncoder:
+    def __init__(self, model, fields, fmt):
+        self.schema = arrow_schema(model, fields)
+        self.json_columns = _json_columns(model, fields)
+        self.sink = _ChunkSink()
+        if fmt == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(
+                self.sink, self.schema, compression="zstd"
+            )
+        else:
+            self.writer = pyarrow.ipc.new_stream(self.sink, self.schema)
+
+    def start(self):
+        return self.sink.drain()
+
+    def encode(self, chunk):
+        columns = list(zip(*chunk))
+        arrays = [
+            pyarrow.array(
+                (
+                    [json.dumps(v) if v is not None else None for v in column]
+                    if i in self.json_columns
+                    else column
+                ),
+                type=self.schema.field(i).type,
+            )
+            for i, column in enumerate(columns)
+        ]
+        # One row group / record batch per chunk keeps memory bounded
+        self.writer.write_batch(pyarrow.record_batch(arrays, schema=self.schema))
+        return self.sink.drain()
+
+    def finish(self):
+        self.writer.close()
+        return self.sink.drain()
+
+
+def export_encoder(model, fields, fmt):
+    if fmt == "ndjson":
+        return NdjsonEncoder(model, fields)
+    if fmt == "csv":
+        return CsvEncoder(model, fields)
+    return ColumnarEncoder(model, fields, fmt)
+
+
+def stream_export(model, fields, fmt):
+    encoder = export_encoder(model, fields, fmt)
+    yield encoder.start()
+    for chunk in _chunks(model, fields):
+        yield encoder.encode(chunk)
+    yield encoder.finish()
+
+
+def _encode_page(encoder, model, fields, after):
+    """The next page of rows after primary key ``after``, encoded, and its last key."""
+    rows = model.objects.order_by("pk").values_list("pk", *fields)
+    if after is not None:
+        rows = rows.filter(pk__gt=after)
+    page = list(rows[: settings.EXPORT_CHUNK_SIZE])
+    if not page:
+        return None, after
+    return encoder.encode([row[1:] for row in page]), page[-1][0]
+
+
+async def astream_export(model, fields, fmt):
+    encoder = export_encoder(model, fields, fmt)
+    yield encoder.start()
+    after = None
+    while True:
+        data, after = await sync_to_async(_encode_page)(encoder, model, fields, after)
+        if data is None:
+            break
+        yield data
+    yield encoder.finish()
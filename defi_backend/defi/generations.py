@@ -0,0 +1,205 @@
+import logging
+import threading
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import Greatest
+from .delta import record_row_changes
+from .models import DatasetGeneration
+
+logger = logging.getLogger(__name__)
+
+# Field that identifies a row across refreshes, per dataset. Datasets mapped to
+# None are single-row snapshots and only report that they changed.
+DATASET_KEYS = {
+    "yield_data": "pool",
+    "governance_data": "proposal_id",
+    "risk_metrics": "slug",
+    "risk_scores": "protocol",
+    "on_chain_data": None,
+    "technical_data": None,
+}
+
+# Fields rewritten on every refresh that should not count as a change
+VOLATILE_FIELDS = ("id", "created_at", "updated_at", "generation")
+
+
+def _comparable(row):
+    return {k: v for k, v in row.items() if k not in VOLATILE_FIELDS}
+
+
+def row_changes(dataset, previous_rows, current_rows):
+    """(inserted rows, updated rows, removed keys), or None for unkeyed datasets."""
+    key_field = DATASET_KEYS.get(dataset)
+    if key_field is None:
+        return None
+
+    previous = {row.get(key_field): _comparable(row) for row in previous_rows or []}
+    inserted, updated = [], []
+    seen = set()
+    for row in current_rows:
+        key = row.get(key_field)
+        seen.add(key)
+        if key not in previous:
+            inserted.append(row)
+        elif previous[key] != _comparable(row):
+            updated.append(row)
+    removed = [key for key in previous if key not in seen]
+    return inserted, updated, removed
+
+
+def compute_diff(dataset, previous_rows, current_rows, changes=None):
+    """Describe what changed between two serialized versions of a dataset."""
+    if changes is None:
+        changes = row_changes(dataset, previous_rows, current_rows)
+    if changes is None:
+        return {"changed": True}
+
+    inserted, updated, removed = changes
+    if (
+        len(inserted) + len(updated) + len(removed)
+        > settings.LIVE_UPDATES_MAX_DIFF_ROWS
+    ):
+        # Too many changes to be worth pushing; clients should refetch
+        return {"resync": True}
+    return {"inserted": inserted, "updated": updated, "removed": removed}
+
+
+class GenerationSuperseded(Exception):
+    """A newer generation of the dataset was published first."""
+
+
+def stage_generation(dataset):
+    """Reserve the generation number an ingest writes its rows under."""
+    with transaction.atomic():
+        DatasetGeneration.objects.using("default").get_or_create(dataset=dataset)
+        DatasetGeneration.objects.filter(dataset=dataset).update(
+            allocated=Greatest("allocated", "generation") + 1
+        )
+        return DatasetGeneration.objects.using("default").get(dataset=dataset).allocated
+
+
+def replaced_rows(serializer, generation, cached_rows=None):
+    """
+    Serialized rows of ``generation``: ``cached_rows`` when they are exactly
+    that generation's rows (in pk order, as ingests cache them), else read
+    from the database.
+    """
+    rows = serializer.Meta.model.all_generations.using("default").filter(
+        generation=generation
+    )
+    if cached_rows:
+        span = rows.aggregate(first=Min("pk"), last=Max("pk"), count=Count("pk"))
+        if (cached_rows[0]["id"], cached_rows[-1]["id"], len(cached_rows)) == (
+            span["first"],
+            span["last"],
+            span["count"],
+        ):
+            return cached_rows
+    return serializer(rows.order_by("pk"), many=True).data
+
+
+def publish_generation(
+    dataset, current_rows=None, generation=None, serializer=None, cached_rows=None
+):
+    """
+    Make ``generation`` (a new one by default) the dataset's published one,
+    store the diff that produced it and record the changed rows of keyed
+    datasets for delta sync.
+
+    Publishing is a single row update: readers switch from the previous
+    generation's rows to the new ones atomically. Keyed datasets are diffed
+    inside that transaction against the generation actually replaced, read
+    through ``serializer`` (or taken from ``cached_rows``, see
+    ``replaced_rows``), so concurrent ingests record each other's changes
+    correctly. Raises GenerationSuperseded when a newer generation was
+    published in the meantime.
+    """
+    if generation is None:
+        generation = stage_generation(dataset)
+    with transaction.atomic():
+        # Claims the row first, so the published generation read next can't
+        # change before the swap
+        claimed = DatasetGeneration.objects.filter(
+            dataset=dataset, generation__lt=generation
+        ).update(allocated=Greatest("allocated", generation))
+        if not claimed:
+            raise GenerationSuperseded(
+                f"{dataset} generation {generation} was superseded before publishing"
+            )
+        previous_rows = None
+        if serializer is not None:
+            replaced = (
+                DatasetGeneration.objects.using("default")
+                .values_list("generation", flat=True)
+                .get(dataset=dataset)
+            )
+            previous_rows = replaced_rows(serializer, replaced, cached_rows)
+        changes = row_changes(dataset, previous_rows, current_rows or [])
+        diff = compute_diff(dataset, previous_rows, current_rows, changes)
+        DatasetGeneration.objects.filter(dataset=dataset).update(
+            generation=generation, diff=diff
+        )
+        if changes is not None:
+            key_field = DATASET_KEYS[dataset]
+            inserted, updated, removed = changes
+            record_row_changes(
+                dataset,
+                generation,
+                [row.get(key_field) for row in inserted],
+                [row.get(key_field) for row in updated],
+                removed,
+            )
+    logger.info(f"Published {dataset} generation {generation}")
+    return generation
+
+
+def collect_generations(dataset, model):
+    """Delete the rows of generations older than the published one."""
+    published = (
+        DatasetGeneration.objects.using("default")
+        .filter(dataset=dataset)
+        .values_list("generation", flat=True)
+        .first()
+    )
+    if published is None:
+        return 0
+    # Staged generations above the published one may still be in progress
+    deleted, _ = model.all_generations.filter(generation__lt=published).delete()
+    if deleted:
+        logger.info(f"Collected {deleted} {dataset} rows older than {published}")
+    return deleted
+
+
+def schedule_collection(dataset, model):
+    """Collect old generations in a background thread (or inline if disabled)."""
+    if not settings.GENERATION_GC_BACKGROUND:
+        collect_generations(dataset, model)
+        return None
+
+    def collect():
+        try:
+            collect_generations(dataset, model)
+        except Exception:
+            logger.exception(f"Error collecting old {dataset} generations")
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=collect, name=f"collect-{dataset}", daemon=True)
+    thread.start()
+    return thread
+
+
+def current_generations():
+    """Return the current generation number of every known dataset."""
+    return dict(DatasetGeneration.objects.values_list("dataset", "generation"))
+
+
+def generation_diffs(datasets):
+    """Return the latest generation and diff for the given datasets."""
+    return {
+        row["dataset"]: row
+        for row in DatasetGeneration.objects.filter(dataset__in=datasets).values(
+            "dataset", "generation", "diff"
+        )
+    }
@@ -0,0 +1,189 @@
+"""
+Daily metric history of pools and protocols.
+
+The first ingest of each day that sees a pool or protocol records its
+metrics in ``YieldHistory`` / ``ProtocolHistory``; rows already stored for
+that day, by an earlier ingest or a backfill, are left alone through the
+(key, date) unique constraint, so the history has DeFiLlama's daily
+granularity. ``load_window`` reads a date range back as dense
+NumPy matrices, one row per series and one column per day, for vectorized
+analysis; past windows are cached as files under ``SNAPSHOT_DIR/history/``.
+"""
+
+import logging
+import os
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import connections, router
+from django.utils import timezone
+from .models import ProtocolHistory, YieldHistory
+
+logger = logging.getLogger(__name__)
+
+# Dataset -> (model, series key field, snapshot key column, snapshot columns
+# stored under the same field names)
+HISTORY_SOURCES = {
+    "yield_data": (YieldHistory, "pool", "pool", ("tvlUsd", "apy", "apyBase")),
+    "risk_metrics": (ProtocolHistory, "protocol", "slug", ("tvl", "mcap")),
+}
+
+
+def _floats(values):
+    return np.fromiter(
+        (np.nan if v is None else v for v in values), np.float64, len(values)
+    )
+
+
+def record_daily_history(dataset, snapshot, day=None):
+    """Store today's values of the series in ``snapshot`` not stored yet today."""
+    model, key_field, key_column, columns = HISTORY_SOURCES[dataset]
+    day = day or timezone.now().date()
+    labels = snapshot.categories[key_column]
+    # NaN (missing in the snapshot) is stored as NULL
+    values = {
+        column: [None if v != v else v for v in np.asarray(snapshot[column]).tolist()]
+        for column in columns
+    }
+    rows, seen = [], set()
+    for i, code in enumerate(np.asarray(snapshot[key_column]).tolist()):
+        key = labels[code]
+        if key and key not in seen:
+            seen.add(key)
+            rows.append(
+                model(
+                    date=day,
+                    **{key_field: key},
+                    **{column: values[column][i] for column in columns},
+                )
+            )
+    # Series that already have a row for the day keep it
+    model.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    return len(rows)
+
+
+def _window_path(dataset, start, days):
+    return os.path.join(
+        settings.SNAPSHOT_DIR, "history", f"{dataset}-{start.isoformat()}-{days}.npz"
+    )
+
+
+def load_window(dataset, fields, start, end):
+    """
+    History of ``fields`` between ``start`` and ``end`` (exclusive) as
+    ``(keys, {field: matrix})``: ``keys`` is a sorted string array of series
+    keys and each matrix is ``len(keys) x days`` float64, NaN where missing.
+
+    Windows ending today or earlier no longer change, so each is read from
+    the database once and then kept as an .npz file next to the snapshots.
+    """
+    days = (end - start).days
+    path = _window_path(dataset, start, days)
+    if end <= timezone.now().date() and os.path.exists(path):
+        try:
+            with np.load(path) as window:
+                return window["keys"], {field: window[field] for field in fields}
+        except (OSError, ValueError, KeyError):
+            logger.warning(f"Ignoring unreadable history window {path}")
+
+    keys, matrices = None, None
+    previous = _window_path(dataset, start - timedelta(days=1), days)
+    if end <= timezone.now().date() and os.path.exists(previous):
+        try:
+            keys, matrices = _shift_window(dataset, previous, end)
+        except (OSError, ValueError, KeyError):
+            logger.warning(f"Ignoring unreadable history window {previous}")
+    if keys is None:
+        keys, matrices = _query_window(dataset, start, days)
+    if end <= timezone.now().date():
+        _store_window(dataset, days, path, keys, matrices)
+    return keys, {field: matrices[field] for field in fields}
+
+
+def _query_window(dataset, start, days):
+    model, key_field, _, fields = HISTORY_SOURCES[dataset]
+    end = start + timedelta(days=days)
+    columns = ", ".join(f'"{field}"' for field in fields)
+    # A raw cursor skips model construction, and dates read as text skip
+    # per-row date parsing, for the ~days x series rows
+    connection = connections[router.db_for_read(model)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT "{key_field}", CAST("date" AS TEXT), {columns} '
+            f'FROM "{model._meta.db_table}" '
+            f'WHERE "date" >= %s AND "date" < %s ORDER BY "{key_field}"',
+            [start, end],
+        )
+        rows = cursor.fetchall()
+    if not rows:
+        return np.array([], dtype=str), {field: np.empty((0, days)) for field in fields}
+
+    columns = list(zip(*rows))
+    # Rows come sorted by key, so each new key starts where it differs from
+    # the previous row
+    row_keys = np.array(columns[0], dtype=str)
+    starts = np.ones(len(row_keys), dtype=bool)
+    starts[1:] = row_keys[1:] != row_keys[:-1]
+    keys = row_keys[starts]
+    series = np.cumsum(starts) - 1
+    dates = np.array(columns[1], dtype="datetime64[D]")
+    offsets = (dates - np.datetime64(start, "D")).astype(np.int64)
+    matrices = {}
+    for i, field in enumerate(fields):
+        matrix = np.full((len(keys), days), np.nan)
+        matrix[series, offsets] = _floats(columns[2 + i])
+        matrices[field] = matrix
+    return keys, matrices
+
+
+def _shift_window(dataset, previous, end):
+    """Yesterday's window moved on by one day: only the new day is queried."""
+    with np.load(previous) as window:
+        old_keys = window["keys"]
+        old = {field: window[field] for field in window.files if field != "keys"}
+    new_keys, new = _query_window(dataset, end - timedelta(days=1), 1)
+    keys = np.union1d(old_keys, new_keys)
+    old_rows = np.searchsorted(keys, old_keys)
+    new_rows = np.searchsorted(keys, new_keys)
+    matrices = {}
+    for field, matrix in old.items():
+        shifted = np.full((len(keys), matrix.shape[1]), np.nan)
+        shifted[old_rows, :-1] = matrix[:, 1:]
+        shifted[new_rows, -1] = new[field][:, 0]
+        matrices[field] = shifted
+    # Drop series whose only data was the day that left the window
+    present = np.zeros(len(keys), dtype=bool)
+    for matrix in matrices.values():
+        present |= ~np.isnan(matrix).all(axis=1)
+    return keys[present], {field: m[present] for field, m in matrices.items()}
+
+
+def _store_window(dataset, days, path, keys, matrices):
+    """Write the window file atomically and drop older ones of that length."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, keys=keys, **matrices)
+    os.replace(tmp_path, path)
+    clear_window_cache(dataset, keep=path, days=days)
+
+
+def clear_window_cache(dataset, keep=None, days=None):
+    """Delete cached history windows, e.g. after history was backfilled."""
+    directory = os.path.join(settings.SNAPSHOT_DIR, "history")
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.startswith(f"{dataset}-") or path == keep:
+            continue
+        if days is None or name.endswith(f"-{days}.npz"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def window_bounds(days, today=None):
+    """The ``days`` full days before ``today``, as (start, end)."""
+    today = today or timezone.now().date()
+    return today - timedelta(days=days), today
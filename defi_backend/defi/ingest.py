@@ -0,0 +1,247 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from .models import (
+    YieldData,
+    GovernanceProposal,
+    RiskMetric,
+    OnChainData,
+    RiskScore,
+    TechnicalData,
+)
+from .serializers import (
+    YieldDataSerializer,
+    GovernanceProposalSerializer,
+    RiskMetricSerializer,
+    RiskScoreSerializer,
+)
+from .anomalies import run_anomaly_detection
+from .correlations import refresh_correlations
+from .generations import publish_generation, schedule_collection, stage_generation
+from .mappers import (
+    DEFILLAMA_POOLS,
+    PROTOCOL_MAPPERS,
+    SNAPSHOT_PROPOSALS,
+    RowMapper,
+)
+from .parallel import normalize_chunks
+from .sketches import update_distribution_sketches
+from .snapshots import SNAPSHOT_COLUMNS, write_snapshot
+from .summary import refresh_summary
+from .telemetry import ingest_run
+from .yield_index import yield_index
+
+logger = logging.getLogger(__name__)
+CACHE_TIMEOUT = 300  # Cache API responses for 5 minutes
+
+
+def store_snapshot(dataset, generation, rows):
+    """
+    Write the columnar snapshot for a new generation and return whether it is
+    now the current one; never fails the ingest.
+    """
+    if dataset not in SNAPSHOT_COLUMNS:
+        return False
+    try:
+        write_snapshot(dataset, generation, rows)
+    except Exception:
+        logger.exception(f"Error writing {dataset} snapshot {generation}")
+        return False
+    return True
+
+
+def mapper_for(model):
+    """Row mapper for a model fed from DeFiLlama /protocols."""
+    mapper = PROTOCOL_MAPPERS.get(model)
+    if mapper is None:
+        mapper = PROTOCOL_MAPPERS[model] = RowMapper(model, passthrough=True)
+    return mapper
+
+
+def write_generation(run, dataset, model, mapper, data):
+    """
+    Write ``data`` as a new, unpublished generation of the model's rows as
+    chunks come out of the mapper, and return its number. Readers keep seeing
+    the published generation until ``publish_generation`` swaps to this one.
+    """
+    generation = stage_generation(dataset)
+    chunks = normalize_chunks(mapper, data, run.reject)
+    while True:
+        with run.stage("normalize"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        for obj in chunk:
+            obj.generation = generation
+        with run.stage("write"):
+            model.objects.bulk_create(chunk)
+        run.rows_written += len(chunk)
+    return generation
+
+
+def staged_rows(model, generation):
+    """The rows written for ``generation``, read back from the database."""
+    return (
+        model.all_generations.using("default")
+        .filter(generation=generation)
+        .order_by("pk")
+    )
+
+
+def refresh_cache(cache_key, model, serializer):
+    """
+    Keep a dataset's cached rows for another CACHE_TIMEOUT after a refresh
+    found the upstream payload unchanged, so readers keep getting the cached
+    response rather than the paginated database one.
+    """
+    if cache.touch(cache_key, CACHE_TIMEOUT):
+        return
+    rows = serializer(model.objects.order_by("pk"), many=True).data
+    # add: an ingest publishing meanwhile has set newer rows
+    cache.add(cache_key, rows, CACHE_TIMEOUT)
+
+
+# Store a decoded upstream list payload into a model and cache it
+def ingest_dataset(response_data, model, serializer, cache_key, telemetry=None):
+    with ingest_run(cache_key, telemetry) as run:
+        if isinstance(response_data, dict) and "data" in response_data:
+            data = response_data["data"]
+        else:
+            data = response_data
+
+        if not isinstance(data, list):
+            logger.error(f"Unexpected data format: {type(data)}")
+            run.fail(f"Unexpected data format: {type(data).__name__}")
+            return False
+        run.rows_received = len(data)
+
+        run.sample(data)
+        generation = write_generation(run, cache_key, model, mapper_for(model), data)
+
+        with run.stage("publish"):
+            # Serialized from the database, so the cache holds exactly its rows
+            serialized_data = serializer(staged_rows(model, generation), many=True).data
+            # Diffed against the cached rows if they are still the published ones
+            run.generation = publish_generation(
+                cache_key, serialized_data, generation, serializer, cache.get(cache_key)
+            )
+            cache.set(cache_key, serialized_data, CACHE_TIMEOUT)
+            schedule_collection(cache_key, model)
+            # Left as they were rather than rebuilt from the previous snapshot
+            if store_snapshot(cache_key, run.generation, serialized_data):
+                refresh_summary(cache_key)
+                run_anomaly_detection(cache_key)
+                if cache_key == "risk_metrics":
+                    refresh_correlations()
+        return True
+
+
+def ingest_yield_data(response_data, telemetry=None):
+    """Replace stored yield pools with the DeFiLlama /pools payload."""
+    with ingest_run("yield_data", telemetry) as run:
+        data = response_data.get("data", [])
+        if settings.YIELD_POOL_LIMIT:
+            data = data[: settings.YIELD_POOL_LIMIT]
+        run.rows_received = len(data)
+
+        run.sample(data)
+        generation = write_generation(
+            run, "yield_data", YieldData, DEFILLAMA_POOLS, data
+        )
+
+        with run.stage("publish"):
+            serialized_data = YieldDataSerializer(
+                staged_rows(YieldData, generation), many=True
+            ).data
+            run.generation = publish_generation(
+                "yield_data",
+                serialized_data,
+                generation,
+                YieldDataSerializer,
+                cache.get("yield_data"),
+            )
+            cache.set("yield_data", serialized_data, CACHE_TIMEOUT)
+            schedule_collection("yield_data", YieldData)
+            # Left as they were rather than rebuilt from the previous snapshot
+            if store_snapshot("yield_data", run.generation, serialized_data):
+                refresh_summary("yield_data")
+                update_distribution_sketches("yield_data")
+                run_anomaly_detection("yield_data")
+            yield_index.publish(run.generation, serialized_data)
+        return run.rows_written
+
+
+def ingest_governance_data(response_data, telemetry=None):
+    """Replace stored proposals with a Snapshot GraphQL payload."""
+    with ingest_run("governance_data", telemetry) as run:
+        data = response_data.get("data", {}).get("proposals", [])
+        run.rows_received = len(data)
+        run.sample(data)
+        generation = write_generation(
+            run, "governance_data", GovernanceProposal, SNAPSHOT_PROPOSALS, data
+        )
+
+        with run.stage("publish"):
+            serialized_data = GovernanceProposalSerializer(
+                staged_rows(GovernanceProposal, generation), many=True
+            ).data
+            run.generation = publish_generation(
+                "governance_data",
+                serialized_data,
+                generation,
+                GovernanceProposalSerializer,
+                cache.get("governance_data"),
+            )
+            cache.set("governance_data", serialized_data, CACHE_TIMEOUT)
+            schedule_collection("governance_data", GovernanceProposal)
+        return run.rows_written
+
+
+def ingest_on_chain_data(data, telemetry=None):
+    """
+    Store whatever TVL ("tvl") and CoinGecko ("market") data was retrieved;
+    the stored values of a source that failed are kept.
+    """
+    defaults = {}
+    if "tvl" in data:
+        defaults["tvl"] = data["tvl"]
+    if "market" in data:
+        market = data["market"].get("data", {})
+        defaults["transaction_volume"] = market.get("trading_volume_24h", 0)
+        defaults["wallet_balance"] = market.get("market_cap", 0)
+    with ingest_run("on_chain_data", telemetry) as run:
+        run.rows_received = 1
+        with run.stage("write"):
+            OnChainData.objects.update_or_create(id=1, defaults=defaults)
+        run.rows_written = 1
+        with run.stage("publish"):
+            run.generation = publish_generation("on_chain_data")
+
+
+def ingest_technical_data(protocol_data, price_data, telemetry=None):
+    """Store the protocol and price payloads; None keeps the stored one."""
+    defaults = {"tenderly_simulation": {}}
+    if protocol_data is not None:
+        defaults["uniswap_data"] = protocol_data
+    if price_data is not None:
+        defaults["wallet_transactions"] = price_data
+    with ingest_run("technical_data", telemetry) as run:
+        run.rows_received = 1
+        with run.stage("write"):
+            TechnicalData.objects.update_or_create(id=1, defaults=defaults)
+        run.rows_written = 1
+        with run.stage("publish"):
+            run.generation = publish_generation("technical_data")
+
+
+# Dataset -> ingest function for its decoded upstream payload, for replays
+DATASET_INGESTERS = {
+    "yield_data": ingest_yield_data,
+    "governance_data": ingest_governance_data,
+    "risk_metrics": lambda payload, telemetry=None: ingest_dataset(
+        payload, RiskMetric, RiskMetricSerializer, "risk_metrics", telemetry
+    ),
+    "risk_scores": lambda payload, telemetry=None: ingest_dataset(
+        payload, RiskScore, RiskScoreSerializer, "risk_scores", telemetry
+    ),
+}
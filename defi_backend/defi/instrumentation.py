@@ -0,0 +1,265 @@
+"""
+Per-request performance instrumentation.
+
+``RequestMetricsMiddleware`` times every ``/api/`` request and breaks it down
+into SQL (query count and time on every database alias), cache hits and
+misses, serialization and rendering. The breakdown goes back to the client in
+a ``Server-Timing`` header, so it shows up in browser dev tools, and is
+aggregated per endpoint for ``/api/metrics/`` in the Prometheus text format.
+
+Aggregates live in the process that served the request; scrape every worker
+(or run a single one) for a complete picture.
+"""
+
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.stages = defaultdict(float)  # stage -> seconds
+        self.view_done = None
+
+    def server_timing(self, total, size):
+        parts = [
+            f'db;dur={self.sql_seconds * 1000:.2f};desc="{self.queries} queries"',
+            f'cache;desc="{self.cache_hits} hit {self.cache_misses} miss"',
+        ]
+        for stage, seconds in self.stages.items():
+            parts.append(f"{stage};dur={seconds * 1000:.2f}")
+        if size is not None:
+            parts.append(f'size;desc="{size} bytes"')
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper counting queries for the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql_seconds += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # connection_created fires again on reconnect, so only install once
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def record_cache_lookup(hits, misses):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+@contextmanager
+def timed(stage):
+    """Attribute the time spent in the block to ``stage`` of the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.stages[stage] += time.perf_counter() - start
+
+
+class EndpointStats:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.stage_seconds = defaultdict(float)
+        self.response_bytes = 0
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._endpoints = defaultdict(EndpointStats)
+        self._lock = threading.Lock()
+
+    def observe(self, method, endpoint, status, metrics, duration, size):
+        with self._lock:
+            stats = self._endpoints[(method, endpoint, str(status))]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[i] += 1
+                    break
+            stats.count += 1
+            stats.seconds += duration
+            stats.queries += metrics.queries
+            stats.sql_seconds += metrics.sql_seconds
+            stats.cache_hits += metrics.cache_hits
+            stats.cache_misses += metrics.cache_misses
+            for stage, seconds in metrics.stages.items():
+                stats.stage_seconds[stage] += seconds
+            stats.response_bytes += size or 0
+
+    def render(self):
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = [
+                "# HELP defi_http_request_duration_seconds API request latency.",
+                "# TYPE defi_http_request_duration_seconds histogram",
+            ]
+            for (method, endpoint, status), stats in endpoints:
+                labels = (
+                    f'method="{method}",endpoint="{_label(endpoint)}",'
+                    f'status="{status}"'
+                )
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(
+                        f"defi_http_request_duration_seconds_bucket"
+                        f'{{{labels},le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'defi_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} '
+                    f"{stats.count}"
+                )
+                lines.append(
+                    f"defi_http_request_duration_seconds_sum{{{labels}}} {stats.seconds}"
+                )
+                lines.append(
+                    f"defi_http_request_duration_seconds_count{{{labels}}} {stats.count}"
+                )
+
+            counters = [
+                ("db_queries", "SQL queries run by API requests.", "queries"),
+                ("db_seconds", "Time API requests spent in SQL.", "sql_seconds"),
+                ("response_bytes", "API response body bytes.", "response_bytes"),
+            ]
+            for name, help_text, attribute in counters:
+                lines.append(f"# HELP defi_http_{name}_total {help_text}")
+                lines.append(f"# TYPE defi_http_{name}_total counter")
+                for (method, endpoint, status), stats in endpoints:
+                    lines.append(
+                        f'defi_http_{name}_total{{method="{method}",'
+                        f'endpoint="{_label(endpoint)}",status="{status}"}} '
+                        f"{getattr(stats, attribute)}"
+                    )
+
+            lines.append(
+                "# HELP defi_http_cache_lookups_total Cache lookups by API requests."
+            )
+            lines.append("# TYPE defi_http_cache_lookups_total counter")
+            lines.append(
+                "# HELP defi_http_stage_seconds_total Time API requests spent per stage."
+            )
+            lines.append("# TYPE defi_http_stage_seconds_total counter")
+            for (method, endpoint, status), stats in endpoints:
+                labels = (
+                    f'method="{method}",endpoint="{_label(endpoint)}",'
+                    f'status="{status}"'
+                )
+                lines.append(
+                    f'defi_http_cache_lookups_total{{{labels},result="hit"}} '
+                    f"{stats.cache_hits}"
+                )
+                lines.append(
+                    f'defi_http_cache_lookups_total{{{labels},result="miss"}} '
+                    f"{stats.cache_misses}"
+                )
+                for stage, seconds in sorted(stats.stage_seconds.items()):
+                    lines.append(
+                        f'defi_http_stage_seconds_total{{{labels},stage="{stage}"}} '
+                        f"{seconds}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetricsMiddleware:
+    """Server-Timing headers and per-endpoint aggregates for /api/ requests."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        if not request.path.startswith("/api/"):
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    async def _acall(self, request):
+        if not request.path.startswith("/api/"):
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        # Runs after the view and before DRF renders the response
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view_done = time.perf_counter()
+        return response
+
+    def _finish(self, request, response, metrics):
+        now = time.perf_counter()
+        if metrics.view_done is not None:
+            metrics.stages["render"] += now - metrics.view_done
+        total = now - metrics.start
+        size = None if response.streaming else len(response.content)
+        response["Server-Timing"] = metrics.server_timing(total, size)
+
+        match = request.resolver_match
+        endpoint = match.route if match is not None else "unmatched"
+        registry.observe(
+            request.method, endpoint, response.status_code, metrics, total, size
+        )
+        return response
@@ -0,0 +1,393 @@
+"""
+Server-push channel for dataset generation changes.
+
+Clients subscribe over Server-Sent Events (plain HTTP GET) or a WebSocket and
+receive a compact diff whenever one of their datasets gets a new generation.
+A single poller per process reads the generation table and wakes every
+subscriber, so idle connections cost one suspended coroutine each; it stops
+while nobody is subscribed.
+
+The channel is served in front of Django, so it checks the Host header
+against ALLOWED_HOSTS and a browser's Origin against CORS_ALLOWED_ORIGINS
+itself.
+"""
+
+import asyncio
+import json
+import logging
+from http import HTTPStatus
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http.request import split_domain_port, validate_host
+from .delta import delta_since, rows_for_keys
+from .generations import DATASET_KEYS, current_generations, generation_diffs
+from .models import GovernanceProposal, RiskMetric, RiskScore, YieldData
+from .serializers import (
+    GovernanceProposalSerializer,
+    RiskMetricSerializer,
+    RiskScoreSerializer,
+    YieldDataSerializer,
+)
+
+logger = logging.getLogger(__name__)
+
+# Keyed dataset -> (model, serializer) of the rows pushed in diffs
+DIFF_SOURCES = {
+    "yield_data": (YieldData, YieldDataSerializer),
+    "governance_data": (GovernanceProposal, GovernanceProposalSerializer),
+    "risk_metrics": (RiskMetric, RiskMetricSerializer),
+    "risk_scores": (RiskScore, RiskScoreSerializer),
+}
+
+
+def diff_since(dataset, since):
+    """
+    (generation, diff) bringing a client from generation ``since`` to the
+    published one, from the rows' change markers (see defi.delta).
+    """
+    if dataset not in DIFF_SOURCES:
+        # Single-row datasets only report that they changed
+        return current_generations().get(dataset, 0), {"changed": True}
+    model, serializer = DIFF_SOURCES[dataset]
+    key_field = DATASET_KEYS[dataset]
+    # One read transaction, so the markers and rows are of the same generation
+    with transaction.atomic(using=settings.DATABASE_READ_ALIAS):
+        delta = delta_since(dataset, since)
+        if delta["full"] or (
+            len(delta["inserted"]) + len(delta["updated"]) + len(delta["deleted"])
+            > settings.LIVE_UPDATES_MAX_DIFF_ROWS
+        ):
+            return delta["generation"], {"resync": True}
+        rows = serializer(
+            rows_for_keys(
+                model.objects.order_by("pk"),
+                key_field,
+                delta["inserted"] + delta["updated"],
+            ),
+            many=True,
+        ).data
+    inserted = set(delta["inserted"])
+    return delta["generation"], {
+        "inserted": [row for row in rows if str(row[key_field]) in inserted],
+        "updated": [row for row in rows if str(row[key_field]) not in inserted],
+        "removed": delta["deleted"],
+    }
+
+
+class GenerationBroadcaster:
+    """Polls dataset generations and fans changes out to all subscribers."""
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self.state = {}  # dataset -> {"generation": n, "diff": {...}}
+        self.version = 0
+        self.subscribers = 0
+        self._diffs = {}  # (dataset, since) -> task of (generation, diff)
+        self._condition = None
+        self._ready = None
+        self._task = None
+
+    def subscribe(self):
+        """Count a subscriber in, starting the poller if it was stopped."""
+        self.subscribers += 1
+        if self._task is None or self._task.done():
+            self._condition = asyncio.Condition()
+            self._ready = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    def unsubscribe(self):
+        self.subscribers -= 1
+
+    async def ready(self, timeout):
+        """Wait for the poller's first refresh, which may have been a while ago."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _poll(self):
+        # The state is left as it was when the last subscriber went; the
+        # first refresh of the next run brings it up to date
+        while self.subscribers > 0:
+            try:
+                await self._refresh()
+            except Exception:
+                logger.exception("Error polling dataset generations")
+            self._ready.set()
+            await asyncio.sleep(self.poll_interval)
+
+    async def _refresh(self):
+        generations = await sync_to_async(current_generations)()
+        changed = [
+            dataset
+            for dataset, generation in generations.items()
+            if self.state.get(dataset, {}).get("generation") != generation
+        ]
+        if not changed:
+            return
+        # Only load diffs for datasets that actually moved
+        self.state.update(await sync_to_async(generation_diffs)(changed))
+        self._diffs = {}
+        self.version += 1
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def wait(self, version, timeout):
+        """Wait until the state moves past ``version`` or ``timeout`` expires."""
+        async with self._condition:
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: self.version > version), timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+        return self.version
+
+    async def diff_since(self, dataset, since):
+        """``diff_since``, computed once per state for all subscribers."""
+        key = (dataset, since)
+        task = self._diffs.get(key)
+        if task is None:
+            # Kept while it runs, so subscribers woken together share one read
+            task = asyncio.ensure_future(sync_to_async(diff_since)(dataset, since))
+            self._diffs[key] = task
+        try:
+            # A subscriber that disconnects doesn't cancel the others' diff
+            return await asyncio.shield(task)
+        except Exception:
+            if self._diffs.get(key) is task:
+                del self._diffs[key]
+            raise
+
+
+broadcaster = GenerationBroadcaster(settings.LIVE_UPDATES_POLL_INTERVAL)
+
+
+def _parse_subscription(scope):
+    """Read ``?datasets=a,b`` and optional known generations ``?a=3&b=7``."""
+    params = parse_qs(scope.get("query_string", b"").decode())
+    requested = params.get("datasets", [""])[0].split(",")
+    datasets = [d for d in requested if d in DATASET_KEYS] or list(DATASET_KEYS)
+    known = {}
+    for dataset in datasets:
+        try:
+            known[dataset] = int(params[dataset][0])
+        except (KeyError, ValueError):
+            continue
+    return datasets, known
+
+
+async def _pending_events(datasets, known):
+    """Build events for datasets whose generation moved past what the client has."""
+    events = []
+    for dataset in datasets:
+        entry = broadcaster.state.get(dataset)
+        if entry is None:
+            continue
+        generation = entry["generation"]
+        seen = known[dataset]
+        if generation <= seen:
+            continue
+        if generation == seen + 1:
+            diff = entry["diff"]
+        else:
+            # Generations are not consecutive (staged or superseded ones are
+            # skipped) or the client missed some: diff from what it has
+            generation, diff = await broadcaster.diff_since(dataset, seen)
+        known[dataset] = generation
+        events.append({"dataset": dataset, "generation": generation, **diff})
+    return events
+
+
+async def _subscribe(datasets, known, emit, disconnected):
+    broadcaster.subscribe()
+    try:
+        await broadcaster.ready(broadcaster.poll_interval * 2)
+        version = broadcaster.version
+        generations = {
+            d: broadcaster.state.get(d, {}).get("generation", 0) for d in datasets
+        }
+        await emit("hello", {"generations": generations})
+        # Without a known generation the client is assumed to be up to date
+        for dataset in datasets:
+            known.setdefault(dataset, generations[dataset])
+        for event in await _pending_events(datasets, known):
+            await emit("generation", event)
+
+        heartbeat = settings.LIVE_UPDATES_HEARTBEAT
+        while not disconnected.is_set():
+            waiter = asyncio.ensure_future(broadcaster.wait(version, heartbeat))
+            stopper = asyncio.ensure_future(disconnected.wait())
+            await asyncio.wait({waiter, stopper}, return_when=asyncio.FIRST_COMPLETED)
+            stopper.cancel()
+            if not waiter.done():
+                waiter.cancel()
+                break
+            new_version = waiter.result()
+            if new_version == version:
+                await emit(None, None)  # Heartbeat keeps proxies from closing us
+                continue
+            version = new_version
+            for event in await _pending_events(datasets, known):
+                await emit("generation", event)
+    finally:
+        broadcaster.unsubscribe()
+
+
+async def _watch_disconnect(receive, disconnected, disconnect_type):
+    while True:
+        message = await receive()
+        if message["type"] == disconnect_type:
+            disconnected.set()
+            return
+
+
+def _allowed_hosts():
+    # As Django's HttpRequest.get_host()
+    if settings.DEBUG and not settings.ALLOWED_HOSTS:
+        return [".localhost", "127.0.0.1", "[::1]"]
+    return settings.ALLOWED_HOSTS
+
+
+def _check_access(headers):
+    """
+    None if the request may subscribe, else the HTTP status refusing it: 400
+    for a Host not in ALLOWED_HOSTS, 403 for a browser Origin not allowed by
+    the CORS settings.
+    """
+    domain, _ = split_domain_port(headers.get(b"host", b"").decode("latin-1"))
+    if not domain or not validate_host(domain, _allowed_hosts()):
+        return 400
+    origin = headers.get(b"origin", b"").decode("latin-1")
+    if (
+        origin
+        and not getattr(settings, "CORS_ALLOW_ALL_ORIGINS", False)
+        and origin not in settings.CORS_ALLOWED_ORIGINS
+    ):
+        return 403
+    return None
+
+
+async def _refuse(send, status):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain")],
+        }
+    )
+    await send(
+        {"type": "http.response.body", "body": HTTPStatus(status).phrase.encode()}
+    )
+
+
+def _cors_headers(headers):
+    """CORS response headers for an allowed Origin (see corsheaders)."""
+    origin = headers.get(b"origin")
+    if not origin:
+        return []
+    cors = [(b"access-control-allow-origin", origin), (b"vary", b"origin")]
+    if getattr(settings, "CORS_ALLOW_CREDENTIALS", False):
+        cors.append((b"access-control-allow-credentials", b"true"))
+    return cors
+
+
+async def sse_endpoint(scope, receive, send):
+    headers = dict(scope.get("headers", []))
+    refused = _check_access(headers)
+    if refused:
+        logger.warning(f"Refused live updates subscription ({refused})")
+        return await _refuse(send, refused)
+    datasets, known = _parse_subscription(scope)
+    last_event = headers.get(b"last-event-id", b"").decode()
+    if ":" in last_event:
+        # Resume from the event id of the form "<dataset>:<generation>"
+        dataset, _, generation = last_event.partition(":")
+        if dataset in datasets and generation.isdigit():
+            known.setdefault(dataset, int(generation))
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+                *_cors_headers(headers),
+            ],
+        }
+    )
+
+    async def emit(event, data):
+        if event is None:
+            chunk = ": keep-alive\n\n"
+        else:
+            lines = []
+            if event == "generation":
+                lines.append(f"id: {data['dataset']}:{data['generation']}")
+            lines.append(f"event: {event}")
+            lines.append(f"data: {json.dumps(data)}")
+            chunk = "\n".join(lines) + "\n\n"
+        await send(
+            {"type": "http.response.body", "body": chunk.encode(), "more_body": True}
+        )
+
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(
+        _watch_disconnect(receive, disconnected, "http.disconnect")
+    )
+    try:
+        await _subscribe(datasets, known, emit, disconnected)
+    finally:
+        watcher.cancel()
+    if not disconnected.is_set():
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def websocket_endpoint(scope, receive, send):
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    refused = _check_access(dict(scope.get("headers", [])))
+    if refused:
+        logger.warning(f"Refused live updates subscription ({refused})")
+        # Closing before accepting rejects the handshake with a 403
+        await send({"type": "websocket.close"})
+        return
+    await send({"type": "websocket.accept"})
+    datasets, known = _parse_subscription(scope)
+
+    async def emit(event, data):
+        if event is None:
+            payload = {"event": "heartbeat"}
+        else:
+            payload = {"event": event, **data}
+        await send({"type": "websocket.send", "text": json.dumps(payload)})
+
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(
+        _watch_disconnect(receive, disconnected, "websocket.disconnect")
+    )
+    try:
+        await _subscribe(datasets, known, emit, disconnected)
+    finally:
+        watcher.cancel()
+
+
+class LiveUpdatesRouter:
+    """ASGI app that serves the live channel and hands everything else to Django."""
+
+    def __init__(self, application, path="/api/live/"):
+        self.application = application
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and scope["path"] == self.path:
+            if scope["type"] == "websocket":
+                return await websocket_endpoint(scope, receive, send)
+            if scope["method"] == "GET":
+                return await sse_endpoint(scope, receive, send)
+        return await self.application(scope, receive, send)
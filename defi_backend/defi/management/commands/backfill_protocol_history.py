@@ -0,0 +1,14 @@
+from defi.backfill import ProtocolHistoryBackfill
+from .backfill_yield_history import Command as BackfillCommand
+
+
+class Command(BackfillCommand):
+    help = (
+        "Store the daily TVL history of every protocol from DeFiLlama's "
+        "/protocol/{slug}: all of it on the first run, then only the days "
+        "after the last one stored. Run it daily to keep the history current; "
+        "point DEFILLAMA_API_URL at `manage.py replay_upstream` to run offline."
+    )
+    backfill = ProtocolHistoryBackfill
+    keys_name = "protocols"
+    days_help = "Days of history kept by the first run (default: all)"
@@ -0,0 +1,67 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from defi.backfill import YieldHistoryBackfill, run_backfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the daily TVL/APY history of every pool from DeFiLlama's "
+        "/chart/{pool}. Resumes from its checkpoint when interrupted; point "
+        "DEFILLAMA_YIELDS_URL at `manage.py replay_upstream` to run offline."
+    )
+    backfill = YieldHistoryBackfill
+    keys_name = "pools"
+    days_help = "Days of history kept, 0 = all (BACKFILL_DAYS)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, help="Requests in flight (BACKFILL_CONCURRENCY)"
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            help="Requests per second per host, 0 = unlimited (BACKFILL_RATE)",
+        )
+        parser.add_argument("--days", type=int, help=self.days_help)
+        parser.add_argument(
+            f"--{self.keys_name}",
+            dest="keys",
+            help=f"Comma-separated {self.keys_name} (default: all)",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help=f"Forget the checkpoint and fetch all {self.keys_name} again",
+        )
+        parser.add_argument("--output", help="Write the run's stats as JSON")
+
+    def handle(self, *args, **options):
+        keys = options["keys"]
+        last_report = [0.0]
+
+        def progress(stats):
+            if options["verbosity"] < 1 or time.monotonic() - last_report[0] < 5:
+                return
+            last_report[0] = time.monotonic()
+            self.stdout.write(
+                f"{stats.done + stats.failed}/{stats.keys} {self.keys_name}  "
+                f"{stats.rows} rows  {stats.failed} failed  "
+                f"{stats.requests / stats.elapsed:.1f} req/s  "
+                f"{stats.throttled} throttled"
+            )
+
+        stats = run_backfill(
+            self.backfill(days=options["days"]),
+            concurrency=options["concurrency"],
+            rate=options["rate"],
+            restart=options["restart"],
+            keys=[key for key in keys.split(",") if key] if keys else None,
+            progress=progress,
+        )
+        result = stats.as_dict()
+        for name, value in result.items():
+            self.stdout.write(f"{name:22} {value}")
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(result, f, indent=2)
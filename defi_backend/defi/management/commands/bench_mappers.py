@@ -0,0 +1,165 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from defi.benchmarks.fixtures import load_fixture_bytes
+from defi.mappers import DEFILLAMA_POOLS, PROTOCOL_MAPPERS
+from defi.models import RiskMetric, RiskScore, YieldData
+
+
+# Normalization as it was before defi.mappers, kept as the comparison baseline
+def legacy_pools(data, reject):
+    required = ("chain", "project", "symbol", "pool", "tvlUsd", "apyBase", "apy")
+    objects = []
+    for item in data:
+        if not isinstance(item, dict):
+            reject(item, "not an object")
+            continue
+        missing = [f for f in required if item.get(f) is None]
+        if missing:
+            reject(item, f"missing {', '.join(missing)}")
+            continue
+        objects.append(
+            YieldData(
+                chain=item.get("chain"),
+                project=item.get("project"),
+                symbol=item.get("symbol"),
+                tvlUsd=item.get("tvlUsd"),
+                apyBase=item.get("apyBase"),
+                apyReward=item.get("apyReward"),
+                apy=item.get("apy"),
+                rewardTokens=item.get("rewardTokens", []),
+                pool=item.get("pool"),
+                apyPct1D=item.get("apyPct1D"),
+                apyPct7D=item.get("apyPct7D"),
+                apyPct30D=item.get("apyPct30D"),
+                stablecoin=item.get("stablecoin", False),
+                ilRisk=item.get("ilRisk"),
+                exposure=item.get("exposure"),
+                predictions=item.get("predictions", {}),
+                poolMeta=item.get("poolMeta"),
+                mu=item.get("mu"),
+                sigma=item.get("sigma"),
+                count=item.get("count"),
+                outlier=item.get("outlier", False),
+                underlyingTokens=item.get("underlyingTokens", []),
+                il7d=item.get("il7d"),
+                apyBase7d=item.get("apyBase7d"),
+                apyMean30d=item.get("apyMean30d"),
+                volumeUsd1d=item.get("volumeUsd1d"),
+                volumeUsd7d=item.get("volumeUsd7d"),
+                apyBaseInception=item.get("apyBaseInception"),
+            )
+        )
+    return objects
+
+
+def legacy_protocols(model):
+    def normalize(data, reject):
+        objects = []
+        model_fields = [f.name for f in model._meta.get_fields()]
+        for item in data:
+            if not isinstance(item, dict):
+                reject(item, "not an object")
+                continue
+            filtered_item = {k: v for k, v in item.items() if k in model_fields}
+            if model == RiskScore:
+                filtered_item["protocol"] = item.get("name", "")
+                filtered_item["risk_score"] = item.get("mcap", 0.0)
+                filtered_item["audit_status"] = item.get("audit_note") or ""
+            try:
+                objects.append(model(**filtered_item))
+            except Exception as e:
+                reject(item, e)
+        return objects
+
+    return normalize
+
+
+# name -> (fixture, model, legacy normalizer, mapper)
+CASES = {
+    "pools": ("pools", YieldData, legacy_pools, DEFILLAMA_POOLS),
+    "risk_metrics": (
+        "protocols",
+        RiskMetric,
+        legacy_protocols(RiskMetric),
+        PROTOCOL_MAPPERS[RiskMetric],
+    ),
+    "risk_scores": (
+        "protocols",
+        RiskScore,
+        legacy_protocols(RiskScore),
+        PROTOCOL_MAPPERS[RiskScore],
+    ),
+}
+
+
+def _values(objects, model):
+    names = [f.attname for f in model._meta.concrete_fields if not f.primary_key]
+    return [tuple(getattr(obj, name) for name in names) for obj in objects]
+
+
+def _best(normalize, data, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        objects = normalize(data, lambda item, reason: None)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, objects
+
+
+class Command(BaseCommand):
+    help = (
+        "Time item -> model normalization on the benchmark fixtures: the "
+        "hand-written code ingest used before against the compiled row mappers, "
+        "and check that both build the same rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cases",
+            nargs="*",
+            choices=list(CASES),
+            help="Normalizations to compare (default: all)",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--show-source", action="store_true")
+        parser.add_argument("--output", help="Write results as JSON to this file")
+
+    def handle(self, *args, **options):
+        results = {}
+        for name in options["cases"] or CASES:
+            fixture, model, legacy, mapper = CASES[name]
+            data = json.loads(load_fixture_bytes(fixture))
+            if isinstance(data, dict):
+                data = data["data"]
+            mapper.build  # Compile outside the timed runs
+            if options["show_source"]:
+                self.stdout.write(mapper.source)
+            legacy_s, legacy_objects = _best(legacy, data, options["repeat"])
+            mapper_s, mapper_objects = _best(mapper.map, data, options["repeat"])
+
+            legacy_values = _values(legacy_objects, model)
+            mapper_values = _values(mapper_objects, model)
+            if legacy_values != mapper_values:
+                mismatched = sum(
+                    a != b for a, b in zip(legacy_values, mapper_values)
+                ) + abs(len(legacy_values) - len(mapper_values))
+                raise CommandError(f"{name}: {mismatched} rows differ from legacy")
+
+            rows = len(data)
+            results[name] = {
+                "rows": rows,
+                "legacy_us_per_row": legacy_s / rows * 1e6,
+                "mapper_us_per_row": mapper_s / rows * 1e6,
+                "speedup": legacy_s / mapper_s,
+            }
+            self.stdout.write(
+                f"{name:13} {rows:7} rows  "
+                f"legacy {results[name]['legacy_us_per_row']:6.2f} us/row  "
+                f"mapper {results[name]['mapper_us_per_row']:6.2f} us/row  "
+                f"x{results[name]['speedup']:.2f}"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from defi.generations import publish_generation, stage_generation
+from defi.models import YieldData
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def _load(url, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(url)
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "p50_ms": (_percentile(latencies, 0.50) or 0) * 1000,
+        "p99_ms": (_percentile(latencies, 0.99) or 0) * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec of the sync views under WSGI (gunicorn) with the "
+        "async views under ASGI (uvicorn), one worker each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--endpoints",
+            default="yield-data,risk-metrics,governance-data",
+            help="Comma-separated endpoint names under /api/",
+        )
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument(
+            "--threads", type=int, default=8, help="gunicorn threads for WSGI"
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Insert this many synthetic yield pools first (overwrites data)",
+        )
+        parser.add_argument("--output", help="Write results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            self._seed(options["seed"])
+
+        env = dict(os.environ, ALLOWED_HOSTS="127.0.0.1,localhost")
+        servers = {
+            "wsgi": (
+                [
+                    sys.executable,
+                    "-m",
+                    "gunicorn",
+                    "defi_backend.wsgi:application",
+                    "--workers",
+                    "1",
+                    "--threads",
+                    str(options["threads"]),
+                ],
+                "--bind",
+                "/api/",
+            ),
+            "asgi": (
+                [
+                    sys.executable,
+                    "-m",
+                    "uvicorn",
+                    "defi_backend.asgi:application",
+                    "--workers",
+                    "1",
+                    "--log-level",
+                    "warning",
+                ],
+                "--port",
+                "/api/async/",
+            ),
+        }
+        endpoints = [e for e in options["endpoints"].split(",") if e]
+        results = {}
+        for name, (command, port_flag, prefix) in servers.items():
+            port = _free_port()
+            bind = f"127.0.0.1:{port}" if port_flag == "--bind" else str(port)
+            process = subprocess.Popen(
+                command + [port_flag, bind],
+                cwd=settings.BASE_DIR,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                self._wait_for(port, process, name)
+                for endpoint in endpoints:
+                    url = f"http://127.0.0.1:{port}{prefix}{endpoint}/"
+                    stats = asyncio.run(
+                        _load(url, options["concurrency"], options["duration"])
+                    )
+                    results.setdefault(endpoint, {})[name] = stats
+                    self.stdout.write(
+                        f"{name:5} {endpoint:18} {stats['rps']:9.1f} req/s  "
+                        f"p50 {stats['p50_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms  "
+                        f"errors {stats['errors']}"
+                    )
+            finally:
+                process.terminate()
+                process.wait()
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def _wait_for(self, port, process, name):
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"{name} server exited (is it installed?)")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError(f"{name} server did not start on port {port}")
+
+    def _seed(self, rows):
+        rng = random.Random(0)
+        generation = stage_generation("yield_data")
+        YieldData.all_generations.all().delete()
+        YieldData.objects.bulk_create(
+            [
+                YieldData(
+                    chain=rng.choice(["Ethereum", "Arbitrum", "Base", "Solana"]),
+                    project=f"project-{rng.randrange(200)}",
+                    symbol=f"TKN{i}",
+                    tvlUsd=rng.lognormvariate(13, 2),
+                    apyBase=rng.uniform(0, 20),
+                    apy=rng.uniform(0, 40),
+                    pool=f"pool-{i}",
+                    generation=generation,
+                )
+                for i in range(rows)
+            ],
+            batch_size=1000,
+        )
+        publish_generation("yield_data", generation=generation)
+        self.stdout.write(f"Seeded {rows} yield pools")
@@ -0,0 +1,162 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from defi.db import apply_sqlite_profile
+
+SCHEMA = """
+CREATE TABLE pools (
+    id INTEGER PRIMARY KEY,
+    chain TEXT, project TEXT, symbol TEXT, pool TEXT,
+    tvlUsd REAL, apy REAL, apyBase REAL, predictions TEXT
+)
+"""
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _rows(count, rng):
+    predictions = json.dumps({"predictedClass": "Stable/Up", "binnedConfidence": 2})
+    return [
+        (
+            rng.choice(["Ethereum", "Arbitrum", "Base", "Solana"]),
+            f"project-{rng.randrange(300)}",
+            f"TKN{i}",
+            f"pool-{i}",
+            rng.lognormvariate(13, 2),
+            rng.uniform(0, 40),
+            rng.uniform(0, 20),
+            predictions,
+        )
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mixed read/write SQLite benchmark: readers page through a pools table "
+        "while a writer repeatedly replaces it, as fetch_yield_data does. "
+        "Runs once with SQLite defaults and once with settings.SQLITE_PROFILE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument("--output", help="Write results as JSON to this file")
+
+    def handle(self, *args, **options):
+        profiles = {
+            "default": {},
+            "tuned": settings.SQLITE_PROFILE or {"journal_mode": "WAL"},
+        }
+        results = {}
+        for name, profile in profiles.items():
+            stats = self._run(profile, options)
+            results[name] = stats
+            self.stdout.write(
+                f"{name:8} reads {stats['reads_per_sec']:9.1f}/s  "
+                f"p50 {stats['read_p50_ms']:7.2f} ms  "
+                f"p99 {stats['read_p99_ms']:8.2f} ms  "
+                f"max {stats['read_max_ms']:8.2f} ms  "
+                f"locked {stats['read_errors']:5}  "
+                f"ingests {stats['ingests']} ({stats['ingest_mean_ms']:.0f} ms avg)"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def _connect(self, path, profile, read_only=False):
+        # Python's sqlite3 waits up to 5s on a lock by default, like Django
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        apply_sqlite_profile(conn.cursor(), profile, read_only)
+        return conn
+
+    def _run(self, profile, options):
+        rng = random.Random(0)
+        rows = _rows(options["rows"], rng)
+        fd, path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        try:
+            writer = self._connect(path, profile)
+            writer.execute(SCHEMA)
+            writer.executemany(
+                "INSERT INTO pools (chain, project, symbol, pool, tvlUsd, apy, "
+                "apyBase, predictions) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+            stop = threading.Event()
+            latencies, errors, ingest_times = [], [0], []
+            lock = threading.Lock()
+
+            def ingest():
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    writer.execute("BEGIN IMMEDIATE")
+                    writer.execute("DELETE FROM pools")
+                    writer.executemany(
+                        "INSERT INTO pools (chain, project, symbol, pool, tvlUsd, "
+                        "apy, apyBase, predictions) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    writer.execute("COMMIT")
+                    ingest_times.append(time.perf_counter() - start)
+
+            def read():
+                conn = self._connect(path, profile, read_only=True)
+                local_rng = random.Random()
+                local = []
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        conn.execute("SELECT COUNT(*) FROM pools").fetchone()
+                        conn.execute(
+                            "SELECT * FROM pools ORDER BY tvlUsd DESC LIMIT 10 OFFSET ?",
+                            (local_rng.randrange(0, 500) * 10,),
+                        ).fetchall()
+                    except sqlite3.OperationalError:
+                        with lock:
+                            errors[0] += 1
+                        continue
+                    local.append(time.perf_counter() - start)
+                conn.close()
+                with lock:
+                    latencies.extend(local)
+
+            threads = [threading.Thread(target=ingest)] + [
+                threading.Thread(target=read) for _ in range(options["readers"])
+            ]
+            for thread in threads:
+                thread.start()
+            time.sleep(options["duration"])
+            stop.set()
+            for thread in threads:
+                thread.join()
+            writer.close()
+        finally:
+            for suffix in ("", "-wal", "-shm", "-journal"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+        return {
+            "profile": profile,
+            "reads": len(latencies),
+            "reads_per_sec": len(latencies) / options["duration"],
+            "read_errors": errors[0],
+            "read_p50_ms": _percentile(latencies, 0.50) * 1000,
+            "read_p99_ms": _percentile(latencies, 0.99) * 1000,
+            "read_max_ms": max(latencies, default=0) * 1000,
+            "ingests": len(ingest_times),
+            "ingest_mean_ms": sum(ingest_times) / max(1, len(ingest_times)) * 1000,
+        }
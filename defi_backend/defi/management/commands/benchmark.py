@@ -0,0 +1,237 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from defi.benchmarks.fixtures import FIXTURES, fixture_source
+from defi.benchmarks.replay import FaultProfile, ReplayServer, add_fault_arguments
+from defi.benchmarks.suite import (
+    FETCHES,
+    INGESTS,
+    READS,
+    compare,
+    read_paths,
+    run_fetch,
+    run_ingest,
+    run_read,
+)
+from defi.parallel import shutdown_executor
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark ingest throughput and API read latency against recorded "
+        "upstream fixtures in a throwaway database. Results can be saved as "
+        "JSON and compared with an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ingest",
+            nargs="*",
+            choices=list(INGESTS),
+            help="Ingest benchmarks to run (default: all)",
+        )
+        parser.add_argument(
+            "--reads",
+            nargs="*",
+            choices=list(READS),
+            help="Read benchmarks to run (default: all)",
+        )
+        parser.add_argument(
+            "--fetch",
+            nargs="*",
+            choices=list(FETCHES),
+            help="Fetch benchmarks against the replay server (no names: all)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            nargs="+",
+            help="Run the ingest benchmarks once per INGEST_WORKERS value",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--fetch-requests", type=int, default=5)
+        add_fault_arguments(parser)
+        parser.add_argument("--output", help="Write results as JSON to this file")
+        parser.add_argument("--compare", help="Earlier results JSON to compare with")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        workdir = tempfile.mkdtemp(prefix="defi-bench-")
+        try:
+            results = self._run(workdir, options)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+        if baseline:
+            self._compare(baseline, results)
+
+    def _run(self, workdir, options):
+        results = {
+            "meta": {
+                "commit": _git("rev-parse", "HEAD"),
+                "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "fixtures": {name: fixture_source(name) for name in FIXTURES},
+            },
+            "ingest": {},
+            "reads": {},
+            "fetch": {},
+        }
+        isolated = override_settings(
+            ALLOWED_HOSTS=["testserver"],
+            YIELD_POOL_LIMIT=0,
+            SNAPSHOT_DIR=os.path.join(workdir, "snapshots"),
+            PAYLOAD_ARCHIVE_DIR=os.path.join(workdir, "payloads"),
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "TIMEOUT": None,
+                }
+            },
+        )
+        default = connections["default"]
+        default.settings_dict["TEST"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+        old_name = default.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        # The read alias follows the router, so point it at the same file
+        read_aliases = [
+            alias
+            for alias in connections
+            if alias != "default" and connections[alias].vendor == default.vendor
+        ]
+        previous = {}
+        for alias in read_aliases:
+            connections[alias].close()
+            previous[alias] = connections[alias].settings_dict["NAME"]
+            connections[alias].settings_dict["NAME"] = default.settings_dict["NAME"]
+        try:
+            with isolated:
+                self._benchmark(results, options)
+        finally:
+            for alias, name in previous.items():
+                connections[alias].close()
+                connections[alias].settings_dict["NAME"] = name
+            default.creation.destroy_test_db(old_name, verbosity=0)
+        return results
+
+    def _benchmark(self, results, options):
+        for name in INGESTS if options["ingest"] is None else options["ingest"]:
+            for workers in options["workers"] or [None]:
+                self._benchmark_ingest(results, name, workers, options)
+
+        paths = read_paths()
+        for name in READS if options["reads"] is None else options["reads"]:
+            stats = run_read(paths[name], iterations=options["iterations"])
+            results["reads"][name] = stats
+            self.stdout.write(
+                f"read   {name:26} {stats['status']}  "
+                f"p50 {stats['p50_ms']:8.2f} ms  "
+                f"p99 {stats['p99_ms']:8.2f} ms  "
+                f"{stats['queries_per_request']:5.1f} queries  "
+                f"{stats['bytes']:9} bytes"
+            )
+
+        if options["fetch"] is not None:
+            self._benchmark_fetch(results, options)
+
+    def _benchmark_ingest(self, results, name, workers, options):
+        if workers is None:
+            stats = run_ingest(name, repeat=options["repeat"])
+        else:
+            with override_settings(INGEST_WORKERS=workers):
+                try:
+                    stats = run_ingest(name, repeat=options["repeat"])
+                finally:
+                    shutdown_executor()
+            stats["workers"] = workers
+            name = f"{name}@{workers}"
+        results["ingest"][name] = stats
+        self.stdout.write(
+            f"ingest {name:18} {stats['rows']:6} rows  "
+            f"parse {stats['parse_s'] * 1000:8.1f} ms  "
+            f"ingest {stats['ingest_s'] * 1000:9.1f} ms  "
+            f"{stats['rows_per_s'] or 0:9.0f} rows/s  "
+            f"{stats['queries']:6.0f} queries  "
+            f"peak {stats['peak_bytes'] / 2**20:7.1f} MiB  "
+            + " ".join(
+                f"{stage} {seconds * 1000:.0f}ms"
+                for stage, seconds in stats["stages"].items()
+                if seconds is not None
+            )
+        )
+
+    def _benchmark_fetch(self, results, options):
+        server = ReplayServer(("127.0.0.1", 0), FaultProfile.from_options(options))
+        server.start()
+        results["meta"]["faults"] = {
+            key: options[key]
+            for key in (
+                "latency",
+                "jitter",
+                "bandwidth",
+                "error_429",
+                "retry_after",
+                "error_5xx",
+                "truncate",
+                "seed",
+            )
+        }
+        try:
+            with override_settings(**server.base_url_settings()):
+                for name in options["fetch"] or FETCHES:
+                    stats = run_fetch(FETCHES[name], requests=options["fetch_requests"])
+                    results["fetch"][name] = stats
+                    statuses = " ".join(
+                        f"{status}x{count}"
+                        for status, count in sorted(stats["statuses"].items())
+                    )
+                    self.stdout.write(
+                        f"fetch  {name:26} p50 {stats['p50_ms']:9.1f} ms  "
+                        f"p99 {stats['p99_ms']:9.1f} ms  "
+                        f"max {stats['max_ms']:9.1f} ms  {statuses}"
+                    )
+        finally:
+            server.shutdown()
+            server.server_close()
+        results["upstream"] = dict(server.stats)
+
+    def _compare(self, baseline, results):
+        commit = (baseline.get("meta", {}).get("commit") or "?")[:10]
+        self.stdout.write(f"\nCompared with {commit}:")
+        for section, name, metric, old, new in compare(baseline, results):
+            change = f"{(new - old) / old * 100:+7.1f}%" if old else "    n/a"
+            self.stdout.write(
+                f"{section:6} {name:26} {metric:20} "
+                f"{old:14.3f} -> {new:14.3f}  {change}"
+            )
@@ -0,0 +1,40 @@
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from defi.benchmarks.fixtures import FIXTURES, fixture_path, save_fixture_bytes
+from defi.upstream import upstream_url
+from defi.views import GOVERNANCE_QUERY
+
+
+class Command(BaseCommand):
+    help = "Record live upstream responses as benchmark fixtures."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "names",
+            nargs="*",
+            help=f"Fixtures to record (default: all of {list(FIXTURES)})",
+        )
+
+    def handle(self, *args, **options):
+        for name in options["names"] or FIXTURES:
+            url = upstream_url(name)
+            try:
+                if name == "snapshot_proposals":
+                    response = requests.post(
+                        url, json={"query": GOVERNANCE_QUERY}, timeout=60
+                    )
+                else:
+                    response = requests.get(
+                        url,
+                        headers={"x-cg-api-key": settings.COINGECKO_API_KEY},
+                        timeout=60,
+                    )
+                response.raise_for_status()
+            except requests.RequestException as e:
+                self.stderr.write(f"{name}: failed ({e})")
+                continue
+            save_fixture_bytes(name, response.content)
+            self.stdout.write(
+                f"{name}: {len(response.content)} bytes -> {fixture_path(name)}"
+            )
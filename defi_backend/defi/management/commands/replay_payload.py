@@ -0,0 +1,86 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from defi.archive import last_ingested, load_payload, mark_ingested
+from defi.ingest import DATASET_INGESTERS
+from defi.models import RawPayload
+from defi.telemetry import ingest_run
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-ingest archived upstream payloads without calling the upstream "
+        "APIs, e.g. to rebuild tables after a mapping change. Replays each "
+        "dataset's last ingested payload unless --sha picks another one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "datasets",
+            nargs="*",
+            help=f"Datasets to replay: {', '.join(DATASET_INGESTERS)} (default: all)",
+        )
+        parser.add_argument("--sha", help="Replay the payload with this hash prefix")
+        parser.add_argument(
+            "--list", action="store_true", help="List archived payloads instead"
+        )
+
+    def handle(self, *args, **options):
+        datasets = options["datasets"] or list(DATASET_INGESTERS)
+        unknown = set(datasets) - set(DATASET_INGESTERS)
+        if unknown:
+            raise CommandError(f"Unknown datasets: {', '.join(sorted(unknown))}")
+        if options["list"]:
+            self._list(datasets)
+            return
+        if options["sha"] and len(datasets) != 1:
+            raise CommandError("--sha needs exactly one dataset")
+
+        for dataset in datasets:
+            if options["sha"]:
+                matches = RawPayload.objects.filter(
+                    dataset=dataset, sha256__startswith=options["sha"]
+                )
+                if len(matches) != 1:
+                    raise CommandError(
+                        f"{len(matches)} {dataset} payloads match {options['sha']}"
+                    )
+                payload = matches[0]
+            else:
+                payload = last_ingested(dataset)
+                if payload is None:
+                    self.stdout.write(f"{dataset}: nothing archived, skipped")
+                    continue
+            self._replay(dataset, payload)
+
+    def _replay(self, dataset, payload):
+        with ingest_run(dataset, trigger="replay") as run:
+            try:
+                with run.stage("download"):
+                    body = load_payload(payload)
+            except OSError as e:
+                run.fail(e)
+                raise CommandError(f"{payload}: archived body unreadable: {e}")
+            run.downloaded(len(body))
+            with run.stage("parse"):
+                data = json.loads(body)
+            DATASET_INGESTERS[dataset](data, run)
+        if run.error:
+            raise CommandError(f"{dataset}: replay failed: {run.error}")
+        mark_ingested(payload)
+        self.stdout.write(
+            f"{dataset}: replayed {payload.sha256[:12]} "
+            f"({run.rows_written} rows, {run.rows_rejected} rejected)"
+        )
+
+    def _list(self, datasets):
+        payloads = RawPayload.objects.filter(dataset__in=datasets).order_by(
+            "dataset", "-last_seen_at"
+        )
+        for payload in payloads:
+            current = "*" if payload == last_ingested(payload.dataset) else " "
+            self.stdout.write(
+                f"{current} {payload.dataset:16} {payload.sha256[:12]}  "
+                f"{payload.size:10} bytes  seen {payload.fetch_count:4}x  "
+                f"{payload.first_seen_at:%Y-%m-%d %H:%M} .. "
+                f"{payload.last_seen_at:%Y-%m-%d %H:%M}"
+            )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from defi.benchmarks.replay import FaultProfile, ReplayServer, add_fault_arguments
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve recorded upstream payloads locally, with optional latency, "
+        "bandwidth limits, 429s, 5xx errors and truncated bodies. Point the "
+        "*_URL upstream settings at it to run ingestion offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        add_fault_arguments(parser)
+
+    def handle(self, *args, **options):
+        server = ReplayServer(
+            (options["host"], options["port"]),
+            FaultProfile.from_options(options),
+            verbose=options["verbosity"] > 1,
+        )
+        self.stdout.write(f"Replaying upstream fixtures on {server.base_url}")
+        for setting, url in server.base_url_settings().items():
+            self.stdout.write(f"  export {setting}={url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        for key, count in sorted(server.stats.items()):
+            self.stdout.write(f"{key:32} {count}")
@@ -0,0 +1,227 @@
+"""
+Declarative upstream item -> model row mapping.
+
+A ``RowMapper`` describes how one upstream source fills one model: which key
+(or dotted path) feeds each field, the default when it is missing, and how the
+value is coerced. Anything not spelled out is inferred from the model field:
+
+* the source key is the field name (when ``passthrough`` is set),
+* the default is the field's default, also used for nulls on NOT NULL columns,
+* numbers, booleans and strings are coerced to the field's Python type,
+* NOT NULL fields without a default are required.
+
+The spec is compiled once into a plain Python function that builds the model
+instance with positional arguments, which skips Django's per-field keyword
+handling. Items that fail (missing required value, uncoercible type, not an
+object) are rejected one by one without aborting the batch.
+"""
+
+from django.db.models import NOT_PROVIDED
+from .models import GovernanceProposal, RiskMetric, RiskScore, YieldData
+
+_MISSING = object()
+
+
+class MissingField(ValueError):
+    pass
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.lower() in ("true", "false", "1", "0"):
+        return value.lower() in ("true", "1")
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+# Model field type -> (Python type, coercion) applied to non-null values
+COERCIONS = {
+    "FloatField": (float, float),
+    "IntegerField": (int, int),
+    "BigIntegerField": (int, int),
+    "PositiveIntegerField": (int, int),
+    "PositiveBigIntegerField": (int, int),
+    "BooleanField": (bool, to_bool),
+    "CharField": (str, str),
+    "TextField": (str, str),
+}
+
+
+def _generated(field):
+    """
+    Fields the database, ``pre_save`` or the ingest (the dataset generation)
+    fill in, never read from the item.
+    """
+    return (
+        field.primary_key
+        or getattr(field, "auto_now", False)
+        or getattr(field, "auto_now_add", False)
+        or field.name == "generation"
+    )
+
+
+class Field:
+    def __init__(self, source=None, default=NOT_PROVIDED, coerce=None, required=None):
+        self.source = source
+        self.default = default
+        self.coerce = coerce  # None infers from the model field, False disables
+        self.required = required  # None infers from the model field
+
+
+class RowMapper:
+    def __init__(self, model, fields=None, passthrough=False):
+        self.model = model
+        self.fields = fields or {}
+        self.passthrough = passthrough
+        self._build = None
+        self.source = None
+
+    def __getstate__(self):
+        # Compiled functions don't pickle; workers recompile on first use
+        return {**self.__dict__, "_build": None, "source": None}
+
+    @property
+    def build(self):
+        """The compiled ``item -> model instance`` function."""
+        if self._build is None:
+            self._build = self._compile()
+        return self._build
+
+    def map(self, items, on_reject):
+        """Build instances for ``items``; ``on_reject(item, reason)`` for failures."""
+        build = self.build
+        objects = []
+        append = objects.append
+        for item in items:
+            try:
+                append(build(item))
+            except Exception as e:
+                on_reject(item, e if isinstance(item, dict) else "not an object")
+        return objects
+
+    def _compile(self):
+        namespace = {
+            "_Model": self.model,
+            "_M": _MISSING,
+            "_Missing": MissingField,
+        }
+        lines = ["def build(item):", "    get = item.get"]
+        args = []
+        for i, field in enumerate(self.model._meta.concrete_fields):
+            spec = self.fields.get(field.name)
+            if spec is None and self.passthrough:
+                spec = Field()
+            if spec is None or _generated(field):
+                args.append(self._model_default(field, i, namespace))
+                continue
+            args.append(self._compile_field(field, spec, i, lines, namespace))
+        lines.append(f"    return _Model({', '.join(args)})")
+        self.source = "\n".join(lines) + "\n"
+        code = compile(self.source, f"<RowMapper {self.model.__name__}>", "exec")
+        exec(code, namespace)
+        return namespace["build"]
+
+    def _model_default(self, field, i, namespace):
+        if _generated(field) or not field.has_default():
+            return "None"  # Filled in by the database or pre_save
+        if callable(field.default):
+            namespace[f"_d{i}"] = field.default
+            return f"_d{i}()"
+        namespace[f"_d{i}"] = field.default
+        return f"_d{i}"
+
+    def _compile_field(self, field, spec, i, lines, namespace):
+        source = spec.source or field.name
+        path = source.split(".")
+        value = f"v{i}"
+
+        if spec.default is not NOT_PROVIDED:
+            default = spec.default
+            if callable(default):
+                namespace[f"_d{i}"] = default
+                default_expr = f"_d{i}()"
+            else:
+                namespace[f"_d{i}"] = default
+                default_expr = f"_d{i}"
+        else:
+            default_expr = self._model_default(field, i, namespace)
+
+        required = spec.required
+        if required is None:
+            required = not field.null and default_expr == "None"
+
+        coercion = None
+        if spec.coerce is None:
+            coercion = COERCIONS.get(field.get_internal_type())
+        elif spec.coerce is not False:
+            coercion = (object, spec.coerce)
+
+        # Plain nullable copy: inline lookup, no statements
+        if (
+            len(path) == 1
+            and coercion is None
+            and not required
+            and field.null
+            and default_expr == "None"
+        ):
+            return f"get({path[0]!r})"
+
+        lines.append(f"    {value} = get({path[0]!r}, _M)")
+        for key in path[1:]:
+            lines.append(f"    if {value} is not _M and {value} is not None:")
+            lines.append(f"        {value} = {value}.get({key!r}, _M)")
+
+        if required or not field.null:
+            missing = f"{value} is _M or {value} is None"
+        else:
+            missing = f"{value} is _M"
+        if required:
+            lines.append(f"    if {missing}:")
+            lines.append(f"        raise _Missing('missing {source}')")
+            keyword = "if"
+        else:
+            lines.append(f"    if {missing}:")
+            lines.append(f"        {value} = {default_expr}")
+            keyword = "elif"
+
+        if coercion is not None:
+            python_type, function = coercion
+            namespace[f"_c{i}"] = function
+            if python_type is object:
+                check = f"{value} is not None"
+            else:
+                namespace[f"_t{i}"] = python_type
+                check = f"{value} is not None and {value}.__class__ is not _t{i}"
+            lines.append(f"    {keyword} {check}:")
+            lines.append(f"        {value} = _c{i}({value})")
+        return value
+
+
+# One spec per upstream source and model
+DEFILLAMA_POOLS = RowMapper(YieldData, passthrough=True)
+DEFILLAMA_PROTOCOL_METRICS = RowMapper(RiskMetric, passthrough=True)
+DEFILLAMA_PROTOCOL_SCORES = RowMapper(
+    RiskScore,
+    {
+        "protocol": Field("name"),
+        "risk_score": Field("mcap", default=0.0),
+        "audit_status": Field("audit_note"),
+    },
+)
+SNAPSHOT_PROPOSALS = RowMapper(
+    GovernanceProposal,
+    {
+        "protocol": Field("space.id", required=True),
+        "proposal_id": Field("id", required=True),
+        "title": Field("title", required=True),
+        "status": Field("state", required=True),
+    },
+)
+
+# Mapper used by ingest_dataset for each model fed from DeFiLlama /protocols
+PROTOCOL_MAPPERS = {
+    RiskMetric: DEFILLAMA_PROTOCOL_METRICS,
+    RiskScore: DEFILLAMA_PROTOCOL_SCORES,
+}
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.5 on 2026-10-19 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("defi", "0017_alter_riskscore_risk_score"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DatasetGeneration",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("dataset", models.CharField(max_length=50, unique=True)),
+                ("generation", models.PositiveBigIntegerField(default=0)),
+                ("diff", models.JSONField(default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.5 on 2026-10-19 07:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("defi", "0018_datasetgeneration"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="riskmetric",
+            name="slug",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=255, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.5 on 2026-10-19 08:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("defi", "0019_riskmetric_slug_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("dataset", models.CharField(max_length=50)),
+                ("trigger", models.CharField(max_length=20)),
+                ("status", models.CharField(max_length=10)),
+                ("error", models.TextField(blank=True, default="")),
+                ("generation", models.PositiveBigIntegerField(blank=True, null=True)),
+                ("started_at", models.DateTimeField(db_index=True)),
+                ("download_bytes", models.BigIntegerField(blank=True, null=True)),
+                ("download_seconds", models.FloatField(blank=True, null=True)),
+                ("parse_seconds", models.FloatField(blank=True, null=True)),
+                ("normalize_seconds", models.FloatField(blank=True, null=True)),
+                ("write_seconds", models.FloatField(blank=True, null=True)),
+                ("publish_seconds", models.FloatField(blank=True, null=True)),
+                ("total_seconds", models.FloatField()),
+                ("rows_received", models.PositiveIntegerField(default=0)),
+                ("rows_written", models.PositiveIntegerField(default=0)),
+                ("rows_rejected", models.PositiveIntegerField(default=0)),
+                ("rows_per_second", models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["dataset", "-started_at"],
+                        name="defi_ingest_dataset_7932e3_idx",
+                    )
+                ],
+            },
+        ),
+    ]
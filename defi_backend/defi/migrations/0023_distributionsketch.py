@@ -0,0 +1,49 @@
+# Generated by Django 5.1.5 on 2026-10-19 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("defi", "0022_dashboardsummary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DistributionSketch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("metric", models.CharField(max_length=50)),
+                ("dimension", models.CharField(max_length=50)),
+                ("key", models.CharField(max_length=200)),
+                ("period", models.CharField(max_length=10)),
+                ("generation", models.PositiveBigIntegerField()),
+                ("count", models.PositiveBigIntegerField()),
+                ("data", models.JSONField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["period", "metric", "dimension"],
+                        name="defi_distri_period_1ead33_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("metric", "dimension", "key", "period"),
+                        name="unique_distribution_sketch",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("defi", "0023_distributionsketch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnomalyFlag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("dataset", models.CharField(max_length=50)),
+                ("generation", models.PositiveBigIntegerField()),
+                ("kind", models.CharField(max_length=30)),
+                ("key", models.CharField(db_index=True, max_length=255)),
+                ("label", models.CharField(blank=True, default="", max_length=255)),
+                ("metric", models.CharField(max_length=50)),
+                ("value", models.FloatField()),
+                ("baseline", models.FloatField(blank=True, null=True)),
+                ("change", models.FloatField(blank=True, null=True)),
+                ("score", models.FloatField()),
+                ("severity", models.FloatField()),
+                ("details", models.JSONField(blank=True, default=dict)),
+                ("detected_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["dataset", "generation", "-severity"],
+                        name="defi_anomal_dataset_3adda2_idx",
+                    ),
+                    models.Index(
+                        fields=["kind", "-detected_at"],
+                        name="defi_anomal_kind_c8ff7f_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="ProtocolHistory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("protocol", models.CharField(max_length=255)),
+                ("date", models.DateField(db_index=True)),
+                ("tvl", models.FloatField(blank=True, null=True)),
+                ("mcap", models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("protocol", "date"), name="unique_protocol_day"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="YieldHistory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pool", models.CharField(max_length=200)),
+                ("date", models.DateField(db_index=True)),
+                ("tvlUsd", models.FloatField(blank=True, null=True)),
+                ("apy", models.FloatField(blank=True, null=True)),
+                ("apyBase", models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("pool", "date"), name="unique_pool_day"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.5 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("defi", "0024_history_anomalyflag"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datasetgeneration",
+            name="compacted_through",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="RowChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("dataset", models.CharField(max_length=50)),
+                ("key", models.CharField(max_length=255)),
+                ("generation", models.PositiveBigIntegerField()),
+                ("created_generation", models.PositiveBigIntegerField()),
+                ("deleted", models.BooleanField(default=False)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["dataset", "generation"],
+                        name="defi_rowcha_dataset_55f5dd_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("dataset", "key"), name="unique_dataset_row_key"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.5 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+DATASET_MODELS = {
+    "yield_data": "YieldData",
+    "governance_data": "GovernanceProposal",
+    "risk_metrics": "RiskMetric",
+    "risk_scores": "RiskScore",
+}
+
+
+def tag_existing_rows(apps, schema_editor):
+    """Existing rows become the published generation of their dataset."""
+    DatasetGeneration = apps.get_model("defi", "DatasetGeneration")
+    for dataset, model_name in DATASET_MODELS.items():
+        state, _ = DatasetGeneration.objects.get_or_create(dataset=dataset)
+        state.allocated = state.generation
+        state.save(update_fields=["allocated"])
+        model = apps.get_model("defi", model_name)
+        model._base_manager.update(generation=state.generation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("defi", "0025_rowchange"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datasetgeneration",
+            name="allocated",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="governanceproposal",
+            name="generation",
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name="riskmetric",
+            name="generation",
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name="riskscore",
+            name="generation",
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name="yielddata",
+            name="generation",
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(tag_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("defi", "0026_dataset_row_generations"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BackfillCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("job", models.CharField(max_length=50)),
+                ("key", models.CharField(max_length=255)),
+                ("status", models.CharField(max_length=10)),
+                ("rows", models.PositiveIntegerField(default=0)),
+                ("through", models.DateField(blank=True, null=True)),
+                ("error", models.TextField(blank=True, default="")),
+                ("updated_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["job", "status"], name="defi_backfi_job_311066_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("job", "key"), name="unique_backfill_key"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -2,6 +2,24 @@
 from django.db import models
 
 
+class PublishedManager(models.Manager):
+    """Rows of the dataset's published generation only (see defi.generations).
+
+    The generation is looked up in a subquery, so each query reads one
+    complete generation even while the next one is being written.
+    """
+
+    def __init__(self, dataset):
+        super().__init__()
+        self.dataset = dataset
+
+    def get_queryset(self):
+        published = DatasetGeneration.objects.filter(dataset=self.dataset).values(
+            "generation"
+        )[:1]
+        return super().get_queryset().filter(generation=models.Subquery(published))
+
+
 # Existing Models (Do Not Modify)
 class YieldData(models.Model):
     chain = models.CharField(max_length=100)
@@ -35,6 +53,10 @@ class YieldData(models.Model):
     volumeUsd7d = models.FloatField(null=True, blank=True)
     apyBaseInception = models.FloatField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
+    generation = models.PositiveBigIntegerField(default=0, db_index=True)
+
+    objects = PublishedManager("yield_data")
+    all_generations = models.Manager()
 
     def __str__(self):
         return f"{self.project} - {self.symbol}"
@@ -49,6 +71,10 @@ class GovernanceProposal(models.Model):
     against_votes = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    generation = models.PositiveBigIntegerField(default=0, db_index=True)
+
+    objects = PublishedManager("governance_data")
+    all_generations = models.Manager()
 
     def __str__(self):
         return f"{self.protocol} - {self.proposal_id}"
@@ -72,7 +98,7 @@ class RiskMetric(models.Model):
     twitter = models.CharField(max_length=255, null=True, blank=True)
     misrepresentedTokens = models.BooleanField(default=False)
     hallmarks = models.JSONField(default=list, null=True, blank=True)
-    slug = models.CharField(max_length=255, null=True, blank=True)
+    slug = models.CharField(max_length=255, null=True, blank=True, db_index=True)
     chainTvls = models.JSONField(default=dict, null=True, blank=True)
     change_1h = models.FloatField(null=True, blank=True)
     change_1d = models.FloatField(null=True, blank=True)
@@ -80,6 +106,10 @@ class RiskMetric(models.Model):
     tokenBreakdowns = models.JSONField(default=dict, null=True, blank=True)
     mcap = models.FloatField(null=True, blank=True)
     # Add other fields as needed
+    generation = models.PositiveBigIntegerField(default=0, db_index=True)
+
+    objects = PublishedManager("risk_metrics")
+    all_generations = models.Manager()
 
     def __str__(self):
         return self.name or "Unnamed Risk Metric"
@@ -98,6 +128,10 @@ class RiskScore(models.Model):
     risk_score = models.FloatField(null=True, blank=True)
     audit_status = models.CharField(max_length=50, default="")  # Allow empty strings
     updated_at = models.DateTimeField(auto_now=True)
+    generation = models.PositiveBigIntegerField(default=0, db_index=True)
+
+    objects = PublishedManager("risk_scores")
+    all_generations = models.Manager()
 
 
 class TechnicalData(models.Model):
@@ -105,3 +139,215 @@ class TechnicalData(models.Model):
     wallet_transactions = models.JSONField(default=list)
     tenderly_simulation = models.JSONField(default=dict)
     updated_at = models.DateTimeField(auto_now=True)
+
+
+class DatasetGeneration(models.Model):
+    dataset = models.CharField(max_length=50, unique=True)
+    generation = models.PositiveBigIntegerField(default=0)  # Published
+    allocated = models.PositiveBigIntegerField(default=0)  # Last handed to an ingest
+    diff = models.JSONField(default=dict)  # Changes introduced by this generation
+    # Deletions up to this generation were compacted away (see defi.delta)
+    compacted_through = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.dataset} @ {self.generation}"
+
+
+class CacheGeneration(models.Model):
+    """Write counter of a two-tier cache whose shared tier can't incr atomically."""
+
+    name = models.CharField(max_length=100, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
+
+
+class RowChange(models.Model):
+    """Latest change of one row of a keyed dataset, for ?since= delta sync."""
+
+    dataset = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)  # Value of the dataset's key field
+    generation = models.PositiveBigIntegerField()  # Last changed in
+    created_generation = models.PositiveBigIntegerField()  # Inserted in
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dataset", "key"], name="unique_dataset_row_key"
+            )
+        ]
+        indexes = [models.Index(fields=["dataset", "generation"])]
+
+    def __str__(self):
+        return f"{self.dataset} {self.key} @ {self.generation}"
+
+
+class IngestRun(models.Model):
+    """Stage timings and row counts of one ingest of an upstream payload."""
+
+    dataset = models.CharField(max_length=50)
+    trigger = models.CharField(max_length=20)  # "fetch", "async-fetch" or "direct"
+    status = models.CharField(max_length=10)  # "ok", "unchanged" or "failed"
+    error = models.TextField(blank=True, default="")
+    generation = models.PositiveBigIntegerField(null=True, blank=True)
+    started_at = models.DateTimeField(db_index=True)
+    download_bytes = models.BigIntegerField(null=True, blank=True)
+    download_seconds = models.FloatField(null=True, blank=True)
+    parse_seconds = models.FloatField(null=True, blank=True)
+    normalize_seconds = models.FloatField(null=True, blank=True)
+    write_seconds = models.FloatField(null=True, blank=True)
+    publish_seconds = models.FloatField(null=True, blank=True)
+    total_seconds = models.FloatField()
+    rows_received = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    rows_rejected = models.PositiveIntegerField(default=0)
+    rows_per_second = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["dataset", "-started_at"])]
+
+    def __str__(self):
+        return f"{self.dataset} {self.status} @ {self.started_at}"
+
+
+class DashboardSummary(models.Model):
+    """One precomputed section of /api/summary/, refreshed at ingest."""
+
+    section = models.CharField(max_length=50, unique=True)
+    dataset = models.CharField(max_length=50)
+    generation = models.PositiveBigIntegerField()
+    data = models.JSONField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.section} @ {self.dataset} {self.generation}"
+
+
+class DistributionSketch(models.Model):
+    """Quantile sketch of one metric for one group of pools (see defi.sketches)."""
+
+    metric = models.CharField(max_length=50)
+    dimension = models.CharField(max_length=50)  # "all", "chain" or "project"
+    key = models.CharField(max_length=200)
+    period = models.CharField(max_length=10)  # "current" or a YYYY-MM-DD day
+    generation = models.PositiveBigIntegerField()
+    count = models.PositiveBigIntegerField()
+    data = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["metric", "dimension", "key", "period"],
+                name="unique_distribution_sketch",
+            )
+        ]
+        indexes = [models.Index(fields=["period", "metric", "dimension"])]
+
+    def __str__(self):
+        return f"{self.metric} by {self.dimension}={self.key} ({self.period})"
+
+
+class YieldHistory(models.Model):
+    """Daily metrics of one yield pool (see defi.history)."""
+
+    pool = models.CharField(max_length=200)
+    date = models.DateField(db_index=True)
+    tvlUsd = models.FloatField(null=True, blank=True)
+    apy = models.FloatField(null=True, blank=True)
+    apyBase = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["pool", "date"], name="unique_pool_day")
+        ]
+
+
+class ProtocolHistory(models.Model):
+    """Daily metrics of one protocol, by slug (see defi.history)."""
+
+    protocol = models.CharField(max_length=255)
+    date = models.DateField(db_index=True)
+    tvl = models.FloatField(null=True, blank=True)
+    mcap = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["protocol", "date"], name="unique_protocol_day"
+            )
+        ]
+
+
+class BackfillCheckpoint(models.Model):
+    """How far a history backfill job got for one key (see defi.backfill)."""
+
+    job = models.CharField(max_length=50)  # e.g. "yield_history"
+    key = models.CharField(max_length=255)  # pool id or slug
+    status = models.CharField(max_length=10)  # "done" or "failed"
+    rows = models.PositiveIntegerField(default=0)  # Rows stored by the last run
+    through = models.DateField(null=True, blank=True)  # Last day stored
+    error = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["job", "key"], name="unique_backfill_key")
+        ]
+        indexes = [models.Index(fields=["job", "status"])]
+
+    def __str__(self):
+        return f"{self.job} {self.key} {self.status}"
+
+
+class AnomalyFlag(models.Model):
+    """A series whose latest value deviates from its recent history."""
+
+    dataset = models.CharField(max_length=50)  # "yield_data" or "risk_metrics"
+    generation = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=30)  # e.g. "tvl_drain", "apy_spike"
+    key = models.CharField(max_length=255, db_index=True)  # pool id or slug
+    label = models.CharField(max_length=255, blank=True, default="")
+    metric = models.CharField(max_length=50)
+    value = models.FloatField()
+    baseline = models.FloatField(null=True, blank=True)  # Rolling median
+    change = models.FloatField(null=True, blank=True)  # Relative to baseline
+    score = models.FloatField()  # Robust (median/MAD) z-score
+    severity = models.FloatField()  # abs(score), for ordering
+    details = models.JSONField(default=dict, blank=True)
+    detected_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["dataset", "generation", "-severity"]),
+            models.Index(fields=["kind", "-detected_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.key} ({self.score:+.1f})"
+
+
+class RawPayload(models.Model):
+    """An upstream response body kept in the payload archive, by content hash."""
+
+    dataset = models.CharField(max_length=50)
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField()
+    source = models.URLField(max_length=500, blank=True, default="")
+    first_seen_at = models.DateTimeField()
+    last_seen_at = models.DateTimeField(db_index=True)
+    fetch_count = models.PositiveIntegerField(default=1)
+    ingested_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dataset", "sha256"], name="unique_dataset_payload"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.dataset} {self.sha256[:12]}"
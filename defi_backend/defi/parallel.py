@@ -0,0 +1,102 @@
+"""
+Optional process-pool normalization of large upstream payloads.
+
+Building model instances from 20k decoded items is pure Python and holds the
+GIL. With ``INGEST_WORKERS`` above 1, payloads of at least
+``INGEST_PARALLEL_MIN_ROWS`` items are split into ``INGEST_CHUNK_SIZE`` chunks
+that worker processes run through the row mapper. Chunks come back in order,
+so the ingest's single writer can store each one as soon as it arrives while
+the next is still being built. Workers never touch the database.
+
+If the pool breaks (a worker is killed, say), the remaining chunks are
+normalized in-process and the pool is recreated on the next ingest.
+"""
+
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import django
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_workers = None
+_lock = threading.Lock()
+
+
+def _init_worker():
+    # Spawned workers start without the app registry the mappers' models need
+    django.setup()
+
+
+def _normalize_chunk(mapper, chunk):
+    """Worker side: build the chunk's instances and collect rejects."""
+    rejects = []
+    objects = mapper.map(
+        chunk, lambda item, reason: rejects.append((item, str(reason)))
+    )
+    return objects, rejects
+
+
+def get_executor():
+    """The shared worker pool, created on first use with INGEST_WORKERS processes."""
+    global _executor, _executor_workers
+    with _lock:
+        if _executor is None or _executor_workers != settings.INGEST_WORKERS:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.INGEST_WORKERS, initializer=_init_worker
+            )
+            _executor_workers = settings.INGEST_WORKERS
+        return _executor
+
+
+def shutdown_executor():
+    global _executor, _executor_workers
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = _executor_workers = None
+
+
+def normalize_chunks(mapper, items, on_reject):
+    """
+    Yield lists of model instances for ``items``, in order.
+
+    Small payloads, or any payload when INGEST_WORKERS is 0 or 1, are mapped
+    in-process as a single chunk.
+    """
+    if settings.INGEST_WORKERS <= 1 or len(items) < settings.INGEST_PARALLEL_MIN_ROWS:
+        yield mapper.map(items, on_reject)
+        return
+
+    size = settings.INGEST_CHUNK_SIZE
+    chunks = [items[start : start + size] for start in range(0, len(items), size)]
+    try:
+        executor = get_executor()
+        futures = [executor.submit(_normalize_chunk, mapper, c) for c in chunks]
+    except BrokenProcessPool:
+        shutdown_executor()
+        futures = None
+
+    try:
+        for index, chunk in enumerate(chunks):
+            if futures is not None:
+                try:
+                    objects, rejects = futures[index].result()
+                except BrokenProcessPool:
+                    logger.error("Ingest worker pool broke, normalizing in-process")
+                    shutdown_executor()
+                    futures = None
+                else:
+                    for item, reason in rejects:
+                        on_reject(item, reason)
+                    yield objects
+                    continue
+            yield mapper.map(chunk, on_reject)
+    finally:
+        for future in futures or ():
+            future.cancel()
@@ -0,0 +1,43 @@
+from .instrumentation import timed
+from .models import RiskMetric
+
+# Large JSON/text columns left out of list responses unless requested with
+# ?fields=; the full row is served by the per-protocol detail endpoint.
+DEFERRED_FIELDS = {
+    RiskMetric: ("description", "audits", "hallmarks", "chainTvls", "tokenBreakdowns"),
+}
+
+
+# Bookkeeping columns never returned by the API
+INTERNAL_FIELDS = ("generation",)
+
+
+def model_field_names(model):
+    return [
+        f.name for f in model._meta.concrete_fields if f.name not in INTERNAL_FIELDS
+    ]
+
+
+def select_fields(model, requested):
+    """Resolve a ``?fields=a,b`` value to the columns a list response returns.
+
+    Raises ValueError naming any field the model does not have.
+    """
+    names = model_field_names(model)
+    if not requested:
+        deferred = DEFERRED_FIELDS.get(model, ())
+        return [name for name in names if name not in deferred]
+
+    fields = [f.strip() for f in requested.split(",") if f.strip()]
+    invalid = [f for f in fields if f not in names]
+    if invalid:
+        raise ValueError(f"Invalid field(s): {', '.join(invalid)}")
+    return fields
+
+
+def project_rows(rows, fields):
+    """Restrict already-serialized rows (e.g. from the cache) to ``fields``."""
+    if rows and list(rows[0]) == fields:
+        return rows
+    with timed("serialize"):
+        return [{field: row.get(field) for field in fields} for row in rows]
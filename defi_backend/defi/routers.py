@@ -0,0 +1,18 @@
+from django.conf import settings
+
+
+class ReadWriteRouter:
+    """Send reads to the read-only alias and everything else to ``default``."""
+
+    def db_for_read(self, model, **hints):
+        return settings.DATABASE_READ_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases point at the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
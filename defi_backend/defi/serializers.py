@@ -14,19 +14,19 @@ from .models import (
 class YieldDataSerializer(serializers.ModelSerializer):
     class Meta:
         model = YieldData
-        fields = "__all__"
+        exclude = ("generation",)
 
 
 class GovernanceProposalSerializer(serializers.ModelSerializer):
     class Meta:
         model = GovernanceProposal
-        fields = "__all__"
+        exclude = ("generation",)
 
 
 class RiskMetricSerializer(serializers.ModelSerializer):
     class Meta:
         model = RiskMetric
-        fields = "__all__"
+        exclude = ("generation",)
 
 
 # New Serializers
@@ -39,7 +39,7 @@ class OnChainDataSerializer(serializers.ModelSerializer):
 class RiskScoreSerializer(serializers.ModelSerializer):
     class Meta:
         model = RiskScore
-        fields = "__all__"
+        exclude = ("generation",)
 
 
 class TechnicalDataSerializer(serializers.ModelSerializer):
@@ -0,0 +1,296 @@
+"""
+Mergeable quantile sketches of yield pool distributions.
+
+Each ingest of /pools summarizes APY and TVL per chain, per project and over
+all pools into DDSketch-style quantile sketches: values are counted in
+logarithmic buckets ``(gamma^(k-1), gamma^k]``, so any quantile read back is
+within ``SKETCH_RELATIVE_ACCURACY`` of the true value, and two sketches merge
+by adding bucket counts. That makes them cheap to keep incrementally:
+
+* ``current`` sketches describe the latest ingest and are replaced each time,
+* daily sketches (period ``YYYY-MM-DD``) accumulate every ingest of the day
+  and are merged across days to answer history queries.
+
+Sketches are built vectorized from the columnar snapshot and stored as JSON
+in ``DistributionSketch``; distribution endpoints never scan pools.
+"""
+
+import logging
+import math
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import DistributionSketch
+from .snapshots import load_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Magnitudes below this are counted as zero
+MIN_INDEXABLE = 1e-9
+
+# Metrics sketched from the yield_data snapshot, and the dimensions they are
+# sketched by; "all" is a single group over every pool
+SKETCH_METRICS = ("apy", "apyBase", "tvlUsd")
+SKETCH_DIMENSIONS = ("all", "chain", "project")
+CURRENT = "current"
+SKETCH_CACHE_TIMEOUT = 300
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy=None):
+        self.relative_accuracy = relative_accuracy or settings.SKETCH_RELATIVE_ACCURACY
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}  # bucket index -> count
+        self.negative = {}  # bucket index of the magnitude -> count
+        self.zero = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def bucket_keys(self, magnitudes):
+        return np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+
+    def bucket_value(self, key):
+        # Midpoint (in relative terms) of (gamma^(key-1), gamma^key]
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def add_many(self, values):
+        """Add an array of values; NaNs are ignored."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return self
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        magnitudes = np.abs(values)
+        zero = magnitudes < MIN_INDEXABLE
+        self.zero += int(zero.sum())
+        for store, mask in (
+            (self.positive, (values > 0) & ~zero),
+            (self.negative, (values < 0) & ~zero),
+        ):
+            if mask.any():
+                keys, counts = np.unique(
+                    self.bucket_keys(magnitudes[mask]), return_counts=True
+                )
+                self._add_counts(store, keys.tolist(), counts.tolist())
+        return self
+
+    @staticmethod
+    def _add_counts(store, keys, counts):
+        for key, count in zip(keys, counts):
+            store[key] = store.get(key, 0) + count
+
+    def merge(self, other):
+        """Fold ``other`` (same accuracy) into this sketch."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches of different accuracy")
+        self._add_counts(self.positive, other.positive, other.positive.values())
+        self._add_counts(self.negative, other.negative, other.negative.values())
+        self.zero += other.zero
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _buckets(self):
+        """(value, count) for every bucket, in ascending value order."""
+        buckets = [
+            (-self.bucket_value(key), self.negative[key])
+            for key in sorted(self.negative, reverse=True)
+        ]
+        if self.zero:
+            buckets.append((0.0, self.zero))
+        buckets.extend(
+            (self.bucket_value(key), self.positive[key])
+            for key in sorted(self.positive)
+        )
+        return buckets
+
+    def quantiles(self, qs):
+        """Values at each quantile in ``qs`` (0..1), or None if empty."""
+        if not self.count:
+            return [None for _ in qs]
+        buckets = self._buckets()
+        values = np.array([value for value, _ in buckets])
+        cumulative = np.cumsum([count for _, count in buckets])
+        ranks = np.asarray(qs, dtype=np.float64) * (self.count - 1)
+        found = values[np.searchsorted(cumulative, ranks, side="right")]
+        return [float(v) for v in np.clip(found, self.min, self.max)]
+
+    def histogram(self, edges):
+        """Approximate counts of values in each ``[edges[i], edges[i+1])``."""
+        buckets = self._buckets()
+        values = np.clip([value for value, _ in buckets], self.min, self.max)
+        bins = np.searchsorted(edges, values, side="right") - 1
+        bins[values == edges[-1]] = len(edges) - 2  # Last bin is closed
+        inside = (bins >= 0) & (bins < len(edges) - 1)
+        counts = np.bincount(
+            bins[inside],
+            weights=np.array([count for _, count in buckets])[inside],
+            minlength=len(edges) - 1,
+        )
+        return [int(c) for c in counts]
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            "accuracy": self.relative_accuracy,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "zero": self.zero,
+            "positive": {str(k): v for k, v in self.positive.items()},
+            "negative": {str(k): v for k, v in self.negative.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["accuracy"])
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min, sketch.max = data["min"], data["max"]
+        sketch.zero = data["zero"]
+        sketch.positive = {int(k): v for k, v in data["positive"].items()}
+        sketch.negative = {int(k): v for k, v in data["negative"].items()}
+        return sketch
+
+
+def snapshot_sketches(snapshot):
+    """{(metric, dimension, key): QuantileSketch} for a yield_data snapshot."""
+    sketches = {}
+    for metric in SKETCH_METRICS:
+        values = np.asarray(snapshot[metric])
+        for dimension in SKETCH_DIMENSIONS:
+            if dimension == "all":
+                sketches[(metric, "all", "")] = QuantileSketch().add_many(values)
+                continue
+            codes = np.asarray(snapshot[dimension])
+            labels = snapshot.categories[dimension]
+            # One stable sort by group, then each group is a contiguous slice
+            order = np.argsort(codes, kind="stable")
+            sorted_codes = codes[order]
+            bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+            for group in np.split(order, bounds):
+                if group.size:
+                    key = labels[codes[group[0]]]
+                    sketches[(metric, dimension, key)] = QuantileSketch().add_many(
+                        values[group]
+                    )
+    return sketches
+
+
+def update_distribution_sketches(dataset="yield_data"):
+    """Replace current sketches and fold them into today's; never fails ingest."""
+    try:
+        snapshot = load_snapshot(dataset)
+        if snapshot is None:
+            return
+        sketches = snapshot_sketches(snapshot)
+        today = timezone.now().date().isoformat()
+        _store(sketches, CURRENT, snapshot.generation, replace=True)
+        _store(sketches, today, snapshot.generation, replace=False)
+        DistributionSketch.objects.filter(
+            period__lt=(
+                timezone.now().date() - timedelta(days=settings.SKETCH_HISTORY_DAYS)
+            ).isoformat()
+        ).exclude(period=CURRENT).delete()
+        cache.delete_many(
+            [
+                _sketch_cache_key(period, metric, dimension)
+                for period in (CURRENT, today)
+                for metric in SKETCH_METRICS
+                for dimension in SKETCH_DIMENSIONS
+            ]
+        )
+    except Exception:
+        logger.exception(f"Error updating {dataset} distribution sketches")
+
+
+def _store(sketches, period, generation, replace):
+    """Write ``sketches`` for ``period``, replacing it or merging into it."""
+    existing = {}
+    if not replace:
+        existing = {
+            (row.metric, row.dimension, row.key): row
+            for row in DistributionSketch.objects.filter(period=period)
+        }
+    rows, merged = [], []
+    for (metric, dimension, key), sketch in sketches.items():
+        row = existing.get((metric, dimension, key))
+        if row is not None:
+            merged.append(row.pk)
+            if row.data["accuracy"] == sketch.relative_accuracy:
+                sketch = QuantileSketch.from_dict(row.data).merge(sketch)
+        rows.append(
+            DistributionSketch(
+                metric=metric,
+                dimension=dimension,
+                key=key,
+                period=period,
+                generation=generation,
+                count=sketch.count,
+                data=sketch.to_dict(),
+            )
+        )
+    # Delete and re-insert: bulk_update's CASE expressions cost seconds here
+    with transaction.atomic():
+        stale = DistributionSketch.objects.filter(period=period)
+        if not replace:
+            stale = stale.filter(pk__in=merged)
+        stale.delete()
+        DistributionSketch.objects.bulk_create(rows, batch_size=500)
+
+
+def load_sketches(metric, dimension, days=None):
+    """
+    {key: QuantileSketch} of the current ingest, or merged over the last
+    ``days`` daily sketches when ``days`` is given.
+    """
+    if days is None:
+        periods = [CURRENT]
+    else:
+        first = timezone.now().date() - timedelta(days=days - 1)
+        periods = [(first + timedelta(days=i)).isoformat() for i in range(days)]
+
+    merged = {}
+    for period in periods:
+        for key, data in _period_sketches(period, metric, dimension).items():
+            sketch = QuantileSketch.from_dict(data)
+            if sketch.relative_accuracy != settings.SKETCH_RELATIVE_ACCURACY:
+                continue  # Kept from before the accuracy setting changed
+            if key in merged:
+                merged[key].merge(sketch)
+            else:
+                merged[key] = sketch
+    return merged
+
+
+def _sketch_cache_key(period, metric, dimension):
+    return f"sketches:{period}:{metric}:{dimension}"
+
+
+def _period_sketches(period, metric, dimension):
+    cache_key = _sketch_cache_key(period, metric, dimension)
+    stored = cache.get(cache_key)
+    if stored is None:
+        stored = dict(
+            DistributionSketch.objects.filter(
+                period=period, metric=metric, dimension=dimension
+            ).values_list("key", "data")
+        )
+        cache.set(cache_key, stored, SKETCH_CACHE_TIMEOUT)
+    return stored
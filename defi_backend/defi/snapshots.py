@@ -0,0 +1,263 @@
+"""
+Immutable columnar snapshots of ingested datasets.
+
+Every ingest of /pools and /protocols also writes one ``.npy`` file per
+column under ``SNAPSHOT_DIR/<dataset>/<generation>/`` and then swaps the
+``CURRENT`` pointer file. API processes memory-map the current snapshot
+read-only, so aggregations run vectorized over the mapped columns and every
+worker shares the same page cache instead of holding its own copy.
+
+String columns are dictionary-encoded: an int32 code per row plus the list of
+distinct values in ``meta.json``. Missing numbers are stored as NaN.
+"""
+
+import json
+import logging
+import os
+import shutil
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Keys of DeFiLlama's chainTvls that are not part of a protocol's headline TVL
+EXCLUDED_TVL_KEYS = (
+    "staking",
+    "pool2",
+    "borrowed",
+    "doublecounted",
+    "liquidstaking",
+    "vesting",
+    "offers",
+    "treasury",
+)
+
+
+def protocol_tvl(row):
+    """Headline TVL of a /protocols row, summed from its per-chain TVLs."""
+    total = 0.0
+    for chain, value in (row.get("chainTvls") or {}).items():
+        if "-" in chain or chain.lower() in EXCLUDED_TVL_KEYS:
+            continue
+        if isinstance(value, (int, float)):
+            total += value
+    return total
+
+
+# Columns kept per dataset: (column, kind, source) where source is a row key
+# or a function of the row. Kinds: "float", "bool" or "category".
+SNAPSHOT_COLUMNS = {
+    "yield_data": [
+        ("chain", "category", "chain"),
+        ("project", "category", "project"),
+        ("symbol", "category", "symbol"),
+        ("pool", "category", "pool"),
+        ("tvlUsd", "float", "tvlUsd"),
+        ("apy", "float", "apy"),
+        ("apyBase", "float", "apyBase"),
+        ("apyReward", "float", "apyReward"),
+        ("apyPct1D", "float", "apyPct1D"),
+        ("apyPct7D", "float", "apyPct7D"),
+        ("apyPct30D", "float", "apyPct30D"),
+        ("apyMean30d", "float", "apyMean30d"),
+        ("il7d", "float", "il7d"),
+        ("volumeUsd1d", "float", "volumeUsd1d"),
+        ("volumeUsd7d", "float", "volumeUsd7d"),
+        ("mu", "float", "mu"),
+        ("sigma", "float", "sigma"),
+        ("stablecoin", "bool", "stablecoin"),
+        ("outlier", "bool", "outlier"),
+        ("ilRisk", "category", "ilRisk"),
+        ("exposure", "category", "exposure"),
+    ],
+    "risk_metrics": [
+        ("name", "category", "name"),
+        ("slug", "category", "slug"),
+        ("symbol", "category", "symbol"),
+        ("module", "category", "module"),
+        ("tvl", "float", protocol_tvl),
+        ("mcap", "float", "mcap"),
+        ("change_1h", "float", "change_1h"),
+        ("change_1d", "float", "change_1d"),
+        ("change_7d", "float", "change_7d"),
+        ("misrepresentedTokens", "bool", "misrepresentedTokens"),
+    ],
+}
+
+
+def _values(rows, source):
+    if callable(source):
+        return [source(row) for row in rows]
+    return [row.get(source) for row in rows]
+
+
+def _encode(kind, values):
+    """Return (array, categories) for one column."""
+    if kind == "float":
+        return (
+            np.array(
+                [v if isinstance(v, (int, float)) else np.nan for v in values],
+                dtype=np.float64,
+            ),
+            None,
+        )
+    if kind == "bool":
+        return np.array([bool(v) for v in values], dtype=np.bool_), None
+    categories = {}
+    codes = np.fromiter(
+        (
+            categories.setdefault("" if v is None else str(v), len(categories))
+            for v in values
+        ),
+        dtype=np.int32,
+        count=len(values),
+    )
+    return codes, list(categories)
+
+
+def _dataset_dir(dataset):
+    return os.path.join(settings.SNAPSHOT_DIR, dataset)
+
+
+def write_snapshot(dataset, generation, rows):
+    """Write ``rows`` (dicts) as the snapshot for ``generation`` and publish it."""
+    columns = SNAPSHOT_COLUMNS[dataset]
+    root = _dataset_dir(dataset)
+    os.makedirs(root, exist_ok=True)
+    final_dir = os.path.join(root, str(generation))
+    tmp_dir = os.path.join(root, f".tmp-{generation}-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    meta = {"generation": generation, "rows": len(rows), "columns": {}}
+    for column, kind, source in columns:
+        array, categories = _encode(kind, _values(rows, source))
+        np.save(os.path.join(tmp_dir, f"{column}.npy"), array)
+        meta["columns"][column] = {"kind": kind, "categories": categories}
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.rename(tmp_dir, final_dir)
+    # Readers only ever follow CURRENT, so the swap is a single rename
+    pointer_tmp = os.path.join(root, f".CURRENT-{os.getpid()}")
+    with open(pointer_tmp, "w") as f:
+        f.write(str(generation))
+    os.replace(pointer_tmp, os.path.join(root, "CURRENT"))
+    _prune(root, generation)
+    logger.info(f"Wrote {dataset} snapshot {generation} ({len(rows)} rows)")
+
+
+def _prune(root, current):
+    generations = sorted(
+        int(name)
+        for name in os.listdir(root)
+        if name.isdigit() and int(name) != current
+    )
+    # Mapped files stay readable for processes that still hold them open
+    for generation in generations[
+        : max(0, len(generations) - settings.SNAPSHOT_RETENTION + 1)
+    ]:
+        shutil.rmtree(os.path.join(root, str(generation)), ignore_errors=True)
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of one snapshot generation."""
+
+    def __init__(self, dataset, generation, path):
+        self.dataset = dataset
+        self.generation = generation
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.rows = meta["rows"]
+        self.kinds = {name: info["kind"] for name, info in meta["columns"].items()}
+        self.categories = {
+            name: info["categories"]
+            for name, info in meta["columns"].items()
+            if info["categories"] is not None
+        }
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in meta["columns"]
+        }
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def mask(self, column, value):
+        """Boolean row mask for ``column == value`` (category or bool columns)."""
+        kind = self.kinds[column]
+        if kind == "bool":
+            return self.columns[column] == (str(value).lower() in ("1", "true", "yes"))
+        try:
+            code = self.categories[column].index(value)
+        except ValueError:
+            return np.zeros(self.rows, dtype=np.bool_)
+        return self.columns[column] == code
+
+
+_loaded = {}
+
+
+def load_snapshot(dataset):
+    """Return the current Snapshot for ``dataset``, or None if none was written."""
+    root = _dataset_dir(dataset)
+    try:
+        with open(os.path.join(root, "CURRENT")) as f:
+            generation = int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+    snapshot = _loaded.get(dataset)
+    if snapshot is None or snapshot.generation != generation:
+        snapshot = Snapshot(dataset, generation, os.path.join(root, str(generation)))
+        _loaded[dataset] = snapshot
+    return snapshot
+
+
+AGGREGATIONS = ("sum", "mean", "count", "min", "max")
+
+
+def aggregate(snapshot, metric, op, group_by=None, filters=None):
+    """Vectorized aggregate of a float column, optionally grouped by a category.
+
+    Rows where the metric is NaN are ignored. Returns a list of dicts sorted
+    by value, descending.
+    """
+    values = np.asarray(snapshot[metric])
+    mask = ~np.isnan(values)
+    for column, value in (filters or {}).items():
+        mask &= snapshot.mask(column, value)
+
+    if group_by is None:
+        selected = values[mask]
+        if op == "count":
+            result = float(selected.size)
+        elif selected.size == 0:
+            result = None
+        else:
+            result = float(getattr(np, op)(selected))
+        return [{"value": result, "count": int(selected.size)}]
+
+    codes = np.asarray(snapshot[group_by])[mask]
+    selected = values[mask]
+    groups = len(snapshot.categories[group_by])
+    counts = np.bincount(codes, minlength=groups)
+    if op in ("sum", "mean"):
+        result = np.bincount(codes, weights=selected, minlength=groups)
+        if op == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result = result / counts
+    elif op == "count":
+        result = counts.astype(np.float64)
+    else:
+        fill = np.inf if op == "min" else -np.inf
+        result = np.full(groups, fill)
+        (np.minimum if op == "min" else np.maximum).at(result, codes, selected)
+
+    present = np.nonzero(counts)[0]
+    order = present[np.argsort(-result[present], kind="stable")]
+    labels = snapshot.categories[group_by]
+    return [
+        {"key": labels[i], "value": float(result[i]), "count": int(counts[i])}
+        for i in order
+    ]
@@ -0,0 +1,173 @@
+"""
+Dashboard summary materialized at ingest.
+
+After each ingest of /pools or /protocols, the sections fed by that dataset
+are recomputed from its columnar snapshot with NumPy and stored in the
+``DashboardSummary`` table, one row per section, and the assembled summary is
+put in the cache. ``/api/summary/`` only ever reads that result:
+
+* ``total_tvl``: headline DeFi TVL summed over protocols,
+* ``apy_by_chain``: TVL-weighted mean APY and TVL per chain,
+* ``stablecoin_split``: pools, TVL and weighted APY of stablecoin vs volatile
+  pools,
+* ``top_movers``: biggest 24h TVL gainers and losers among protocols above
+  ``SUMMARY_MOVERS_MIN_TVL``.
+"""
+
+import logging
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from .models import DashboardSummary
+from .snapshots import load_snapshot
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CACHE_KEY = "dashboard_summary"
+
+
+def _weighted_mean(values, weights):
+    total = weights.sum()
+    return float((values * weights).sum() / total) if total > 0 else None
+
+
+def apy_by_chain(snapshot):
+    apy = np.asarray(snapshot["apy"])
+    tvl = np.asarray(snapshot["tvlUsd"])
+    valid = ~np.isnan(apy) & ~np.isnan(tvl)
+    codes = np.asarray(snapshot["chain"])[valid]
+    apy, tvl = apy[valid], tvl[valid]
+
+    groups = len(snapshot.categories["chain"])
+    pools = np.bincount(codes, minlength=groups)
+    tvl_sum = np.bincount(codes, weights=tvl, minlength=groups)
+    apy_tvl = np.bincount(codes, weights=apy * tvl, minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weighted = apy_tvl / tvl_sum
+
+    labels = snapshot.categories["chain"]
+    present = np.nonzero(pools)[0]
+    order = present[np.argsort(-tvl_sum[present], kind="stable")]
+    return [
+        {
+            "chain": labels[i],
+            "pools": int(pools[i]),
+            "tvl": float(tvl_sum[i]),
+            "apy": float(weighted[i]) if tvl_sum[i] > 0 else None,
+        }
+        for i in order
+    ]
+
+
+def stablecoin_split(snapshot):
+    apy = np.asarray(snapshot["apy"])
+    tvl = np.asarray(snapshot["tvlUsd"])
+    stable = np.asarray(snapshot["stablecoin"])
+    valid = ~np.isnan(apy) & ~np.isnan(tvl)
+    split = {}
+    for name, mask in (("stable", stable), ("volatile", ~stable)):
+        selected = mask & valid
+        split[name] = {
+            "pools": int(mask.sum()),
+            "tvl": float(tvl[selected].sum()),
+            "apy": _weighted_mean(apy[selected], tvl[selected]),
+        }
+    total = split["stable"]["tvl"] + split["volatile"]["tvl"]
+    for name in split:
+        split[name]["tvl_share"] = split[name]["tvl"] / total if total else None
+    return split
+
+
+def total_tvl(snapshot):
+    tvl = np.asarray(snapshot["tvl"])
+    return {"value": float(np.nansum(tvl)), "protocols": snapshot.rows}
+
+
+def top_movers(snapshot):
+    change = np.asarray(snapshot["change_1d"])
+    tvl = np.asarray(snapshot["tvl"])
+    candidates = np.nonzero(
+        ~np.isnan(change) & (tvl >= settings.SUMMARY_MOVERS_MIN_TVL)
+    )[0]
+    count = min(settings.SUMMARY_TOP_MOVERS, candidates.size)
+    names = snapshot.categories["name"]
+    slugs = snapshot.categories["slug"]
+    name_codes = np.asarray(snapshot["name"])
+    slug_codes = np.asarray(snapshot["slug"])
+
+    def describe(indices):
+        return [
+            {
+                "name": names[name_codes[i]],
+                "slug": slugs[slug_codes[i]],
+                "tvl": float(tvl[i]),
+                "change_1d": float(change[i]),
+            }
+            for i in indices
+        ]
+
+    if count == 0:
+        return {"gainers": [], "losers": []}
+    values = change[candidates]
+    # argpartition picks the extremes in O(n); only those few are sorted
+    top = candidates[np.argpartition(-values, count - 1)[:count]]
+    bottom = candidates[np.argpartition(values, count - 1)[:count]]
+    return {
+        "gainers": describe(top[np.argsort(-change[top], kind="stable")]),
+        "losers": describe(bottom[np.argsort(change[bottom], kind="stable")]),
+    }
+
+
+# Dataset -> summary sections computed from its snapshot
+SUMMARY_SECTIONS = {
+    "yield_data": {
+        "apy_by_chain": apy_by_chain,
+        "stablecoin_split": stablecoin_split,
+    },
+    "risk_metrics": {
+        "total_tvl": total_tvl,
+        "top_movers": top_movers,
+    },
+}
+
+
+def refresh_summary(dataset):
+    """Recompute the dataset's summary sections; never fails the ingest."""
+    sections = SUMMARY_SECTIONS.get(dataset)
+    if sections is None:
+        return
+    try:
+        snapshot = load_snapshot(dataset)
+        if snapshot is None:
+            return
+        for section, compute in sections.items():
+            DashboardSummary.objects.update_or_create(
+                section=section,
+                defaults={
+                    "dataset": dataset,
+                    "generation": snapshot.generation,
+                    "data": compute(snapshot),
+                },
+            )
+        cache.set(SUMMARY_CACHE_KEY, build_summary(), None)
+    except Exception:
+        logger.exception(f"Error refreshing {dataset} dashboard summary")
+
+
+def build_summary():
+    """Assemble the stored sections into the /api/summary/ payload."""
+    summary = {"generations": {}, "computed_at": {}}
+    for row in DashboardSummary.objects.all():
+        summary[row.section] = row.data
+        summary["generations"][row.dataset] = row.generation
+        summary["computed_at"][row.section] = row.computed_at.isoformat()
+    return summary
+
+
+def current_summary():
+    """The cached summary, rebuilt from the table if the cache lost it."""
+    summary = cache.get(SUMMARY_CACHE_KEY)
+    if summary is None:
+        summary = build_summary()
+        cache.set(SUMMARY_CACHE_KEY, summary, None)
+    return summary
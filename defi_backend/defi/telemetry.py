@@ -0,0 +1,151 @@
+"""
+Per-stage telemetry for ingest runs.
+
+Each ingest records how long it spent downloading, parsing, normalizing,
+writing and publishing, together with row counts, as one ``IngestRun`` row and
+one summary log line. Individual items are only logged at DEBUG, one in every
+``INGEST_LOG_SAMPLE_EVERY``, and the first few rejected items at WARNING, so
+large payloads are never formatted into log strings in full.
+"""
+
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from .models import IngestRun
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("download", "parse", "normalize", "write", "publish")
+MAX_LOGGED_REJECTS = 5
+
+
+class IngestTelemetry:
+    def __init__(self, dataset, trigger="direct"):
+        self.dataset = dataset
+        self.trigger = trigger
+        self.started_at = timezone.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.download_bytes = None
+        self.rows_received = 0
+        self.rows_written = 0
+        self.rows_rejected = 0
+        self.generation = None
+        self.error = ""
+        self.unchanged = False
+        self._debug = logger.isEnabledFor(logging.DEBUG)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def downloaded(self, size):
+        self.download_bytes = (self.download_bytes or 0) + size
+
+    def sample(self, items):
+        """Log every INGEST_LOG_SAMPLE_EVERY-th item at DEBUG."""
+        if not self._debug:
+            return
+        every = settings.INGEST_LOG_SAMPLE_EVERY
+        for index in range(0, len(items), every):
+            logger.debug(f"{self.dataset} item {index}: {items[index]!r:.500}")
+
+    def reject(self, item, reason):
+        self.rows_rejected += 1
+        if self.rows_rejected <= MAX_LOGGED_REJECTS:
+            logger.warning(f"{self.dataset}: rejected item ({reason}): {item!r:.200}")
+
+    def skip_unchanged(self):
+        """The payload matches the ingested one; nothing is rewritten."""
+        self.unchanged = True
+
+    def fail(self, error):
+        self.error = str(error) or type(error).__name__
+
+    def as_dict(self):
+        total = time.perf_counter() - self.start
+        processing = sum(
+            self.stages.get(name, 0.0) for name in ("normalize", "write", "publish")
+        )
+        return {
+            "dataset": self.dataset,
+            "trigger": self.trigger,
+            "status": (
+                "failed" if self.error else "unchanged" if self.unchanged else "ok"
+            ),
+            "error": self.error,
+            "generation": self.generation,
+            "started_at": self.started_at,
+            "download_bytes": self.download_bytes,
+            **{f"{name}_seconds": self.stages.get(name) for name in STAGES},
+            "total_seconds": total,
+            "rows_received": self.rows_received,
+            "rows_written": self.rows_written,
+            "rows_rejected": self.rows_rejected,
+            "rows_per_second": (
+                self.rows_written / processing
+                if self.rows_written and processing
+                else None
+            ),
+        }
+
+    def finish(self):
+        """Log the run summary and store it in the run history."""
+        run = self.as_dict()
+        stages = " ".join(
+            f"{name}={seconds * 1000:.0f}ms"
+            for name, seconds in self.stages.items()
+            if seconds is not None
+        )
+        logger.info(
+            f"Ingest {self.dataset} {run['status']}: {self.rows_written} written, "
+            f"{self.rows_rejected} rejected of {self.rows_received} "
+            f"in {run['total_seconds'] * 1000:.0f}ms ({stages})"
+            + (f" error={self.error}" if self.error else ""),
+            extra={"ingest": run},
+        )
+        try:
+            IngestRun.objects.create(**run)
+            IngestRun.objects.filter(
+                started_at__lt=timezone.now()
+                - timedelta(days=settings.INGEST_RUN_RETENTION_DAYS)
+            ).delete()
+        except Exception:
+            logger.exception(f"Error storing {self.dataset} ingest run")
+
+
+@contextmanager
+def ingest_run(dataset, telemetry=None, trigger="direct"):
+    """Yield the caller's telemetry, or a new run that is stored on exit."""
+    if telemetry is not None:
+        yield telemetry
+        return
+    telemetry = IngestTelemetry(dataset, trigger)
+    try:
+        yield telemetry
+    except Exception as e:
+        telemetry.fail(e)
+        raise
+    finally:
+        telemetry.finish()
+
+
+@asynccontextmanager
+async def async_ingest_run(dataset):
+    """Async-view counterpart of ``ingest_run``."""
+    telemetry = IngestTelemetry(dataset, "async-fetch")
+    try:
+        yield telemetry
+    except Exception as e:
+        telemetry.fail(e)
+        raise
+    finally:
+        await sync_to_async(telemetry.finish)()
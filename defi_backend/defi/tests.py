@@ -1,3 +1,1025 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from contextlib import ExitStack
+from datetime import date
+from unittest import mock
+import httpx
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from .anomalies import detect_anomalies
+from .backfill import YieldHistoryBackfill, run_backfill
+from .benchmarks.replay import FaultProfile, ReplayServer
+from .cache import TwoTierCache, _log_key
+from .history import record_daily_history
+from .live import GenerationBroadcaster
+from .upstream import UpstreamClient, UpstreamThrottled, UpstreamUnavailable
+from .yield_index import YieldIndex, parse_yield_query
+from .generations import (
+    GenerationSuperseded,
+    collect_generations,
+    publish_generation,
+    stage_generation,
+)
+from .correlations import Correlations, load_correlations, store_correlations
+from .db import apply_sqlite_profile
+from .export import EXPORT_FORMATS, pyarrow
+from .routers import ReadWriteRouter
+from .ingest import (
+    ingest_dataset,
+    ingest_governance_data,
+    ingest_yield_data,
+    staged_rows,
+)
+from .models import (
+    BackfillCheckpoint,
+    CacheGeneration,
+    DatasetGeneration,
+    GovernanceProposal,
+    ProtocolHistory,
+    RiskMetric,
+    RowChange,
+    YieldData,
+    YieldHistory,
+)
+from .serializers import GovernanceProposalSerializer, RiskMetricSerializer
+from .snapshots import load_snapshot, write_snapshot
+from . import correlations, snapshots
 
-# Create your tests here.
+# The two-tier cache in front of an in-memory shared tier
+TEST_CACHES = {
+    "default": {**settings.CACHES["default"]},
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+class DatasetTestMixin:
+    # Reads go through the "read" alias, which only sees committed rows
+    databases = {"default", "read"}
+
+    def setUp(self):
+        super().setUp()
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir, ignore_errors=True)
+        settings_override = override_settings(
+            SNAPSHOT_DIR=snapshot_dir,
+            PAYLOAD_ARCHIVE_DIR=snapshot_dir,
+            CACHES=TEST_CACHES,
+            GENERATION_GC_BACKGROUND=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        # Per-worker caches of files under the previous test's directory
+        snapshots._loaded.clear()
+        correlations._loaded.clear()
+
+    def snapshot(self, dataset, rows, generation=1):
+        write_snapshot(dataset, generation, rows)
+        return load_snapshot(dataset)
+
+
+class DailyHistoryTests(DatasetTestMixin, TransactionTestCase):
+    day = date(2026, 10, 19)
+
+    def test_fills_series_missing_from_a_partly_recorded_day(self):
+        # e.g. a backfill stored "a" for the day before the first ingest
+        YieldHistory.objects.create(pool="a", date=self.day, tvlUsd=1.0)
+        snapshot = self.snapshot(
+            "yield_data",
+            [{"pool": "a", "tvlUsd": 2.0, "apy": 3.0}, {"pool": "b", "tvlUsd": 4.0}],
+        )
+
+        record_daily_history("yield_data", snapshot, self.day)
+        record_daily_history("yield_data", snapshot, self.day)
+
+        stored = YieldHistory.objects.filter(date=self.day).order_by("pool")
+        self.assertEqual(
+            [(row.pool, row.tvlUsd) for row in stored], [("a", 1.0), ("b", 4.0)]
+        )
+
+
+class FastDrainTests(DatasetTestMixin, TransactionTestCase):
+    rows = [
+        {"slug": "big", "chainTvls": {"Ethereum": 5e6}, "change_1h": -30},
+        {"slug": "small", "chainTvls": {"Ethereum": 5e4}, "change_1h": -30},
+    ]
+
+    def drained(self):
+        flags = detect_anomalies(
+            "risk_metrics", self.snapshot("risk_metrics", self.rows)
+        )
+        return sorted(flag.key for flag in flags if flag.kind == "fast_drain")
+
+    @override_settings(ANOMALY_MIN_TVL=1e6, SUMMARY_MOVERS_MIN_TVL=0)
+    def test_uses_its_own_tvl_floor(self):
+        self.assertEqual(self.drained(), ["big"])
+
+    @override_settings(ANOMALY_MIN_TVL=0, SUMMARY_MOVERS_MIN_TVL=1e9)
+    def test_ignores_the_summary_movers_floor(self):
+        self.assertEqual(self.drained(), ["big", "small"])
+
+
+class SinceTests(DatasetTestMixin, TransactionTestCase):
+    urls = ("/api/governance-data/", "/api/async/governance-data/")
+
+    def publish(self, titles):
+        proposals = [
+            {"id": key, "space": {"id": "aave"}, "title": title, "state": "active"}
+            for key, title in titles.items()
+        ]
+        ingest_governance_data({"data": {"proposals": proposals}})
+
+    def since(self, url, since, **params):
+        params = {"since": since, "fields": "proposal_id,title", **params}
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_returns_exactly_the_changed_rows(self):
+        self.publish({"a": "A", "b": "B", "c": "C"})
+        self.publish({"a": "A2", "c": "C", "d": "D"})
+        for url in self.urls:
+            with self.subTest(url=url):
+                data = self.since(url, 1)
+                self.assertEqual((data["generation"], data["full"]), (2, False))
+                self.assertEqual(data["inserted"], [{"proposal_id": "d", "title": "D"}])
+                self.assertEqual(data["updated"], [{"proposal_id": "a", "title": "A2"}])
+                self.assertEqual(data["deleted"], ["b"])
+                self.assertIsNone(data["next"])
+                self.assertEqual(self.since(url, 2)["inserted"], [])
+
+    def test_pages_through_a_large_delta(self):
+        self.publish({f"p{i:02}": "T" for i in range(25)})
+        for url in self.urls:
+            with self.subTest(url=url):
+                data = self.since(url, 0, page_size=10)
+                pages, keys = 1, [row["proposal_id"] for row in data["inserted"]]
+                while data["next"]:
+                    data = self.client.get(data["next"]).json()
+                    pages += 1
+                    keys += [row["proposal_id"] for row in data["inserted"]]
+                self.assertEqual(pages, 3)
+                self.assertEqual(sorted(keys), [f"p{i:02}" for i in range(25)])
+
+    @override_settings(DELTA_RETENTION_GENERATIONS=1)
+    def test_falls_back_to_full_rows_once_compacted(self):
+        self.publish({"a": "A", "b": "B"})
+        self.publish({"a": "A"})
+        self.publish({"a": "A2"})  # Compacts the marker of "b", removed in 2
+        self.assertEqual(
+            DatasetGeneration.objects.get(dataset="governance_data").compacted_through,
+            2,
+        )
+        for url in self.urls:
+            with self.subTest(url=url):
+                data = self.since(url, 1)
+                self.assertEqual((data["generation"], data["full"]), (3, True))
+                self.assertEqual(data["count"], 1)
+                self.assertEqual(data["results"], [{"proposal_id": "a", "title": "A2"}])
+                self.assertEqual(self.since(url, 2)["updated"][0]["title"], "A2")
+
+    def test_rejects_a_bad_generation(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, {"since": "x"})
+                self.assertEqual(response.status_code, 400)
+
+
+class GenerationTests(DatasetTestMixin, TransactionTestCase):
+    dataset = "governance_data"
+
+    def stage(self, *keys):
+        generation = stage_generation(self.dataset)
+        GovernanceProposal.all_generations.bulk_create(
+            GovernanceProposal(
+                protocol="aave",
+                proposal_id=key,
+                title=key.upper(),
+                status="active",
+                generation=generation,
+            )
+            for key in keys
+        )
+        return generation
+
+    def publish(self, generation):
+        rows = GovernanceProposalSerializer(
+            staged_rows(GovernanceProposal, generation), many=True
+        ).data
+        return publish_generation(
+            self.dataset, rows, generation, GovernanceProposalSerializer
+        )
+
+    def published_keys(self):
+        return sorted(GovernanceProposal.objects.values_list("proposal_id", flat=True))
+
+    def markers(self):
+        return dict(
+            RowChange.objects.filter(dataset=self.dataset).values_list(
+                "key", "generation"
+            )
+        )
+
+    def test_readers_see_the_published_generation_until_the_swap(self):
+        self.publish(self.stage("a", "b"))
+        staged = self.stage("a", "c")
+        self.assertEqual(self.published_keys(), ["a", "b"])
+
+        self.publish(staged)
+        self.assertEqual(self.published_keys(), ["a", "c"])
+
+    def test_a_superseded_generation_is_never_published(self):
+        self.publish(self.stage("a"))
+        older, newer = self.stage("a", "b"), self.stage("a", "b", "c")
+        self.publish(newer)
+        with self.assertRaises(GenerationSuperseded):
+            self.publish(older)
+        self.assertEqual(
+            DatasetGeneration.objects.get(dataset=self.dataset).generation, newer
+        )
+        self.assertEqual(self.published_keys(), ["a", "b", "c"])
+
+    def test_diffs_against_the_generation_it_replaces(self):
+        # Both ingests staged while generation 1 was published
+        self.publish(self.stage("a"))
+        first, second = self.stage("a", "b"), self.stage("a", "b", "c")
+        self.publish(first)
+        self.publish(second)
+
+        self.assertEqual(self.markers(), {"a": 1, "b": first, "c": second})
+        diff = DatasetGeneration.objects.get(dataset=self.dataset).diff
+        self.assertEqual([row["proposal_id"] for row in diff["inserted"]], ["c"])
+        self.assertEqual((diff["updated"], diff["removed"]), ([], []))
+
+    def test_collection_keeps_the_published_and_staged_generations(self):
+        old = self.stage("a")
+        self.publish(old)
+        superseded, published = self.stage("b"), self.stage("c")
+        self.publish(published)
+        in_progress = self.stage("d")
+
+        collect_generations(self.dataset, GovernanceProposal)
+        remaining = GovernanceProposal.all_generations.values_list(
+            "generation", flat=True
+        )
+        self.assertEqual(sorted(remaining), [published, in_progress])
+        self.assertLess(max(old, superseded), published)
+
+
+@override_settings(
+    BACKFILL_BACKOFF=0, BACKFILL_BATCH_SIZE=4, UPSTREAM_BREAKER_THRESHOLD=1000
+)
+class BackfillTests(DatasetTestMixin, TransactionTestCase):
+    keys = [f"pool-{i}" for i in range(12)]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Built once: the server loads every fixture up front
+        cls.server = ReplayServer(("127.0.0.1", 0), FaultProfile()).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def serve(self, **faults):
+        """The replay server, answering with ``faults`` from now on."""
+        self.server.faults = FaultProfile(retry_after=0, seed=1, **faults)
+        self.server.stats.clear()
+        return self.server
+
+    def backfill(self, server, **kwargs):
+        with self.settings(DEFILLAMA_YIELDS_URL=server.base_url):
+            return run_backfill(
+                YieldHistoryBackfill(days=30),
+                concurrency=1,
+                rate=0,
+                keys=self.keys,
+                **kwargs,
+            )
+
+    def expected_rows(self, server):
+        backfill = YieldHistoryBackfill(days=30)
+        return {
+            (key, day, tvl)
+            for key in self.keys
+            for key, day, tvl, _, _ in backfill.parse(
+                key, json.loads(server.body("pool_chart", key))
+            )
+        }
+
+    def stored_rows(self):
+        return [
+            (row.pool, row.date.isoformat(), row.tvlUsd)
+            for row in YieldHistory.objects.all()
+        ]
+
+    def outcomes(self, server):
+        return {name.split()[1] for name in server.stats}
+
+    @override_settings(BACKFILL_MAX_ATTEMPTS=20)
+    def test_retries_throttled_failed_and_truncated_responses(self):
+        server = self.serve(error_429=0.2, error_5xx=0.2, truncate=0.2)
+        stats = self.backfill(server)
+
+        self.assertEqual((stats.done, stats.failed), (len(self.keys), 0))
+        self.assertGreater(stats.retries, 0)
+        self.assertTrue({"429", "truncated", "200"} <= self.outcomes(server))
+        self.assertTrue({"500", "502", "503"} & self.outcomes(server))
+        stored = self.stored_rows()
+        self.assertEqual(len(stored), len(set(stored)))
+        self.assertEqual(set(stored), self.expected_rows(server))
+
+    @override_settings(BACKFILL_MAX_ATTEMPTS=1)
+    def test_rerun_fetches_only_the_failed_keys(self):
+        flaky = self.serve(error_5xx=0.5)
+        first = self.backfill(flaky)
+        failed = set(
+            BackfillCheckpoint.objects.filter(status="failed").values_list(
+                "key", flat=True
+            )
+        )
+        self.assertTrue(0 < first.failed == len(failed) < len(self.keys))
+
+        healthy = self.serve()
+        second = self.backfill(healthy)
+        self.assertEqual(
+            (second.keys, second.done, second.failed), (len(failed), len(failed), 0)
+        )
+        self.assertEqual(sum(healthy.stats.values()), len(failed))
+        self.assertEqual(self.backfill(healthy).keys, 0)
+
+        stored = self.stored_rows()
+        self.assertEqual(len(stored), len(set(stored)))
+        self.assertEqual(set(stored), self.expected_rows(healthy))
+        # Refetching everything stores nothing twice
+        self.backfill(healthy, restart=True)
+        self.assertEqual(sorted(self.stored_rows()), sorted(stored))
+
+    @override_settings(BACKFILL_MAX_ATTEMPTS=0)
+    def test_needs_at_least_one_attempt(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.backfill(self.serve())
+
+
+class RiskMetricHistoryTests(DatasetTestMixin, TransactionTestCase):
+    urls = ("/api/risk-metrics/{}/history/", "/api/async/risk-metrics/{}/history/")
+
+    def setUp(self):
+        super().setUp()
+        for day, tvl in ((1, 10.0), (2, 20.0), (3, 30.0)):
+            ProtocolHistory.objects.create(
+                protocol="aave", date=date(2026, 10, day), tvl=tvl
+            )
+
+    def test_returns_the_history_as_columns(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url.format("aave"), {"start": "2026-10-02", "end": "2026-10-03"}
+                )
+                self.assertEqual(
+                    response.json(),
+                    {
+                        "slug": "aave",
+                        "dates": ["2026-10-02"],
+                        "tvl": [20.0],
+                        "mcap": [None],
+                    },
+                )
+                self.assertEqual(self.client.get(url.format("none")).status_code, 404)
+                response = self.client.get(url.format("aave"), {"start": "x"})
+                self.assertEqual(response.status_code, 400)
+
+
+class TwoTierCacheTests(TransactionTestCase):
+    databases = {"default"}
+
+    def setUp(self):
+        super().setUp()
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        settings_override = override_settings(
+            CACHES={
+                **TEST_CACHES,
+                "file": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": location,
+                },
+            }
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def worker(self, shared="file"):
+        """A two-tier cache as another process would hold it."""
+        options = {"SHARED": shared, "GENERATION_CHECK_INTERVAL": 0}
+        return TwoTierCache("", {"OPTIONS": options})
+
+    def test_write_drops_the_other_workers_copy(self):
+        a, b = self.worker(), self.worker()
+        a.set("k", "v1")
+        self.assertEqual(b.get("k"), "v1")
+        a.set("k", "v2")
+        self.assertEqual(b.get("k"), "v2")
+        a.delete("k")
+        self.assertIsNone(b.get("k"))
+
+    def test_concurrent_writes_get_their_own_generation(self):
+        a, b, reader = self.worker(), self.worker(), self.worker()
+        a.set("x", "x1")
+        b.set("y", "y1")
+        self.assertEqual(reader.get_many(["x", "y"]), {"x": "x1", "y": "y1"})
+
+        # b writes between a taking its generation and logging under it
+        next_generation = a._next_generation
+
+        def interleaved():
+            generation = next_generation()
+            b.set("y", "y2")
+            return generation
+
+        a._next_generation = interleaved
+        a.set("x", "x2")
+
+        counter = CacheGeneration.objects.using("default").get(name="file").value
+        self.assertEqual(counter, 4)
+        self.assertEqual(
+            sorted(a.shared.get_many([_log_key(3), _log_key(4)]).values()),
+            [a.make_key("x"), a.make_key("y")],
+        )
+        self.assertEqual(reader.get_many(["x", "y"]), {"x": "x2", "y": "y2"})
+
+    def test_counter_stays_in_shared_tiers_with_atomic_incr(self):
+        a, b = self.worker("shared"), self.worker("shared")
+        a.set("k", "v1")
+        self.assertEqual(b.get("k"), "v1")
+        a.set("k", "v2")
+        self.assertEqual(b.get("k"), "v2")
+        self.assertFalse(CacheGeneration.objects.using("default").exists())
+
+
+class BroadcasterTests(SimpleTestCase):
+    async def test_concurrent_subscribers_share_one_diff(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_diff(dataset, since):
+            calls.append((dataset, since))
+            release.wait(5)
+            return 3, {"inserted": [], "updated": [], "removed": []}
+
+        broadcaster = GenerationBroadcaster(poll_interval=1)
+        with mock.patch("defi.live.diff_since", slow_diff):
+            waiters = [
+                asyncio.ensure_future(broadcaster.diff_since("yield_data", 1))
+                for _ in range(5)
+            ]
+            await asyncio.sleep(0.05)
+            release.set()
+            results = await asyncio.gather(*waiters)
+        self.assertEqual(calls, [("yield_data", 1)])
+        self.assertEqual({generation for generation, _ in results}, {3})
+
+
+class ExportTests(DatasetTestMixin, TransactionTestCase):
+    rows = [
+        {"id": 1, "pool": "a", "date": "2026-10-01", "tvlUsd": 10.0, "apy": 1.5},
+        {"id": 2, "pool": "a", "date": "2026-10-02", "tvlUsd": None, "apy": 2.0},
+        {"id": 3, "pool": "b", "date": "2026-10-01", "tvlUsd": 5.0, "apy": None},
+    ]
+    fields = "id,pool,date,tvlUsd,apy"
+
+    def setUp(self):
+        super().setUp()
+        for row in self.rows:
+            YieldHistory.objects.create(**row)
+
+    async def _aexport(self, fmt, params):
+        response = await self.async_client.get(
+            f"/api/async/export/yield-history.{fmt}", params
+        )
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    def export(self, fmt, **params):
+        """The export body from the sync and the async route."""
+        params = {"fields": self.fields, **params}
+        response = self.client.get(f"/api/export/yield-history.{fmt}", params)
+        self.assertEqual(response["Content-Type"], EXPORT_FORMATS[fmt])
+        return {
+            "sync": b"".join(response.streaming_content),
+            "async": async_to_sync(self._aexport)(fmt, params),
+        }
+
+    def test_ndjson(self):
+        for route, body in self.export("ndjson").items():
+            with self.subTest(route=route):
+                lines = body.decode().splitlines()
+                self.assertEqual([json.loads(line) for line in lines], self.rows)
+
+    def test_csv(self):
+        for route, body in self.export("csv").items():
+            with self.subTest(route=route):
+                header, *rows = csv.reader(io.StringIO(body.decode()))
+                self.assertEqual(header, self.fields.split(","))
+                self.assertEqual(
+                    rows,
+                    [
+                        ["1", "a", "2026-10-01", "10.0", "1.5"],
+                        ["2", "a", "2026-10-02", "", "2.0"],
+                        ["3", "b", "2026-10-01", "5.0", ""],
+                    ],
+                )
+
+    def test_columnar(self):
+        readers = {
+            "parquet": lambda body: pyarrow.parquet.read_table(io.BytesIO(body)),
+            "arrow": lambda body: pyarrow.ipc.open_stream(body).read_all(),
+        }
+        for fmt, read in readers.items():
+            for route, body in self.export(fmt).items():
+                with self.subTest(fmt=fmt, route=route):
+                    table = read(body)
+                    self.assertEqual(table.column_names, self.fields.split(","))
+                    self.assertEqual(
+                        [
+                            {**row, "date": row["date"].isoformat()}
+                            for row in table.to_pylist()
+                        ],
+                        self.rows,
+                    )
+
+    def test_pages_through_the_whole_table(self):
+        with override_settings(EXPORT_CHUNK_SIZE=2):
+            bodies = self.export("csv", fields="id")
+        for route, body in bodies.items():
+            with self.subTest(route=route):
+                self.assertEqual(body.decode().split(), ["id", "1", "2", "3"])
+
+    def test_rejects_unknown_datasets_and_fields(self):
+        for prefix in ("/api/", "/api/async/"):
+            with self.subTest(prefix=prefix):
+                response = self.client.get(f"{prefix}export/nothing.csv")
+                self.assertEqual(response.status_code, 404)
+                response = self.client.get(
+                    f"{prefix}export/yield-history.csv", {"fields": "id,secret"}
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class CorrelationTests(DatasetTestMixin, TransactionTestCase):
+    def test_reloads_a_matrix_rebuilt_by_another_worker(self):
+        self.snapshot(
+            "risk_metrics",
+            [
+                {"slug": slug, "name": slug, "chainTvls": {"Ethereum": tvl}}
+                for slug, tvl in (("a", 3.0), ("b", 2.0), ("c", 1.0))
+            ],
+        )
+        loaded = load_correlations()
+        self.assertIs(load_correlations(), loaded)
+
+        # A backfill in another worker rewrites the same generation's matrix
+        rebuilt = np.full((3, 3), 0.5)
+        store_correlations(
+            Correlations(
+                loaded.generation,
+                loaded.slugs,
+                loaded.names,
+                rebuilt,
+                np.full((3, 3), 30, dtype=np.int32),
+            )
+        )
+        np.testing.assert_array_equal(load_correlations().matrix, rebuilt)
+
+
+class SnapshotFailureTests(DatasetTestMixin, TransactionTestCase):
+    derived = ("refresh_summary", "run_anomaly_detection", "refresh_correlations")
+
+    def ingest(self, tvl):
+        protocols = [{"name": "Aave", "slug": "aave", "chainTvls": {"Ethereum": tvl}}]
+        with ExitStack() as stack:
+            mocks = [
+                stack.enter_context(mock.patch(f"defi.ingest.{name}"))
+                for name in self.derived
+            ]
+            ingest_dataset(protocols, RiskMetric, RiskMetricSerializer, "risk_metrics")
+        return mocks
+
+    def test_derived_steps_follow_the_snapshot(self):
+        for mocked in self.ingest(1.0):
+            mocked.assert_called_once()
+        self.assertEqual(load_snapshot("risk_metrics").generation, 1)
+
+    def test_failed_snapshot_skips_the_derived_steps(self):
+        self.ingest(1.0)
+        with (
+            mock.patch("defi.ingest.write_snapshot", side_effect=OSError),
+            self.assertLogs("defi.ingest", "ERROR"),
+        ):
+            mocks = self.ingest(2.0)
+        for mocked in mocks:
+            mocked.assert_not_called()
+        # The new rows are still published and cached
+        self.assertEqual(cache.get("risk_metrics")[0]["chainTvls"], {"Ethereum": 2.0})
+        self.assertEqual(load_snapshot("risk_metrics").generation, 1)
+
+
+class FieldsTests(DatasetTestMixin, TransactionTestCase):
+    urls = ("/api/risk-metrics/", "/api/async/risk-metrics/")
+
+    def setUp(self):
+        super().setUp()
+        protocols = [
+            {"name": "Aave", "slug": "aave", "mcap": 2.0, "description": "Lending"},
+            {"name": "Curve", "slug": "curve", "mcap": 1.0, "description": "DEX"},
+        ]
+        ingest_dataset(protocols, RiskMetric, RiskMetricSerializer, "risk_metrics")
+
+    def rows(self, url, **params):
+        data = self.client.get(url, params).json()
+        return data["results"] if isinstance(data, dict) else data
+
+    def test_projects_cached_and_database_rows(self):
+        for source in ("cache", "database"):
+            if source == "database":
+                cache.delete("risk_metrics")
+            for url in self.urls:
+                with self.subTest(source=source, url=url):
+                    self.assertEqual(
+                        self.rows(url, fields="slug,description"),
+                        [
+                            {"slug": "aave", "description": "Lending"},
+                            {"slug": "curve", "description": "DEX"},
+                        ],
+                    )
+                    # Heavy columns only when asked for
+                    row = self.rows(url)[0]
+                    self.assertEqual(row["slug"], "aave")
+                    self.assertNotIn("description", row)
+                    self.assertNotIn("generation", row)
+
+    def test_rejects_unknown_fields(self):
+        for url in self.urls:
+            for fields in ("slug,secret", "generation"):
+                with self.subTest(url=url, fields=fields):
+                    response = self.client.get(url, {"fields": fields})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("Invalid field(s)", response.json()["error"])
+
+
+class YieldIndexTests(DatasetTestMixin, TransactionTestCase):
+    queries = [
+        {},
+        {"ordering": "apy"},
+        {"ordering": "-apyReward"},
+        {"ordering": "apyReward"},
+        {"chain": "Ethereum"},
+        {"chain": "Ethereum,Arbitrum", "ordering": "tvlUsd"},
+        {"project": "curve,uniswap", "stablecoin": "true"},
+        {"stablecoin": "0", "ordering": "-apy"},
+        {"chain": "Solana"},
+        {"chain": "Ethereum", "project": "aave", "stablecoin": "false"},
+    ]
+
+    def setUp(self):
+        super().setUp()
+        pools = []
+        for i, (chain, project, stablecoin, tvl, reward) in enumerate(
+            [
+                ("Ethereum", "aave", True, 100.0, 1.0),
+                ("Ethereum", "curve", True, 300.0, None),
+                ("Arbitrum", "aave", False, 100.0, 2.0),
+                ("Arbitrum", "uniswap", True, 50.0, None),
+                ("Polygon", "curve", False, 300.0, 1.0),
+                ("Ethereum", "uniswap", False, 200.0, 3.0),
+                ("Polygon", "aave", True, 100.0, None),
+            ]
+        ):
+            pools.append(
+                {
+                    "pool": f"pool-{i}",
+                    "chain": chain,
+                    "project": project,
+                    "symbol": "USDC",
+                    "stablecoin": stablecoin,
+                    "tvlUsd": tvl,
+                    "apyBase": float(i),
+                    "apyReward": reward,
+                    "apy": float(i % 3),
+                }
+            )
+        ingest_yield_data({"data": pools})
+        self.index = YieldIndex(1, cache.get("yield_data"))
+
+    def test_matches_the_orm_filter(self):
+        for params in self.queries:
+            with self.subTest(params=params):
+                query = parse_yield_query(params)
+                self.assertTrue(self.index.supports(query))
+                expected = list(
+                    YieldData.objects.filter(**query.filter_kwargs())
+                    .order_by(*query.order_by())
+                    .values_list("pool", flat=True)
+                )
+                found = [row["pool"] for row in self.index.query(query, ["pool"])[:]]
+                self.assertEqual(found, expected)
+
+    def test_views_answer_the_same_with_and_without_the_index(self):
+        for url in ("/api/yield-data/", "/api/async/yield-data/"):
+            for params in self.queries:
+                params = {**params, "fields": "pool"}
+                with self.subTest(url=url, params=params):
+                    with override_settings(YIELD_INDEX_ENABLED=True):
+                        indexed = self.client.get(url, params).json()
+                    with override_settings(YIELD_INDEX_ENABLED=False):
+                        database = self.client.get(url, params).json()
+                    self.assertEqual(indexed["results"], database["results"])
+
+
+class BatchTests(DatasetTestMixin, TransactionTestCase):
+    def ingest(self, *titles):
+        proposals = [
+            {"id": f"p{i}", "space": {"id": "aave"}, "title": title, "state": "active"}
+            for i, title in enumerate(titles)
+        ]
+        ingest_governance_data({"data": {"proposals": proposals}})
+
+    def batch(self, *parts):
+        response = self.client.post(
+            "/api/batch/", {"parts": list(parts)}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["parts"]
+
+    def test_known_etag_is_answered_with_304(self):
+        self.ingest("One")
+        part = {"id": "gov", "path": "governance-data", "params": {"fields": "title"}}
+        first = self.batch(part)["gov"]
+        self.assertEqual(first["status"], 200)
+        self.assertEqual(first["data"], [{"title": "One"}])
+
+        parts = self.batch(
+            {**part, "etag": first["etag"]},
+            {"id": "other", "path": "governance-data", "etag": first["etag"]},
+        )
+        self.assertEqual(parts["gov"], {"status": 304, "etag": first["etag"]})
+        # Different params are a different query with a different ETag
+        self.assertEqual(parts["other"]["status"], 200)
+        self.assertNotEqual(parts["other"]["etag"], first["etag"])
+
+        # A new generation changes the ETag
+        self.ingest("One", "Two")
+        renewed = self.batch({**part, "etag": first["etag"]})["gov"]
+        self.assertEqual(renewed["status"], 200)
+        self.assertEqual(renewed["data"], [{"title": "One"}, {"title": "Two"}])
+        self.assertNotEqual(renewed["etag"], first["etag"])
+
+    def test_rejects_unknown_paths(self):
+        response = self.client.post(
+            "/api/batch/",
+            {"parts": [{"path": "secrets"}]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class FakeClock:
+    """Stands in for the ``time`` module in defi.upstream."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def upstream_response(status, **headers):
+    return mock.Mock(status_code=status, headers=headers, content=b"{}")
+
+
+@override_settings(UPSTREAM_BREAKER_THRESHOLD=2, UPSTREAM_BREAKER_COOLDOWN=30)
+class UpstreamClientTests(SimpleTestCase):
+    url = "https://api.test/protocols"
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        patcher = mock.patch("defi.upstream.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, *responses):
+        patcher = mock.patch("defi.upstream.requests.request", side_effect=responses)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_throttles_to_the_host_rate(self):
+        client = UpstreamClient(limits={"api.test": (1.0, 2)}, max_wait=1.5)
+        # The burst goes at once, then one request a second
+        self.assertEqual([client.reserve(self.url) for _ in range(3)], [0, 0, 1.0])
+        with self.assertRaises(UpstreamThrottled) as raised:
+            client.reserve(self.url)
+        self.assertEqual(raised.exception.retry_after, 2.0)
+        self.clock.now += 3
+        self.assertEqual(client.reserve(self.url), 0)
+        stats = client.stats()["api.test"]
+        self.assertEqual(stats["throttle_waits"], 1)
+        self.assertEqual(stats["throttle_rejections"], 1)
+
+    def test_retry_after_is_honoured(self):
+        request = self.respond(
+            upstream_response(429, **{"Retry-After": "2"}), upstream_response(200)
+        )
+        client = UpstreamClient(attempts=3, backoff=0)
+        self.assertEqual(client.fetch(self.url).status_code, 200)
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(self.clock.slept, [0, 2.0, 0])
+        stats = client.stats()["api.test"]
+        self.assertEqual((stats["throttled"], stats["retries"]), (1, 1))
+        self.assertEqual(stats["breaker"], "closed")
+
+    def test_breaker_opens_then_probes_half_open(self):
+        client = UpstreamClient(attempts=1, backoff=0)
+
+        def probe(*args, **kwargs):
+            self.assertEqual(client.stats()["api.test"]["breaker"], "half-open")
+            # Only the probe goes out while the breaker is half-open
+            with self.assertRaises(UpstreamUnavailable):
+                client.reserve(self.url)
+            return upstream_response(200)
+
+        request = self.respond(
+            upstream_response(500), upstream_response(500), upstream_response(502)
+        )
+        with self.assertLogs("defi.upstream", "WARNING"):
+            for _ in range(2):
+                with self.assertRaises(UpstreamUnavailable):
+                    client.fetch(self.url)
+        self.assertEqual(client.stats()["api.test"]["breaker"], "open")
+
+        # Open: failed without a request until the cooldown is over
+        with self.assertRaises(UpstreamUnavailable) as raised:
+            client.fetch(self.url)
+        self.assertEqual(raised.exception.retry_after, 30)
+        self.assertEqual(request.call_count, 2)
+
+        # A failed probe opens it again for a whole cooldown
+        self.clock.now += 31
+        with self.assertRaises(UpstreamUnavailable):
+            client.fetch(self.url)
+        self.assertEqual(client.stats()["api.test"]["breaker"], "open")
+        self.clock.now += 29
+        with self.assertRaises(UpstreamUnavailable):
+            client.fetch(self.url)
+        self.assertEqual(request.call_count, 3)
+
+        # A successful probe closes it
+        self.clock.now += 2
+        request.side_effect = probe
+        self.assertEqual(client.fetch(self.url).status_code, 200)
+        stats = client.stats()["api.test"]
+        self.assertEqual(stats["breaker"], "closed")
+        self.assertEqual((stats["breaker_opens"], stats["short_circuits"]), (1, 3))
+
+
+class UpstreamUnavailableTests(DatasetTestMixin, TransactionTestCase):
+    def test_fetch_views_answer_503_with_retry_after(self):
+        error = UpstreamUnavailable("api.llama.fi failed (HTTP 502)", 12.2)
+        with (
+            mock.patch("defi.views.fetch", side_effect=error),
+            mock.patch("defi.async_views.afetch", side_effect=error),
+            self.assertLogs("defi", "WARNING"),
+        ):
+            for url in ("/api/fetch-risk/", "/api/async/fetch-risk/"):
+                with self.subTest(url=url):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 503)
+                    self.assertEqual(response["Retry-After"], "13")
+                    self.assertEqual(
+                        response.json(),
+                        {"error": "api.llama.fi failed (HTTP 502)", "stale": True},
+                    )
+
+
+class AsyncViewTests(DatasetTestMixin, TransactionTestCase):
+    protocols = [
+        {"name": "Aave", "slug": "aave", "mcap": 2.0},
+        {"name": "Curve", "slug": "curve", "mcap": 1.0},
+    ]
+
+    def test_fetch_then_read(self):
+        url = "https://api.llama.fi/protocols"
+        response = httpx.Response(
+            200, json=self.protocols, request=httpx.Request("GET", url)
+        )
+        with mock.patch("defi.async_views.afetch", return_value=response) as afetch:
+            for _ in range(2):  # The second payload is unchanged
+                fetched = self.client.get("/api/async/fetch-risk/")
+                self.assertEqual(fetched.status_code, 200)
+        afetch.assert_called_with(url)
+        self.assertEqual(
+            self.client.get("/api/async/risk-metrics/", {"fields": "slug"}).json(),
+            [{"slug": "aave"}, {"slug": "curve"}],
+        )
+        self.assertEqual(
+            self.client.get("/api/async/risk-metrics/aave/").json()["name"], "Aave"
+        )
+
+
+class AsyncUpstreamTests(SimpleTestCase):
+    async def test_requests_overlap(self):
+        in_flight = []
+        peak = 0
+
+        async def handler(request):
+            nonlocal peak
+            in_flight.append(request)
+            peak = max(peak, len(in_flight))
+            await asyncio.sleep(0.05)
+            in_flight.remove(request)
+            return httpx.Response(200, json={"ok": True})
+
+        upstream = UpstreamClient(attempts=1)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            responses = await asyncio.gather(
+                *(
+                    upstream.afetch(f"https://api.test/protocol/{i}", client=client)
+                    for i in range(20)
+                )
+            )
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual(peak, 20)
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "db.sqlite3")
+
+    def connect(self, read_only=False):
+        # Autocommit, as Django's connections are outside transactions
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(connection.close)
+        apply_sqlite_profile(connection.cursor(), settings.SQLITE_PROFILE, read_only)
+        return connection
+
+    def pragma(self, connection, name):
+        return connection.execute(f"PRAGMA {name}").fetchone()[0]
+
+    @override_settings(
+        SQLITE_PROFILE={
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+        }
+    )
+    def test_readers_keep_serving_while_a_writer_holds_the_lock(self):
+        writer = self.connect()
+        writer.execute("CREATE TABLE pool (id INTEGER)")
+        writer.execute("INSERT INTO pool VALUES (1)")
+        reader = self.connect(read_only=True)
+        self.assertEqual(self.pragma(writer, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(writer, "synchronous"), 1)  # NORMAL
+        self.assertEqual(self.pragma(reader, "query_only"), 1)
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.execute("INSERT INTO pool VALUES (2)")
+
+        # A reader paging through the table while an ingest replaces it: with
+        # a rollback journal the commit would need the reader gone first
+        reader.execute("BEGIN")
+        self.assertEqual(reader.execute("SELECT id FROM pool").fetchall(), [(1,)])
+        writer.execute("PRAGMA busy_timeout=0")  # Fail rather than wait
+        writer.execute("BEGIN IMMEDIATE")
+        writer.execute("DELETE FROM pool")
+        writer.execute("INSERT INTO pool VALUES (3)")
+        writer.execute("COMMIT")
+        self.assertEqual(reader.execute("SELECT id FROM pool").fetchall(), [(1,)])
+        reader.execute("COMMIT")
+        self.assertEqual(reader.execute("SELECT id FROM pool").fetchall(), [(3,)])
+
+    def test_router_splits_reads_from_writes(self):
+        router = ReadWriteRouter()
+        self.assertEqual(router.db_for_read(YieldData), settings.DATABASE_READ_ALIAS)
+        self.assertEqual(router.db_for_write(YieldData), "default")
+        self.assertTrue(router.allow_migrate("default", "defi"))
+        self.assertFalse(router.allow_migrate("read", "defi"))
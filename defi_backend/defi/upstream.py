@@ -0,0 +1,398 @@
+"""
+Upstream endpoints and the rate-limit-aware client every fetch goes through.
+
+``UpstreamClient`` keeps, per upstream host:
+
+* a token bucket of ``rate`` requests a second with bursts of ``burst``
+  (``UPSTREAM_RATE_LIMITS``); a request that would wait longer than
+  ``UPSTREAM_MAX_WAIT`` for its slot fails with ``UpstreamThrottled`` instead
+  of tying up the worker,
+* retries of timeouts, connection errors, 429s and 5xx responses with jittered
+  exponential backoff; a ``Retry-After`` holds back every request to the host,
+  not just the one that got it,
+* a circuit breaker: after ``UPSTREAM_BREAKER_THRESHOLD`` consecutive failures
+  the host is skipped for ``UPSTREAM_BREAKER_COOLDOWN`` seconds
+  (``UpstreamUnavailable``), then one request probes whether it is back. The
+  fetch views keep serving the last good generation meanwhile,
+* counters of requests, retries, 429s and time spent waiting for the
+  limiter, exported with the request metrics on ``/api/metrics/``.
+
+Buckets and breakers are per process: with several workers, divide the
+quotas between them.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, urlsplit
+import httpx
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Upstream endpoint name -> (base URL setting, path)
+UPSTREAM_ENDPOINTS = {
+    "pools": ("DEFILLAMA_YIELDS_URL", "/pools"),
+    "protocols": ("DEFILLAMA_API_URL", "/protocols"),
+    "charts": ("DEFILLAMA_API_URL", "/charts"),
+    "coingecko_defi": ("COINGECKO_API_URL", "/global/defi"),
+    "coingecko_price": (
+        "COINGECKO_API_URL",
+        "/simple/price?ids=ethereum&vs_currencies=usd&include_24hr_vol=true",
+    ),
+    "snapshot_proposals": ("SNAPSHOT_HUB_URL", "/graphql"),
+    # Per-key endpoints, formatted with the key
+    "pool_chart": ("DEFILLAMA_YIELDS_URL", "/chart/{key}"),
+    "protocol": ("DEFILLAMA_API_URL", "/protocol/{key}"),
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def upstream_url(name, key=None):
+    """Full URL of an upstream endpoint under its configured base URL."""
+    setting, path = UPSTREAM_ENDPOINTS[name]
+    if key is not None:
+        path = path.format(key=quote(str(key), safe=""))
+    return getattr(settings, setting).rstrip("/") + path
+
+
+def retry_after_seconds(response, default=1.0):
+    """Seconds a 429/503 response asks us to wait (delta or HTTP date)."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class UpstreamError(Exception):
+    """An upstream host is throttling us or down; try again in ``retry_after``."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamThrottled(UpstreamError):
+    pass
+
+
+class UpstreamUnavailable(UpstreamError):
+    pass
+
+
+class HostState:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0  # Retry-After
+        self.failures = 0  # Consecutive
+        self.opened_at = None  # Breaker open since
+        self.probing = None  # Half-open since, while one request tests the host
+        self.counters = Counter()
+
+    def refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+        self.updated = now
+
+    @property
+    def breaker(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.probing is not None else "open"
+
+
+class UpstreamClient:
+    def __init__(
+        self,
+        limits=None,
+        default_rate=0.0,
+        default_burst=1,
+        attempts=None,
+        backoff=None,
+        max_wait=None,
+    ):
+        self.limits = limits or {}  # host -> (rate, burst)
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.attempts = attempts or settings.UPSTREAM_MAX_ATTEMPTS
+        self.backoff = settings.UPSTREAM_BACKOFF if backoff is None else backoff
+        self.max_wait = settings.UPSTREAM_MAX_WAIT if max_wait is None else max_wait
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            rate, burst = self.limits.get(host, (self.default_rate, self.default_burst))
+            state = self._hosts[host] = HostState(rate, burst)
+        return state
+
+    # Limiter and breaker
+
+    def reserve(self, url):
+        """
+        Take the host's next request slot and return how long to wait for it.
+        Raises instead when the host's breaker is open or the wait is too long.
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            state = self._host(host)
+            now = time.monotonic()
+            if state.opened_at is not None:
+                remaining = state.opened_at + settings.UPSTREAM_BREAKER_COOLDOWN - now
+                # A probe that never reported back (cancelled) expires
+                probing = state.probing is not None and (
+                    now - state.probing < settings.UPSTREAM_TIMEOUT + self.max_wait
+                )
+                if remaining > 0 or probing:
+                    state.counters["short_circuits"] += 1
+                    raise UpstreamUnavailable(
+                        f"{host} is unavailable (circuit open)", max(remaining, 1.0)
+                    )
+                state.probing = now
+            state.refill(now)
+            wait = max(0.0, state.paused_until - now)
+            if state.rate > 0:
+                wait = max(wait, (1 - state.tokens) / state.rate)
+            if wait > self.max_wait:
+                state.probing = None
+                state.counters["throttle_rejections"] += 1
+                raise UpstreamThrottled(f"{host} is rate limited", wait)
+            if state.rate > 0:
+                # Take the token now, even if it is only available later, so
+                # callers are served in the order they asked
+                state.tokens -= 1
+            state.counters["requests"] += 1
+            if wait:
+                state.counters["throttle_waits"] += 1
+                state.counters["throttle_wait_seconds"] += wait
+            return wait
+
+    def pause(self, url, seconds):
+        """Hold the host's next requests back ``seconds`` (e.g. Retry-After)."""
+        with self._lock:
+            state = self._host(urlsplit(url).netloc)
+            state.paused_until = max(state.paused_until, time.monotonic() + seconds)
+
+    def _record(self, url, ok, status=None):
+        with self._lock:
+            state = self._host(urlsplit(url).netloc)
+            state.counters[f"responses_{status or 'error'}"] += 1
+            state.probing = None
+            if ok:
+                state.failures = 0
+                state.opened_at = None
+                return
+            state.failures += 1
+            if state.opened_at is not None or (
+                state.failures >= settings.UPSTREAM_BREAKER_THRESHOLD
+            ):
+                if state.opened_at is None:
+                    state.counters["breaker_opens"] += 1
+                    logger.warning(
+                        f"Upstream {urlsplit(url).netloc} failing, pausing requests "
+                        f"for {settings.UPSTREAM_BREAKER_COOLDOWN}s"
+                    )
+                state.opened_at = time.monotonic()
+
+    def _count(self, url, counter, value=1):
+        with self._lock:
+            self._host(urlsplit(url).netloc).counters[counter] += value
+
+    # Retry policy
+
+    def _backoff(self, attempt):
+        delay = min(settings.UPSTREAM_BACKOFF_MAX, self.backoff * 2**attempt)
+        return delay * random.uniform(0.5, 1.5)
+
+    def _retry_delay(self, url, attempt, response=None, error=None):
+        """
+        Seconds to wait before retrying after ``response`` or the ``error`` it
+        raised, or None when the response is final. Raises UpstreamThrottled
+        or UpstreamUnavailable once the attempts are used up.
+        """
+        status = None if response is None else response.status_code
+        if response is not None and status not in RETRY_STATUSES:
+            self._record(url, True, status)
+            return None
+        # A 429 means the host is up but we are over its quota
+        self._record(url, status == 429, status)
+        delay = self._backoff(attempt)
+        if status in (429, 503) and "Retry-After" in response.headers:
+            delay = retry_after_seconds(response, delay)
+            self.pause(url, delay)
+        if status == 429:
+            self._count(url, "throttled")
+        if attempt + 1 < self.attempts and delay <= self.max_wait:
+            self._count(url, "retries")
+            return delay
+
+        host = urlsplit(url).netloc
+        reason = f"HTTP {status}" if error is None else f"{type(error).__name__}"
+        if status == 429:
+            raise UpstreamThrottled(f"{host} is rate limited ({reason})", delay)
+        with self._lock:
+            if self._host(host).opened_at is not None:
+                delay = max(delay, settings.UPSTREAM_BREAKER_COOLDOWN)
+        raise UpstreamUnavailable(f"{host} failed ({reason})", delay) from error
+
+    def fetch(self, url, method="GET", **kwargs):
+        """
+        ``requests.request`` through the host's limiter, retries and breaker.
+        Raises an UpstreamError subclass if the host stays throttled or down.
+        """
+        kwargs.setdefault("timeout", settings.UPSTREAM_TIMEOUT)
+        for attempt in range(self.attempts):
+            time.sleep(self.reserve(url))
+            try:
+                response = requests.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                delay = self._retry_delay(url, attempt, error=e)
+            else:
+                delay = self._retry_delay(url, attempt, response)
+                if delay is None:
+                    return response
+            time.sleep(delay)
+
+    async def afetch(self, url, method="GET", client=None, **kwargs):
+        """``fetch`` with httpx, on ``client`` or the loop's shared one."""
+        client = client or async_client()
+        for attempt in range(self.attempts):
+            await asyncio.sleep(self.reserve(url))
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.HTTPError as e:
+                delay = self._retry_delay(url, attempt, error=e)
+            else:
+                delay = self._retry_delay(url, attempt, response)
+                if delay is None:
+                    return response
+            await asyncio.sleep(delay)
+
+    # Metrics
+
+    def stats(self):
+        """Per-host limiter, breaker and counter state."""
+        with self._lock:
+            now = time.monotonic()
+            result = {}
+            for host, state in sorted(self._hosts.items()):
+                state.refill(now)
+                result[host] = {
+                    "rate": state.rate,
+                    "burst": state.burst,
+                    "tokens": round(state.tokens, 3),
+                    "breaker": state.breaker,
+                    "consecutive_failures": state.failures,
+                    **state.counters,
+                }
+            return result
+
+    def totals(self):
+        """Counters summed over hosts."""
+        with self._lock:
+            return sum((state.counters for state in self._hosts.values()), Counter())
+
+    def render_metrics(self):
+        """Per-host counters in the Prometheus text format."""
+        counters = [
+            ("requests", "Upstream requests sent."),
+            ("retries", "Upstream requests retried."),
+            ("throttled", "Upstream 429 responses."),
+            ("throttle_waits", "Upstream requests that waited for the limiter."),
+            ("throttle_wait_seconds", "Time upstream requests waited for the limiter."),
+            ("throttle_rejections", "Upstream requests failed rather than wait."),
+            ("short_circuits", "Upstream requests skipped by an open breaker."),
+            ("breaker_opens", "Upstream circuit breaker trips."),
+        ]
+        stats = self.stats()
+        lines = []
+        for name, help_text in counters:
+            lines.append(f"# HELP defi_upstream_{name}_total {help_text}")
+            lines.append(f"# TYPE defi_upstream_{name}_total counter")
+            for host, host_stats in stats.items():
+                lines.append(
+                    f'defi_upstream_{name}_total{{host="{host}"}} '
+                    f"{host_stats.get(name, 0)}"
+                )
+        lines.append("# HELP defi_upstream_responses_total Upstream responses.")
+        lines.append("# TYPE defi_upstream_responses_total counter")
+        for host, host_stats in stats.items():
+            for name, value in sorted(host_stats.items()):
+                if name.startswith("responses_"):
+                    lines.append(
+                        f'defi_upstream_responses_total{{host="{host}",'
+                        f'status="{name[len("responses_"):]}"}} {value}'
+                    )
+        lines.append("# HELP defi_upstream_breaker_open Whether requests are skipped.")
+        lines.append("# TYPE defi_upstream_breaker_open gauge")
+        for host, host_stats in stats.items():
+            lines.append(
+                f'defi_upstream_breaker_open{{host="{host}"}} '
+                f'{int(host_stats["breaker"] != "closed")}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def upstream_client():
+    """The process-wide client, configured from the UPSTREAM_* settings."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = UpstreamClient(
+                limits=settings.UPSTREAM_RATE_LIMITS,
+                default_rate=settings.UPSTREAM_DEFAULT_RATE,
+            )
+        return _client
+
+
+def fetch(url, method="GET", **kwargs):
+    return upstream_client().fetch(url, method, **kwargs)
+
+
+async def afetch(url, method="GET", **kwargs):
+    return await upstream_client().afetch(url, method, **kwargs)
+
+
+# One client per event loop, so connections are pooled across requests without
+# leaking a client bound to a loop that has already been closed.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def async_client():
+    """Shared async HTTP client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=settings.UPSTREAM_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
@@ -6,6 +6,8 @@ from .views import (
     get_governance_data,
     fetch_risk_metrics,
     get_risk_metrics,
+    get_risk_metric,
+    get_risk_metric_history,
     fetch_on_chain_data,
     get_on_chain_data,
     simulate_governance_vote,  # Add this import
@@ -13,15 +15,32 @@ from .views import (
     get_risk_scores,
     fetch_technical_data,
     get_technical_data,
+    get_cache_stats,
+    get_upstream_stats,
+    get_metrics,
+    get_ingest_runs,
+    get_yield_index_stats,
+    export_dataset,
+    get_aggregate,
+    get_summary,
+    get_anomalies,
+    get_correlations,
+    get_correlated_protocols,
+    batch,
+    get_yield_distribution,
+    get_yield_histogram,
 )
 
 urlpatterns = [
     path("fetch-yield/", fetch_yield_data),
     path("yield-data/", get_yield_data),
+    path("yield-index/stats/", get_yield_index_stats),
     path("fetch-governance/", fetch_governance_data),
     path("governance-data/", get_governance_data),
     path("fetch-risk/", fetch_risk_metrics),
     path("risk-metrics/", get_risk_metrics),
+    path("risk-metrics/<str:slug>/", get_risk_metric),
+    path("risk-metrics/<str:slug>/history/", get_risk_metric_history),
     path("fetch-on-chain/", fetch_on_chain_data),
     path("on-chain-data/", get_on_chain_data),
     path("simulate-vote/", simulate_governance_vote),  # Add this line
@@ -29,4 +48,17 @@ urlpatterns = [
     path("risk-scores/", get_risk_scores),
     path("fetch-technical/", fetch_technical_data),
     path("technical-data/", get_technical_data),
+    path("cache-stats/", get_cache_stats),
+    path("upstream-stats/", get_upstream_stats),
+    path("metrics/", get_metrics),
+    path("ingest-runs/", get_ingest_runs),
+    path("export/<str:dataset>.<str:fmt>", export_dataset),
+    path("analytics/<str:dataset>/aggregate/", get_aggregate),
+    path("analytics/yield-data/distribution/", get_yield_distribution),
+    path("analytics/yield-data/histogram/", get_yield_histogram),
+    path("analytics/risk-metrics/correlations/", get_correlations),
+    path("analytics/risk-metrics/correlations/<str:slug>/", get_correlated_protocols),
+    path("batch/", batch),
+    path("summary/", get_summary),
+    path("anomalies/", get_anomalies),
 ]
@@ -1,10 +1,26 @@
+import hashlib
+import json
 import logging
-import requests
+import math
+from urllib.parse import urlencode
+import numpy as np
 from django.core.cache import cache
+from django.db.models import Q
 from rest_framework.decorators import api_view
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
 from django.conf import settings
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    JsonResponse,
+    QueryDict,
+    StreamingHttpResponse,
+)
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import require_GET
 from datetime import datetime
 from .models import (
     YieldData,
@@ -13,6 +29,9 @@ from .models import (
     OnChainData,
     RiskScore,
     TechnicalData,
+    IngestRun,
+    AnomalyFlag,
+    ProtocolHistory,
 )
 from .serializers import (
     YieldDataSerializer,
@@ -22,9 +41,54 @@ from .serializers import (
     RiskScoreSerializer,
     TechnicalDataSerializer,
 )
+from .instrumentation import PROMETHEUS_CONTENT_TYPE, registry, timed
+from .projection import select_fields, project_rows, model_field_names
+from .yield_index import parse_yield_query, yield_index
+from .snapshots import AGGREGATIONS, aggregate, load_snapshot
+from .sketches import (
+    MIN_INDEXABLE,
+    SKETCH_DIMENSIONS,
+    SKETCH_METRICS,
+    load_sketches,
+)
+from .summary import current_summary
+from .generations import DATASET_KEYS, current_generations
+from .delta import delta_since, rows_for_keys
+from .anomalies import ANOMALY_RULES
+from .correlations import load_correlations
+from .export import (
+    EXPORT_DATASETS,
+    EXPORT_FORMATS,
+    COLUMNAR_FORMATS,
+    pyarrow,
+    stream_export,
+)
+from .archive import archive_payload, mark_ingested
+from .telemetry import ingest_run
+from .upstream import UpstreamError, fetch, upstream_client, upstream_url
+from .ingest import (
+    ingest_dataset,
+    ingest_yield_data,
+    ingest_governance_data,
+    ingest_on_chain_data,
+    ingest_technical_data,
+    refresh_cache,
+)
 
 logger = logging.getLogger(__name__)
-CACHE_TIMEOUT = 300  # Cache API responses for 5 minutes
+
+GOVERNANCE_QUERY = """
+{
+  proposals(first: 10, where: { space_in: ["aave.eth", "compound-governance.eth"] }) {
+    id
+    title
+    state
+    space {
+      id
+    }
+  }
+}
+"""
 
 
 class StandardPagination(PageNumberPagination):
@@ -35,219 +99,314 @@ class StandardPagination(PageNumberPagination):
 
 # Utility function to fetch and cache data
 def fetch_and_cache_data(url, model, serializer, cache_key):
-    try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            response_data = response.json()
-            logger.info(f"API Response: {response_data}")  # Log the entire API response
-
-            if isinstance(response_data, dict) and "data" in response_data:
-                data = response_data["data"]
+    with ingest_run(cache_key, trigger="fetch") as run:
+        try:
+            with run.stage("download"):
+                response = fetch(url)
+            run.downloaded(len(response.content))
+            if response.status_code == 200:
+                with run.stage("archive"):
+                    archived, unchanged = archive_payload(
+                        cache_key, response.content, url
+                    )
+                if unchanged:
+                    run.skip_unchanged()
+                    refresh_cache(cache_key, model, serializer)
+                    return True
+                with run.stage("parse"):
+                    payload = response.json()
+                if ingest_dataset(payload, model, serializer, cache_key, run):
+                    mark_ingested(archived)
+                    return True
+                return False
             else:
-                data = response_data
-
-            if not isinstance(data, list):
-                logger.error(f"Unexpected data format: {type(data)}")
+                logger.error(f"Failed to fetch data from {url}: {response.status_code}")
+                run.fail(f"HTTP {response.status_code}")
                 return False
+        except UpstreamError as e:
+            logger.warning(f"Not fetching {url}: {e}")
+            run.fail(e)
+            raise
+        except Exception as e:
+            logger.exception(f"Error fetching data from {url}")
+            run.fail(e)
+            return False
 
-            # Log the first few items for debugging
-            for i, item in enumerate(data[:5]):
-                logger.info(f"Item {i}: {item}")
 
-            objects = []
-            model_fields = [f.name for f in model._meta.get_fields()]
+def upstream_unavailable(error):
+    """
+    503 for a fetch whose upstream is throttled or down; the last good data
+    stays published.
+    """
+    return Response(
+        {"error": str(error), "stale": True},
+        status=503,
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
 
-            for item in data:
-                if not isinstance(item, dict):
-                    logger.error(f"Skipping invalid item: {item}")
-                    continue
 
-                # Log the item for debugging
-                logger.info(f"Processing item: {item}")
-
-                # Filter out fields that are not in the model
-                filtered_item = {k: v for k, v in item.items() if k in model_fields}
-
-                # Ensure required fields are populated
-                if model == RiskScore:
-                    # Map API fields to RiskScore model fields
-                    filtered_item["protocol"] = item.get(
-                        "name", ""
-                    )  # Use "name" as protocol
-                    filtered_item["risk_score"] = item.get(
-                        "mcap", 0.0
-                    )  # Use "mcap" as risk_score
-                    filtered_item["audit_status"] = item.get(
-                        "audit_note", ""
-                    )  # Use "audit_note" as audit_status
+@api_view(["GET"])
+def get_yield_index_stats(request):
+    """Size and memory use of this worker's in-memory yield index."""
+    index = yield_index.get()
+    if index is None:
+        return Response({"error": "Yield index not built"}, status=404)
+    return Response(index.stats())
 
-                try:
-                    objects.append(model(**filtered_item))
-                except Exception as e:
-                    logger.error(f"Error creating model instance: {e}")
 
-            model.objects.all().delete()
-            model.objects.bulk_create(objects)
+@api_view(["GET"])
+def get_cache_stats(request):
+    """Hit rates and memory use of each cache tier in this worker."""
+    if not hasattr(cache, "stats"):
+        return Response({"error": "Cache backend does not report stats"}, status=404)
+    return Response(cache.stats())
 
-            serialized_data = serializer(objects, many=True).data
-            cache.set(cache_key, serialized_data, CACHE_TIMEOUT)
-            return True
-        else:
-            logger.error(f"Failed to fetch data from {url}: {response.status_code}")
-            return False
-    except Exception as e:
-        logger.exception(f"Error fetching data from {url}")
-        return False
+
+@require_GET
+def get_metrics(request):
+    """
+    Per-endpoint request metrics and upstream request, throttling and
+    breaker counters of this worker, in Prometheus text format.
+    """
+    return HttpResponse(
+        registry.render() + upstream_client().render_metrics(),
+        content_type=PROMETHEUS_CONTENT_TYPE,
+    )
+
+
+@api_view(["GET"])
+def get_upstream_stats(request):
+    """Rate limiter, circuit breaker and request counters per upstream host."""
+    return Response(upstream_client().stats())
+
+
+@api_view(["GET"])
+def get_ingest_runs(request):
+    """Ingest run history, newest first, filterable by dataset and status."""
+    runs = IngestRun.objects.order_by("-started_at").values()
+    if "dataset" in request.query_params:
+        runs = runs.filter(dataset=request.query_params["dataset"])
+    if "status" in request.query_params:
+        runs = runs.filter(status=request.query_params["status"])
+    paginator = StandardPagination()
+    result_page = paginator.paginate_queryset(runs, request)
+    return paginator.get_paginated_response(result_page)
+
+
+def since_delta(params, url, dataset, rows, fields, page_size):
+    """
+    One page of the rows of ``dataset`` changed after generation ``?since=``
+    (see defi.delta), continuing after the key ``?after=``: ``inserted`` and
+    ``updated`` rows, ``deleted`` keys and a ``next`` link; only ``full=True``
+    when that generation can't be diffed against anymore. Raises ValueError
+    for a bad ``?since=``.
+    """
+    try:
+        since = int(params["since"])
+    except ValueError:
+        since = -1
+    if since < 0:
+        raise ValueError("since must be a generation number")
+    key_field = DATASET_KEYS[dataset]
+    if key_field not in fields:
+        fields = [key_field, *fields]
+
+    delta = delta_since(dataset, since, params.get("after"), page_size)
+    data = {"generation": delta["generation"], "since": since, "full": delta["full"]}
+    if delta["full"]:
+        return data
+    inserted = set(delta["inserted"])
+    changed = rows_for_keys(
+        rows.values(*fields), key_field, delta["inserted"] + delta["updated"]
+    )
+    data["next"] = (
+        replace_query_param(url, "after", delta["next"]) if delta["next"] else None
+    )
+    data["inserted"] = [row for row in changed if str(row[key_field]) in inserted]
+    data["updated"] = [row for row in changed if str(row[key_field]) not in inserted]
+    data["deleted"] = delta["deleted"]
+    return data
+
+
+def _since_response(request, dataset, rows, fields, cached_data=None):
+    """``since_delta``, or the usual paginated rows when it is ``full``."""
+    paginator = StandardPagination()
+    try:
+        data = since_delta(
+            request.query_params,
+            request.build_absolute_uri(),
+            dataset,
+            rows,
+            fields,
+            paginator.get_page_size(request),
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    if not data["full"]:
+        return Response(data)
+    if cached_data:
+        rows = project_rows(cached_data, fields)
+    else:
+        rows = rows.values(*fields)
+    response = paginator.get_paginated_response(
+        paginator.paginate_queryset(rows, request)
+    )
+    response.data.update(data)
+    return response
 
 
 # Yield Data Endpoints
 @api_view(["GET"])
 def fetch_yield_data(request):
     """Fetch yield farming data from DeFiLlama API and update database."""
-    try:
-        url = "https://yields.llama.fi/pools"
-        response = requests.get(url, timeout=10)
+    with ingest_run("yield_data", trigger="fetch") as run:
+        try:
+            with run.stage("download"):
+                response = fetch(upstream_url("pools"))
+            run.downloaded(len(response.content))
 
-        if response.status_code == 200:
-            data = response.json().get("data", [])[:10]  # Limit to top 10
-            logger.info(f"Fetched {len(data)} yield data entries")
-            yield_objects = []
-
-            for item in data:
-                yield_objects.append(
-                    YieldData(
-                        chain=item.get("chain"),
-                        project=item.get("project"),
-                        symbol=item.get("symbol"),
-                        tvlUsd=item.get("tvlUsd"),
-                        apyBase=item.get("apyBase"),
-                        apyReward=item.get("apyReward"),  # Can be NULL
-                        apy=item.get("apy"),
-                        rewardTokens=item.get(
-                            "rewardTokens", []
-                        ),  # Default to empty list if missing
-                        pool=item.get("pool"),
-                        apyPct1D=item.get("apyPct1D"),
-                        apyPct7D=item.get("apyPct7D"),
-                        apyPct30D=item.get("apyPct30D"),
-                        stablecoin=item.get("stablecoin", False),
-                        ilRisk=item.get("ilRisk"),
-                        exposure=item.get("exposure"),
-                        predictions=item.get(
-                            "predictions", {}
-                        ),  # Default to empty dict if missing
-                        poolMeta=item.get("poolMeta"),
-                        mu=item.get("mu"),
-                        sigma=item.get("sigma"),
-                        count=item.get("count"),
-                        outlier=item.get("outlier", False),
-                        underlyingTokens=item.get(
-                            "underlyingTokens", []
-                        ),  # Default to empty list if missing
-                        il7d=item.get("il7d"),
-                        apyBase7d=item.get("apyBase7d"),
-                        apyMean30d=item.get("apyMean30d"),
-                        volumeUsd1d=item.get("volumeUsd1d"),
-                        volumeUsd7d=item.get("volumeUsd7d"),
-                        apyBaseInception=item.get("apyBaseInception"),
+            if response.status_code == 200:
+                with run.stage("archive"):
+                    archived, unchanged = archive_payload(
+                        "yield_data", response.content, response.url
                     )
-                )
-
-            YieldData.objects.all().delete()
-            YieldData.objects.bulk_create(yield_objects)
-            cache.set(
-                "yield_data",
-                YieldDataSerializer(yield_objects, many=True).data,
-                CACHE_TIMEOUT,
-            )
-            return Response({"message": "Yield data updated successfully!"})
-        else:
-            logger.error(f"Failed to fetch yield data: {response.status_code}")
-            return Response({"error": "Failed to fetch data"}, status=500)
-    except Exception as e:
-        logger.exception("Error fetching yield data")
-        return Response({"error": str(e)}, status=500)
+                if unchanged:
+                    run.skip_unchanged()
+                    refresh_cache("yield_data", YieldData, YieldDataSerializer)
+                    return Response({"message": "Yield data unchanged"})
+                with run.stage("parse"):
+                    payload = response.json()
+                ingest_yield_data(payload, run)
+                mark_ingested(archived)
+                return Response({"message": "Yield data updated successfully!"})
+            else:
+                logger.error(f"Failed to fetch yield data: {response.status_code}")
+                run.fail(f"HTTP {response.status_code}")
+                return Response({"error": "Failed to fetch data"}, status=500)
+        except UpstreamError as e:
+            logger.warning(f"Not fetching yield data: {e}")
+            run.fail(e)
+            return upstream_unavailable(e)
+        except Exception as e:
+            logger.exception("Error fetching yield data")
+            run.fail(e)
+            return Response({"error": str(e)}, status=500)
 
 
 @api_view(["GET"])
 def get_yield_data(request):
-    cached_data = cache.get("yield_data")
-    if cached_data:
-        return Response(cached_data)
+    """Yield pools, filterable by chain/project/stablecoin and sortable.
+
+    Served from the in-memory yield index when it covers the requested
+    ordering, otherwise from the database.
+    """
+    return _yield_data(request)
 
-    data = YieldData.objects.all().order_by("-tvl")
+
+def _yield_data(request, cached_data=None):
+    try:
+        fields = select_fields(YieldData, request.query_params.get("fields"))
+        query = parse_yield_query(request.query_params)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    if "since" in request.query_params:
+        rows = YieldData.objects.filter(**query.filter_kwargs()).order_by(
+            *query.order_by()
+        )
+        return _since_response(request, "yield_data", rows, fields)
+
+    index = yield_index.get()
+    if index is not None and index.supports(query):
+        data = index.query(query, fields)
+    else:
+        data = (
+            YieldData.objects.filter(**query.filter_kwargs())
+            .order_by(*query.order_by())
+            .values(*fields)
+        )
     paginator = StandardPagination()
     result_page = paginator.paginate_queryset(data, request)
-    serializer = YieldDataSerializer(result_page, many=True)
-    return paginator.get_paginated_response(serializer.data)
+    return paginator.get_paginated_response(result_page)
 
 
 # Governance Data Endpoints
 @api_view(["GET"])
 def fetch_governance_data(request):
     """Fetch governance data from Snapshot API."""
-    try:
-        url = "https://hub.snapshot.org/graphql"
-        query = """
-        {
-          proposals(first: 10, where: { space_in: ["aave.eth", "compound-governance.eth"] }) {
-            id
-            title
-            state
-            space {
-              id
-            }
-          }
-        }
-        """
-        response = requests.post(url, json={"query": query}, timeout=10)
-        if response.status_code == 200:
-            data = response.json().get("data", {}).get("proposals", [])
-            proposals = []
-            for proposal in data:
-                proposals.append(
-                    GovernanceProposal(
-                        protocol=proposal["space"]["id"],
-                        proposal_id=proposal["id"],  # String value
-                        title=proposal["title"],
-                        status=proposal["state"],
-                    )
+    with ingest_run("governance_data", trigger="fetch") as run:
+        try:
+            with run.stage("download"):
+                response = fetch(
+                    upstream_url("snapshot_proposals"),
+                    "POST",
+                    json={"query": GOVERNANCE_QUERY},
                 )
-
-            GovernanceProposal.objects.all().delete()
-            GovernanceProposal.objects.bulk_create(proposals)
-            cache.set(
-                "governance_data",
-                GovernanceProposalSerializer(proposals, many=True).data,
-                CACHE_TIMEOUT,
-            )
-            return Response({"message": "Governance data updated successfully!"})
-        else:
-            logger.error(f"Failed to fetch governance data: {response.status_code}")
-            return Response({"error": "Failed to fetch data"}, status=500)
-    except Exception as e:
-        logger.exception("Error fetching governance data")
-        return Response({"error": str(e)}, status=500)
+            run.downloaded(len(response.content))
+            if response.status_code == 200:
+                with run.stage("archive"):
+                    archived, unchanged = archive_payload(
+                        "governance_data", response.content, response.url
+                    )
+                if unchanged:
+                    run.skip_unchanged()
+                    refresh_cache(
+                        "governance_data",
+                        GovernanceProposal,
+                        GovernanceProposalSerializer,
+                    )
+                    return Response({"message": "Governance data unchanged"})
+                with run.stage("parse"):
+                    payload = response.json()
+                ingest_governance_data(payload, run)
+                mark_ingested(archived)
+                return Response({"message": "Governance data updated successfully!"})
+            else:
+                logger.error(f"Failed to fetch governance data: {response.status_code}")
+                run.fail(f"HTTP {response.status_code}")
+                return Response({"error": "Failed to fetch data"}, status=500)
+        except UpstreamError as e:
+            logger.warning(f"Not fetching governance data: {e}")
+            run.fail(e)
+            return upstream_unavailable(e)
+        except Exception as e:
+            logger.exception("Error fetching governance data")
+            run.fail(e)
+            return Response({"error": str(e)}, status=500)
 
 
 @api_view(["GET"])
 def get_governance_data(request):
-    cached_data = cache.get("governance_data")
+    return _governance_data(request, cache.get("governance_data"))
+
+
+def _governance_data(request, cached_data):
+    try:
+        fields = select_fields(GovernanceProposal, request.query_params.get("fields"))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    if "since" in request.query_params:
+        rows = GovernanceProposal.objects.order_by("-created_at")
+        return _since_response(request, "governance_data", rows, fields, cached_data)
+
     if cached_data:
-        return Response(cached_data)
+        return Response(project_rows(cached_data, fields))
 
-    data = GovernanceProposal.objects.all().order_by("-created_at")
+    data = GovernanceProposal.objects.order_by("-created_at").values(*fields)
     paginator = StandardPagination()
     result_page = paginator.paginate_queryset(data, request)
-    serializer = GovernanceProposalSerializer(result_page, many=True)
-    return paginator.get_paginated_response(serializer.data)
+    return paginator.get_paginated_response(result_page)
 
 
 # Risk Metrics Endpoints
 @api_view(["GET"])
 def fetch_risk_metrics(request):
-    url = "https://api.llama.fi/protocols"
-    if fetch_and_cache_data(url, RiskMetric, RiskMetricSerializer, "risk_metrics"):
+    try:
+        fetched = fetch_and_cache_data(
+            upstream_url("protocols"), RiskMetric, RiskMetricSerializer, "risk_metrics"
+        )
+    except UpstreamError as e:
+        return upstream_unavailable(e)
+    if fetched:
         return Response({"message": "Risk metrics updated successfully!"})
     else:
         return Response({"error": "Failed to fetch data"}, status=500)
@@ -255,9 +414,20 @@ def fetch_risk_metrics(request):
 
 @api_view(["GET"])
 def get_risk_metrics(request):
-    cached_data = cache.get("risk_metrics")
+    return _risk_metrics(request, cache.get("risk_metrics"))
+
+
+def _risk_metrics(request, cached_data):
+    try:
+        fields = select_fields(RiskMetric, request.query_params.get("fields"))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    if "since" in request.query_params:
+        rows = RiskMetric.objects.order_by("-mcap")
+        return _since_response(request, "risk_metrics", rows, fields, cached_data)
+
     if cached_data:
-        return Response(cached_data)
+        return Response(project_rows(cached_data, fields))
 
     # Default ordering field
     ordering_field = request.query_params.get("ordering", "-mcap")
@@ -269,70 +439,126 @@ def get_risk_metrics(request):
             {"error": f"Invalid ordering field: {ordering_field}"}, status=400
         )
 
-    # Order by the validated field
-    data = RiskMetric.objects.all().order_by(ordering_field)
+    # Order by the validated field; heavy columns are never read unless selected
+    data = RiskMetric.objects.order_by(ordering_field).values(*fields)
     paginator = StandardPagination()
     result_page = paginator.paginate_queryset(data, request)
-    serializer = RiskMetricSerializer(result_page, many=True)
-    return paginator.get_paginated_response(serializer.data)
+    return paginator.get_paginated_response(result_page)
+
+
+@api_view(["GET"])
+def get_risk_metric(request, slug):
+    """Full row, including the deferred heavy columns, for one protocol."""
+    data = RiskMetric.objects.filter(slug=slug).first()
+    if data is None:
+        return Response({"error": "Protocol not found"}, status=404)
+    with timed("serialize"):
+        data = RiskMetricSerializer(data).data
+    return Response(data)
+
+
+@api_view(["GET"])
+def get_risk_metric_history(request, slug):
+    """Daily TVL and market cap of one protocol, oldest first, as columns.
+
+    ``?start=YYYY-MM-DD&end=YYYY-MM-DD`` (end exclusive) limit the range;
+    filled by the daily ingest and ``manage.py backfill_protocol_history``.
+    """
+    history = ProtocolHistory.objects.filter(protocol=slug).order_by("date")
+    for param, lookup in (("start", "date__gte"), ("end", "date__lt")):
+        if param in request.query_params:
+            day = parse_date(request.query_params[param])
+            if day is None:
+                return Response({"error": f"{param} must be a date"}, status=400)
+            history = history.filter(**{lookup: day})
+    rows = list(history.values_list("date", "tvl", "mcap"))
+    if not rows:
+        return Response({"error": "No history for this protocol"}, status=404)
+    dates, tvl, mcap = zip(*rows)
+    return Response(
+        {
+            "slug": slug,
+            "dates": [day.isoformat() for day in dates],
+            "tvl": tvl,
+            "mcap": mcap,
+        }
+    )
 
 
 # On-Chain Data Endpoints
 @api_view(["GET"])
 def fetch_on_chain_data(request):
     data = {}
-    try:
-        # Fetch TVL data
-        tvl_url = "https://api.llama.fi/charts"
-        tvl_response = requests.get(tvl_url, timeout=10)
-        if tvl_response.status_code == 200:
-            data["tvl"] = tvl_response.json()
-    except Exception as e:
-        logger.error(f"TVL data fetch failed: {e}")
+    unavailable = None
+    with ingest_run("on_chain_data", trigger="fetch") as run:
+        try:
+            # Fetch TVL data
+            with run.stage("download"):
+                tvl_response = fetch(upstream_url("charts"))
+            run.downloaded(len(tvl_response.content))
+            if tvl_response.status_code == 200:
+                with run.stage("parse"):
+                    data["tvl"] = tvl_response.json()
+        except UpstreamError as e:
+            logger.warning(f"TVL data not fetched: {e}")
+            unavailable = e
+        except Exception as e:
+            logger.error(f"TVL data fetch failed: {e}")
 
-    try:
-        # Fetch DeFi market data
-        cg_url = "https://api.coingecko.com/api/v3/global/defi"
-        cg_response = requests.get(
-            cg_url, headers={"x-cg-api-key": settings.COINGECKO_API_KEY}, timeout=10
-        )
-        if cg_response.status_code == 200:
-            data["market"] = cg_response.json()
-    except Exception as e:
-        logger.error(f"CoinGecko data fetch failed: {e}")
+        try:
+            # Fetch DeFi market data
+            with run.stage("download"):
+                cg_response = fetch(
+                    upstream_url("coingecko_defi"),
+                    headers={"x-cg-api-key": settings.COINGECKO_API_KEY},
+                )
+            run.downloaded(len(cg_response.content))
+            if cg_response.status_code == 200:
+                with run.stage("parse"):
+                    data["market"] = cg_response.json()
+        except UpstreamError as e:
+            logger.warning(f"CoinGecko data not fetched: {e}")
+            unavailable = e
+        except Exception as e:
+            logger.error(f"CoinGecko data fetch failed: {e}")
 
-    if not data:
-        return Response({"error": "All data fetches failed"}, status=500)
+        if not data:
+            run.fail("All data fetches failed")
+            if unavailable:
+                return upstream_unavailable(unavailable)
+            return Response({"error": "All data fetches failed"}, status=500)
 
-    # Process whatever data we successfully retrieved
-    try:
-        OnChainData.objects.update_or_create(
-            id=1,
-            defaults={
-                "transaction_volume": data.get("market", {})
-                .get("data", {})
-                .get("trading_volume_24h", 0),
-                "tvl": data.get("tvl", []),
-                "wallet_balance": data.get("market", {})
-                .get("data", {})
-                .get("market_cap", 0),
-            },
-        )
-        return Response({"message": "On-chain data updated successfully!"})
-    except Exception as e:
-        logger.exception("Error saving on-chain data")
-        return Response({"error": str(e)}, status=500)
+        # Process whatever data we successfully retrieved
+        try:
+            ingest_on_chain_data(data, run)
+            if unavailable:
+                return Response(
+                    {
+                        "message": "On-chain data partially updated",
+                        "error": str(unavailable),
+                        "stale": True,
+                    }
+                )
+            return Response({"message": "On-chain data updated successfully!"})
+        except Exception as e:
+            logger.exception("Error saving on-chain data")
+            run.fail(e)
+            return Response({"error": str(e)}, status=500)
 
 
 @api_view(["GET"])
 def get_on_chain_data(request):
-    cached_data = cache.get("on_chain_data")
+    return _on_chain_data(request, cache.get("on_chain_data"))
+
+
+def _on_chain_data(request, cached_data):
     if cached_data:
         return Response(cached_data)
 
     data = OnChainData.objects.first()
-    serializer = OnChainDataSerializer(data)
-    return Response(serializer.data)
+    with timed("serialize"):
+        data = OnChainDataSerializer(data).data
+    return Response(data)
 
 
 # Simulate Governance Vote
@@ -371,8 +597,13 @@ def simulate_governance_vote(request):
 # Risk Scores Endpoints
 @api_view(["GET"])
 def fetch_risk_scores(request):
-    url = "https://api.llama.fi/protocols"
-    if fetch_and_cache_data(url, RiskScore, RiskScoreSerializer, "risk_scores"):
+    try:
+        fetched = fetch_and_cache_data(
+            upstream_url("protocols"), RiskScore, RiskScoreSerializer, "risk_scores"
+        )
+    except UpstreamError as e:
+        return upstream_unavailable(e)
+    if fetched:
         return Response({"message": "Risk scores updated successfully!"})
     else:
         return Response({"error": "Failed to fetch data"}, status=500)
@@ -380,49 +611,484 @@ def fetch_risk_scores(request):
 
 @api_view(["GET"])
 def get_risk_scores(request):
-    cached_data = cache.get("risk_scores")
+    return _risk_scores(request, cache.get("risk_scores"))
+
+
+def _risk_scores(request, cached_data):
+    try:
+        fields = select_fields(RiskScore, request.query_params.get("fields"))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    if "since" in request.query_params:
+        rows = RiskScore.objects.order_by("-risk_score")
+        return _since_response(request, "risk_scores", rows, fields, cached_data)
+
     if cached_data:
-        return Response(cached_data)
+        return Response(project_rows(cached_data, fields))
 
-    data = RiskScore.objects.all().order_by("-risk_score")
+    data = RiskScore.objects.order_by("-risk_score").values(*fields)
     paginator = StandardPagination()
     result_page = paginator.paginate_queryset(data, request)
-    serializer = RiskScoreSerializer(result_page, many=True)
-    return paginator.get_paginated_response(serializer.data)
+    return paginator.get_paginated_response(result_page)
 
 
 # Technical Data Endpoints
 @api_view(["GET"])
 def fetch_technical_data(request):
-    try:
-        price_url = "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd&include_24hr_vol=true"
-        price_response = requests.get(price_url, timeout=10)
-        price_data = price_response.json()
-
-        protocols_url = "https://api.llama.fi/protocols"
-        protocols_response = requests.get(protocols_url, timeout=10)
-        protocol_data = protocols_response.json()
-
-        TechnicalData.objects.update_or_create(
-            id=1,
-            defaults={
-                "uniswap_data": protocol_data,
-                "wallet_transactions": price_data,
-                "tenderly_simulation": {},
-            },
-        )
-        return Response({"message": "Technical data updated successfully!"})
-    except Exception as e:
-        logger.exception("Error fetching technical data")
-        return Response({"error": str(e)}, status=500)
+    with ingest_run("technical_data", trigger="fetch") as run:
+        try:
+            # A source that is throttled or down keeps its last good data
+            payloads, unavailable = {}, None
+            for name in ("coingecko_price", "protocols"):
+                try:
+                    with run.stage("download"):
+                        response = fetch(upstream_url(name))
+                except UpstreamError as e:
+                    logger.warning(f"Technical data source {name} not fetched: {e}")
+                    payloads[name], unavailable = None, e
+                    continue
+                run.downloaded(len(response.content))
+                with run.stage("parse"):
+                    payloads[name] = response.json()
+            if all(payload is None for payload in payloads.values()):
+                run.fail(unavailable)
+                return upstream_unavailable(unavailable)
+
+            ingest_technical_data(
+                payloads["protocols"], payloads["coingecko_price"], run
+            )
+            if unavailable:
+                return Response(
+                    {
+                        "message": "Technical data partially updated",
+                        "error": str(unavailable),
+                        "stale": True,
+                    }
+                )
+            return Response({"message": "Technical data updated successfully!"})
+        except Exception as e:
+            logger.exception("Error fetching technical data")
+            run.fail(e)
+            return Response({"error": str(e)}, status=500)
 
 
 @api_view(["GET"])
 def get_technical_data(request):
-    cached_data = cache.get("technical_data")
+    return _technical_data(request, cache.get("technical_data"))
+
+
+def _technical_data(request, cached_data):
     if cached_data:
         return Response(cached_data)
 
     data = TechnicalData.objects.first()
-    serializer = TechnicalDataSerializer(data)
-    return Response(serializer.data)
+    with timed("serialize"):
+        data = TechnicalDataSerializer(data).data
+    return Response(data)
+
+
+# Batch Endpoint
+# Batchable endpoint -> (dataset, resolver, served from the dataset's cache
+# entry); yield pools come from the in-memory yield index instead
+BATCH_PARTS = {
+    "yield-data": ("yield_data", _yield_data, False),
+    "governance-data": ("governance_data", _governance_data, True),
+    "risk-metrics": ("risk_metrics", _risk_metrics, True),
+    "risk-scores": ("risk_scores", _risk_scores, True),
+    "on-chain-data": ("on_chain_data", _on_chain_data, True),
+    "technical-data": ("technical_data", _technical_data, True),
+}
+MAX_BATCH_PARTS = 20
+
+
+def _part_etag(dataset, generation, source, params):
+    """Changes whenever the dataset gets a new generation or the query changes."""
+    digest = hashlib.sha1(
+        json.dumps([source, sorted(params.items())]).encode()
+    ).hexdigest()[:12]
+    return f'"{dataset}-{generation}-{digest}"'
+
+
+def _part_request(request, path, params):
+    """A GET request for one part, as if ``/api/<path>/?<params>`` was called."""
+    part = HttpRequest()
+    part.method = "GET"
+    part.path = part.path_info = f"/api/{path}/"
+    part.META = {**request.META, "REQUEST_METHOD": "GET"}
+    part.META["QUERY_STRING"] = urlencode(params)
+    part.GET = QueryDict(part.META["QUERY_STRING"])
+    return Request(part)
+
+
+def _parse_batch(body):
+    """[(id, path, params, etag)] from a batch request body; raises ValueError."""
+    parts = body.get("parts") if isinstance(body, dict) else None
+    if not isinstance(parts, list) or not parts:
+        raise ValueError("parts must be a non-empty list")
+    if len(parts) > MAX_BATCH_PARTS:
+        raise ValueError(f"At most {MAX_BATCH_PARTS} parts per batch")
+    parsed, ids = [], set()
+    for part in parts:
+        if not isinstance(part, dict) or part.get("path") not in BATCH_PARTS:
+            raise ValueError(f"Invalid part: {part}; paths: {', '.join(BATCH_PARTS)}")
+        params = part.get("params") or {}
+        if not isinstance(params, dict):
+            raise ValueError(f"params of {part['path']} must be an object")
+        part_id = str(part.get("id", part["path"]))
+        if part_id in ids:
+            raise ValueError(f"Duplicate part id: {part_id}")
+        ids.add(part_id)
+        params = {str(k): str(v) for k, v in params.items()}
+        parsed.append((part_id, part["path"], params, part.get("etag")))
+    return parsed
+
+
+@api_view(["POST"])
+def batch(request):
+    """Resolve several dataset reads in one round trip.
+
+    ``{"parts": [{"id": "pools", "path": "yield-data", "params": {...},
+    "etag": "..."}, ...]}``. Each part is answered as its endpoint would, with
+    an ETag; parts whose ETag the client already has come back as 304 without
+    data. All cached datasets are read with a single cache multi-get.
+    """
+    try:
+        parts = _parse_batch(request.data)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    cache_keys = {
+        BATCH_PARTS[path][0] for _, path, _, _ in parts if BATCH_PARTS[path][2]
+    }
+    cached = cache.get_many(list(cache_keys)) if cache_keys else {}
+    generations = current_generations()
+
+    results = {}
+    for part_id, path, params, known_etag in parts:
+        dataset, resolve, uses_cache = BATCH_PARTS[path]
+        cached_data = cached.get(dataset) if uses_cache else None
+        # Cached datasets are served whole, database reads page by page
+        source = "cache" if cached_data else "db"
+        etag = _part_etag(dataset, generations.get(dataset, 0), source, params)
+        if known_etag == etag:
+            results[part_id] = {"status": 304, "etag": etag}
+            continue
+        try:
+            response = resolve(_part_request(request, path, params), cached_data)
+        except Exception as e:
+            logger.exception(f"Error resolving batch part {part_id} ({path})")
+            results[part_id] = {"status": 500, "data": {"error": str(e)}}
+            continue
+        results[part_id] = {"status": response.status_code, "data": response.data}
+        if response.status_code == 200:
+            results[part_id]["etag"] = etag
+    return Response({"parts": results})
+
+
+# Bulk Export Endpoints
+@require_GET
+def export_dataset(request, dataset, fmt):
+    """Stream a whole table as NDJSON, CSV, Parquet or Arrow IPC."""
+    model = EXPORT_DATASETS.get(dataset)
+    if model is None:
+        return JsonResponse({"error": f"Unknown dataset: {dataset}"}, status=404)
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({"error": f"Unsupported format: {fmt}"}, status=400)
+    if fmt in COLUMNAR_FORMATS and pyarrow is None:
+        return JsonResponse(
+            {"error": f"{fmt} export requires pyarrow to be installed"}, status=501
+        )
+
+    requested = request.GET.get("fields")
+    try:
+        fields = (
+            select_fields(model, requested) if requested else model_field_names(model)
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        stream_export(model, fields, fmt), content_type=EXPORT_FORMATS[fmt]
+    )
+    response["Content-Disposition"] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
+
+
+# Analytics Endpoints
+@api_view(["GET"])
+def get_summary(request):
+    """Dashboard summary: TVL, weighted APY by chain, stablecoin split, movers."""
+    return Response(current_summary())
+
+
+@api_view(["GET"])
+def get_anomalies(request):
+    """Anomaly flags, most severe first, filterable by dataset, kind and key.
+
+    Lists the latest detection run of each dataset unless ``?since=`` (ISO
+    datetime) asks for every flag detected after it.
+    """
+    params = request.query_params
+    flags = AnomalyFlag.objects.order_by("-severity", "key")
+    for field in ("dataset", "kind", "key"):
+        if field in params:
+            flags = flags.filter(**{field: params[field]})
+    if "since" in params:
+        since = parse_datetime(params["since"])
+        if since is None:
+            return Response({"error": "since must be an ISO datetime"}, status=400)
+        flags = flags.filter(detected_at__gte=since)
+    else:
+        latest = AnomalyFlag.objects.order_by("-generation")
+        runs = [
+            (dataset, latest.filter(dataset=dataset).values_list("generation").first())
+            for dataset in ANOMALY_RULES
+        ]
+        query = Q(pk__in=[])
+        for dataset, generation in runs:
+            if generation is not None:
+                query |= Q(dataset=dataset, generation=generation[0])
+        flags = flags.filter(query)
+    paginator = StandardPagination()
+    result_page = paginator.paginate_queryset(flags.values(), request)
+    return paginator.get_paginated_response(result_page)
+
+
+ANALYTICS_DATASETS = {"yield-data": "yield_data", "risk-metrics": "risk_metrics"}
+
+
+@api_view(["GET"])
+def get_aggregate(request, dataset):
+    """Aggregate a numeric column of the current columnar snapshot.
+
+    ``?metric=tvlUsd&op=sum&group_by=project&chain=Ethereum&limit=20``; any
+    other category or boolean column can be used as an equality filter.
+    """
+    snapshot_name = ANALYTICS_DATASETS.get(dataset)
+    if snapshot_name is None:
+        return Response({"error": f"Unknown dataset: {dataset}"}, status=404)
+    snapshot = load_snapshot(snapshot_name)
+    if snapshot is None:
+        return Response({"error": "No snapshot available yet"}, status=404)
+
+    params = request.query_params
+    metric = params.get("metric")
+    op = params.get("op", "sum")
+    group_by = params.get("group_by")
+    if snapshot.kinds.get(metric) != "float":
+        return Response({"error": f"Invalid metric: {metric}"}, status=400)
+    if op not in AGGREGATIONS:
+        return Response({"error": f"Invalid op: {op}"}, status=400)
+    if group_by is not None and snapshot.kinds.get(group_by) != "category":
+        return Response({"error": f"Invalid group_by: {group_by}"}, status=400)
+    try:
+        limit = int(params.get("limit", 50))
+    except ValueError:
+        return Response({"error": "Invalid limit"}, status=400)
+
+    reserved = ("metric", "op", "group_by", "limit", "format")
+    filters = {
+        column: value
+        for column, value in params.items()
+        if column not in reserved and snapshot.kinds.get(column) in ("category", "bool")
+    }
+    results = aggregate(snapshot, metric, op, group_by, filters)
+    return Response(
+        {
+            "generation": snapshot.generation,
+            "rows": snapshot.rows,
+            "metric": metric,
+            "op": op,
+            "group_by": group_by,
+            "filters": filters,
+            "results": results[:limit],
+        }
+    )
+
+
+def _sketch_params(params):
+    """(metric, group_by, key, days) of a distribution query; raises ValueError."""
+    metric = params.get("metric", "apy")
+    if metric not in SKETCH_METRICS:
+        raise ValueError(f"Invalid metric: {metric}")
+    group_by = params.get("group_by", "all")
+    if group_by not in SKETCH_DIMENSIONS:
+        raise ValueError(f"Invalid group_by: {group_by}")
+    days = params.get("days")
+    if days is not None:
+        try:
+            days = int(days)
+        except ValueError:
+            raise ValueError("Invalid days")
+        if not 1 <= days <= settings.SKETCH_HISTORY_DAYS:
+            raise ValueError(
+                f"days must be between 1 and {settings.SKETCH_HISTORY_DAYS}"
+            )
+    return metric, group_by, params.get("key"), days
+
+
+@api_view(["GET"])
+def get_yield_distribution(request):
+    """Approximate percentiles of a pool metric, overall or per chain/project.
+
+    ``?metric=apy&group_by=chain&quantiles=0.1,0.5,0.9``; ``days=N`` merges
+    the daily sketches of the last N days instead of the latest ingest, and
+    ``key`` keeps a single group. Values are within ``relative_accuracy``.
+    """
+    params = request.query_params
+    try:
+        metric, group_by, key, days = _sketch_params(params)
+        qs = [float(q) for q in params.get("quantiles", "0.1,0.5,0.9").split(",")]
+        limit = int(params.get("limit", 50))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    if not qs or not all(0 <= q <= 1 for q in qs):
+        return Response({"error": "Quantiles must be between 0 and 1"}, status=400)
+
+    sketches = load_sketches(metric, group_by, days)
+    if key is not None:
+        sketches = {key: sketches[key]} if key in sketches else {}
+    results = []
+    for group, sketch in sorted(sketches.items(), key=lambda kv: -kv[1].count)[:limit]:
+        results.append(
+            {
+                "key": group,
+                "count": sketch.count,
+                "mean": sketch.mean,
+                "min": sketch.min if sketch.count else None,
+                "max": sketch.max if sketch.count else None,
+                "quantiles": {
+                    f"p{q * 100:g}": value for q, value in zip(qs, sketch.quantiles(qs))
+                },
+            }
+        )
+    return Response(
+        {
+            "metric": metric,
+            "group_by": group_by,
+            "period": "current" if days is None else f"last {days} days",
+            "relative_accuracy": settings.SKETCH_RELATIVE_ACCURACY,
+            "groups": len(sketches),
+            "results": results,
+        }
+    )
+
+
+@api_view(["GET"])
+def get_yield_histogram(request):
+    """Approximate histogram of a pool metric, for all pools or one group.
+
+    ``?metric=tvlUsd&bins=20&scale=log&group_by=chain&key=Ethereum&days=7``
+    """
+    params = request.query_params
+    try:
+        metric, group_by, key, days = _sketch_params(params)
+        bins = int(params.get("bins", 20))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    scale = params.get("scale", "linear")
+    if scale not in ("linear", "log"):
+        return Response({"error": f"Invalid scale: {scale}"}, status=400)
+    if not 1 <= bins <= 200:
+        return Response({"error": "bins must be between 1 and 200"}, status=400)
+    if group_by != "all" and key is None:
+        return Response({"error": "key is required with group_by"}, status=400)
+
+    sketch = load_sketches(metric, group_by, days).get(key or "")
+    if sketch is None or not sketch.count:
+        return Response({"error": "No data for this group"}, status=404)
+    low, high = sketch.min, sketch.max
+    if scale == "log":
+        low = max(low, MIN_INDEXABLE)
+        if high <= low:
+            return Response({"error": "No positive values for a log scale"}, status=400)
+        edges = np.geomspace(low, high, bins + 1)
+    else:
+        edges = np.linspace(low, high if high > low else low + 1, bins + 1)
+    return Response(
+        {
+            "metric": metric,
+            "group_by": group_by,
+            "key": key,
+            "period": "current" if days is None else f"last {days} days",
+            "scale": scale,
+            "count": sketch.count,
+            "edges": edges.tolist(),
+            "counts": sketch.histogram(edges),
+        }
+    )
+
+
+MAX_CORRELATION_K = 100
+
+
+@api_view(["GET"])
+def get_correlations(request):
+    """Protocols covered by the TVL return correlation matrix.
+
+    ``?slugs=aave,lido,...`` also returns the correlation matrix between them.
+    """
+    correlations = load_correlations()
+    if correlations is None:
+        return Response({"error": "No snapshot available yet"}, status=404)
+    data = {
+        "generation": correlations.generation,
+        "window_days": settings.CORRELATION_WINDOW_DAYS,
+        "protocols": [
+            {"slug": slug, "name": name}
+            for slug, name in zip(
+                correlations.slugs.tolist(), correlations.names.tolist()
+            )
+        ],
+    }
+    if "slugs" in request.query_params:
+        slugs = [s for s in request.query_params["slugs"].split(",") if s]
+        unknown = [slug for slug in slugs if slug not in correlations]
+        if unknown:
+            return Response(
+                {"error": f"Not in the correlation matrix: {', '.join(unknown)}"},
+                status=404,
+            )
+        matrix = correlations.submatrix(slugs)
+        data["slugs"] = slugs
+        data["matrix"] = [
+            [None if np.isnan(value) else value for value in row]
+            for row in matrix.tolist()
+        ]
+    return Response(data)
+
+
+@api_view(["GET"])
+def get_correlated_protocols(request, slug):
+    """The ``k`` protocols whose daily TVL returns best track ``slug``'s.
+
+    ``?k=10&order=negative`` lists the most negatively correlated instead.
+    """
+    try:
+        k = int(request.query_params.get("k", 10))
+    except ValueError:
+        return Response({"error": "Invalid k"}, status=400)
+    if not 1 <= k <= MAX_CORRELATION_K:
+        return Response(
+            {"error": f"k must be between 1 and {MAX_CORRELATION_K}"}, status=400
+        )
+    order = request.query_params.get("order", "positive")
+    if order not in ("positive", "negative"):
+        return Response({"error": f"Invalid order: {order}"}, status=400)
+
+    correlations = load_correlations()
+    if correlations is None:
+        return Response({"error": "No snapshot available yet"}, status=404)
+    if slug not in correlations:
+        return Response(
+            {"error": f"{slug} is not among the protocols correlated"}, status=404
+        )
+    return Response(
+        {
+            "slug": slug,
+            "generation": correlations.generation,
+            "window_days": settings.CORRELATION_WINDOW_DAYS,
+            "order": order,
+            "results": correlations.top(slug, k, negative=order == "negative"),
+        }
+    )
@@ -0,0 +1,271 @@
+"""
+In-process index answering /api/yield-data/ queries without touching SQLite.
+
+Built from the serialized pool rows whenever a yield generation lands:
+
+* a NumPy structured array holding the numeric pool fields,
+* ascending and descending sort permutations for each of those fields,
+* packed bitmaps per distinct ``chain``, ``project`` and ``stablecoin`` value.
+
+A filter + sort + page query ANDs/ORs bitmaps, walks one permutation and
+slices out the page, all in microseconds. SQLite remains the durable store:
+workers that did not run the ingest rebuild their index from the cache or the
+database when they notice a newer generation, and the swap is a single
+reference assignment, so requests never see a half-built index. The cached
+rows are only used once they are those of the new generation: the cache is
+set just after a generation is published.
+"""
+
+import logging
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Max, Min
+from .models import DatasetGeneration, YieldData
+from .projection import model_field_names
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_FIELDS = (
+    "tvlUsd",
+    "apy",
+    "apyBase",
+    "apyReward",
+    "apyPct1D",
+    "apyPct7D",
+    "apyPct30D",
+    "apyBase7d",
+    "apyMean30d",
+    "apyBaseInception",
+    "il7d",
+    "volumeUsd1d",
+    "volumeUsd7d",
+    "mu",
+    "sigma",
+    "count",
+)
+BITMAP_FIELDS = ("chain", "project", "stablecoin")
+DEFAULT_ORDERING = "-tvlUsd"
+
+
+class YieldQuery:
+    def __init__(self, filters, ordering):
+        self.filters = filters  # field -> list of accepted values
+        self.ordering = ordering
+
+    def filter_kwargs(self):
+        """Equivalent ORM filter for the database fallback."""
+        kwargs = {}
+        for field, values in self.filters.items():
+            if field == "stablecoin":
+                kwargs[field] = values[0]
+            else:
+                kwargs[f"{field}__in"] = values
+        return kwargs
+
+    def order_by(self):
+        """Equivalent ORM ordering: missing values last, ties in row order."""
+        field = self.ordering.lstrip("-")
+        if self.ordering.startswith("-"):
+            return [F(field).desc(nulls_last=True), "pk"]
+        return [F(field).asc(nulls_last=True), "pk"]
+
+
+def parse_yield_query(params):
+    """Read ``chain``, ``project``, ``stablecoin`` and ``ordering`` parameters.
+
+    ``chain`` and ``project`` accept comma-separated values. Raises ValueError
+    for invalid values.
+    """
+    filters = {}
+    for field in ("chain", "project"):
+        values = [v for v in params.get(field, "").split(",") if v]
+        if values:
+            filters[field] = values
+    if "stablecoin" in params:
+        value = params["stablecoin"].lower()
+        if value not in ("true", "false", "1", "0"):
+            raise ValueError(f"Invalid stablecoin value: {params['stablecoin']}")
+        filters["stablecoin"] = [value in ("true", "1")]
+
+    ordering = params.get("ordering", DEFAULT_ORDERING)
+    if ordering.lstrip("-") not in model_field_names(YieldData):
+        raise ValueError(f"Invalid ordering field: {ordering}")
+    return YieldQuery(filters, ordering)
+
+
+def _number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return np.nan
+
+
+class IndexSelection:
+    """Sliceable result of an index query, usable by Django/DRF paginators."""
+
+    def __init__(self, rows, positions, fields):
+        self.rows = rows
+        self.positions = positions
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _row(self, position):
+        row = self.rows[position]
+        return {field: row.get(field) for field in self.fields}
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._row(position) for position in self.positions[item]]
+        return self._row(self.positions[item])
+
+
+class YieldIndex:
+    def __init__(self, generation, rows):
+        self.generation = generation
+        self.rows = rows
+        self.size = size = len(rows)
+
+        self.values = np.empty(size, dtype=[(f, "f8") for f in NUMERIC_FIELDS])
+        for field in NUMERIC_FIELDS:
+            self.values[field] = [_number(row.get(field)) for row in rows]
+
+        self.ascending = {}
+        self.descending = {}
+        for field in NUMERIC_FIELDS:
+            column = self.values[field]
+            # argsort puts NaN last in both directions and, being stable,
+            # keeps ties in row order
+            self.ascending[field] = np.argsort(column, kind="stable").astype(np.int32)
+            self.descending[field] = np.argsort(-column, kind="stable").astype(np.int32)
+
+        self.bitmaps = {}
+        for field in BITMAP_FIELDS:
+            codes = {}
+            column = np.fromiter(
+                (codes.setdefault(row.get(field), len(codes)) for row in rows),
+                dtype=np.int32,
+                count=size,
+            )
+            self.bitmaps[field] = {
+                value: np.packbits(column == code) for value, code in codes.items()
+            }
+
+    def supports(self, query):
+        return query.ordering.lstrip("-") in NUMERIC_FIELDS
+
+    def query(self, query, fields):
+        field = query.ordering.lstrip("-")
+        if query.ordering.startswith("-"):
+            order = self.descending[field]
+        else:
+            order = self.ascending[field]
+
+        mask = None
+        for name, values in query.filters.items():
+            bits = None
+            for value in values:
+                bitmap = self.bitmaps[name].get(value)
+                if bitmap is not None:
+                    bits = bitmap if bits is None else bits | bitmap
+            if bits is None:
+                return IndexSelection(self.rows, order[:0], fields)
+            mask = bits if mask is None else mask & bits
+
+        if mask is not None:
+            keep = np.unpackbits(mask, count=self.size).view(np.bool_)
+            order = order[keep[order]]
+        return IndexSelection(self.rows, order, fields)
+
+    def stats(self):
+        permutation_bytes = sum(a.nbytes for a in self.ascending.values()) + sum(
+            a.nbytes for a in self.descending.values()
+        )
+        bitmap_bytes = sum(
+            bitmap.nbytes
+            for bitmaps in self.bitmaps.values()
+            for bitmap in bitmaps.values()
+        )
+        return {
+            "generation": self.generation,
+            "rows": self.size,
+            "values_bytes": self.values.nbytes,
+            "permutation_bytes": permutation_bytes,
+            "bitmap_bytes": bitmap_bytes,
+            "total_array_bytes": self.values.nbytes + permutation_bytes + bitmap_bytes,
+            "bitmaps": {field: len(b) for field, b in self.bitmaps.items()},
+        }
+
+
+class YieldIndexHolder:
+    """Holds the current index and swaps in a rebuilt one atomically."""
+
+    def __init__(self):
+        self.index = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def publish(self, generation, rows):
+        start = time.perf_counter()
+        index = YieldIndex(generation, rows)
+        self.index = index
+        logger.info(
+            f"Built yield index for generation {generation} "
+            f"({index.size} rows, {time.perf_counter() - start:.3f}s)"
+        )
+
+    def get(self):
+        """Return the current index, rebuilding it if a newer generation exists."""
+        if not settings.YIELD_INDEX_ENABLED:
+            return None
+        now = time.monotonic()
+        if now - self._checked_at < settings.YIELD_INDEX_CHECK_INTERVAL:
+            return self.index
+        # Only one thread rebuilds; the others keep serving the previous index
+        if not self._lock.acquire(blocking=False):
+            return self.index
+        try:
+            self._checked_at = now
+            generation = (
+                DatasetGeneration.objects.filter(dataset="yield_data")
+                .values_list("generation", flat=True)
+                .first()
+            )
+            if generation is None:
+                return self.index
+            if self.index is None or self.index.generation != generation:
+                rows = self._rows(generation)
+                if rows is not None:
+                    self.publish(generation, rows)
+        finally:
+            self._lock.release()
+        return self.index
+
+    def _rows(self, generation):
+        """
+        The pool rows of ``generation``, from the cache if it has them; None
+        if they were collected because a newer generation was published.
+        """
+        rows = YieldData.all_generations.filter(generation=generation).order_by("pk")
+        # Every generation gets new primary keys, in order: the cached rows
+        # are this generation's if they start and end with its first and last
+        bounds = rows.aggregate(first=Min("pk"), last=Max("pk"))
+        if bounds["first"] is None and (
+            DatasetGeneration.objects.filter(
+                dataset="yield_data", generation__gt=generation
+            ).exists()
+        ):
+            return None
+        cached = cache.get("yield_data")
+        if cached and (cached[0]["id"], cached[-1]["id"]) == (
+            bounds["first"],
+            bounds["last"],
+        ):
+            return cached
+        return list(rows.values(*model_field_names(YieldData)))
+
+
+yield_index = YieldIndexHolder()
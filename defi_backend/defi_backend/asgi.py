@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "defi_backend.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, since it reads settings and models
+from defi.live import LiveUpdatesRouter  # noqa: E402
+
+application = LiveUpdatesRouter(django_application)
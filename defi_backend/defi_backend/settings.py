@@ -1,6 +1,7 @@
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import tempfile
 
 # Load environment variables
 load_dotenv()
@@ -29,6 +30,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "defi.instrumentation.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -64,11 +66,76 @@ TEMPLATES = [
 WSGI_APPLICATION = "defi_backend.wsgi.application"
 
 # Database
+# Reads are routed to a separate "read" alias on the same SQLite file, so with
+# WAL enabled readers keep working from their own connection while an ingest
+# holds the write lock (see defi.routers and defi.db).
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+    },
+    "read": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    },
+}
+DATABASE_ROUTERS = ["defi.routers.ReadWriteRouter"]
+DATABASE_READ_ALIAS = os.getenv("DATABASE_READ_ALIAS", "read")
+
+# PRAGMAs applied to every new SQLite connection; set SQLITE_PROFILE=off to
+# keep SQLite's defaults (rollback journal, synchronous=FULL).
+SQLITE_PROFILE = (
+    {
+        "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+        "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # KiB if < 0
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),  # ms
+        "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
     }
+    if os.getenv("SQLITE_PROFILE", "on").lower() != "off"
+    else {}
+)
+
+# Cache
+# Two tiers: a bounded in-process LRU (defi.cache.TwoTierCache) in front of a
+# cache shared by all workers. CACHE_SHARED_BACKEND picks the shared tier:
+# "file" (default), "sqlite" (run `manage.py createcachetable`) or "redis".
+SHARED_CACHE_BACKENDS = {
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv(
+            "CACHE_FILE_LOCATION", os.path.join(tempfile.gettempdir(), "defi_cache")
+        ),
+    },
+    "sqlite": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "defi_cache",
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_REDIS_URL", "redis://127.0.0.1:6379"),
+    },
+}
+CACHES = {
+    "default": {
+        "BACKEND": "defi.cache.TwoTierCache",
+        "TIMEOUT": 300,
+        "OPTIONS": {
+            "SHARED": "shared",
+            "MAX_BYTES": int(os.getenv("CACHE_LOCAL_MAX_BYTES", str(64 * 1024 * 1024))),
+            "GENERATION_CHECK_INTERVAL": float(
+                os.getenv("CACHE_GENERATION_CHECK_INTERVAL", "1.0")
+            ),
+            # Longest a worker keeps a local copy (never past the shared expiry)
+            "LOCAL_TIMEOUT": float(os.getenv("CACHE_LOCAL_TIMEOUT", "60")),
+        },
+    },
+    "shared": {
+        **SHARED_CACHE_BACKENDS[os.getenv("CACHE_SHARED_BACKEND", "file")],
+        "TIMEOUT": 300,
+    },
 }
 
 # Password validation
@@ -100,6 +167,127 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 # Default primary key field
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Live updates (server push over ASGI)
+LIVE_UPDATES_POLL_INTERVAL = float(os.getenv("LIVE_UPDATES_POLL_INTERVAL", "1.0"))
+LIVE_UPDATES_HEARTBEAT = float(os.getenv("LIVE_UPDATES_HEARTBEAT", "15"))
+LIVE_UPDATES_MAX_DIFF_ROWS = int(os.getenv("LIVE_UPDATES_MAX_DIFF_ROWS", "500"))
+
+# Delta sync (?since=<generation>, defi.delta): generations deletions stay
+# listable, and changed rows above which the full dataset is returned instead
+DELTA_RETENTION_GENERATIONS = int(os.getenv("DELTA_RETENTION_GENERATIONS", "1000"))
+DELTA_MAX_ROWS = int(os.getenv("DELTA_MAX_ROWS", "5000"))
+# Delete the rows of superseded dataset generations in a background thread
+# after each publish (False: inline, before the ingest returns)
+GENERATION_GC_BACKGROUND = (
+    os.getenv("GENERATION_GC_BACKGROUND", "True").lower() == "true"
+)
+
+# Ingestion
+YIELD_POOL_LIMIT = int(os.getenv("YIELD_POOL_LIMIT", "10"))  # 0 keeps every pool
+# Log one in this many ingested items at DEBUG; runs are kept this many days
+INGEST_LOG_SAMPLE_EVERY = int(os.getenv("INGEST_LOG_SAMPLE_EVERY", "1000"))
+INGEST_RUN_RETENTION_DAYS = int(os.getenv("INGEST_RUN_RETENTION_DAYS", "30"))
+# Worker processes normalizing large payloads (defi.parallel); 0 or 1 = in-process
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))
+INGEST_PARALLEL_MIN_ROWS = int(os.getenv("INGEST_PARALLEL_MIN_ROWS", "5000"))
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "2000"))
+# Gzipped upstream bodies by SHA-256 (defi.archive); unchanged bodies skip ingest
+PAYLOAD_ARCHIVE_ENABLED = os.getenv("PAYLOAD_ARCHIVE_ENABLED", "True").lower() == "true"
+PAYLOAD_ARCHIVE_DIR = os.getenv(
+    "PAYLOAD_ARCHIVE_DIR", os.path.join(BASE_DIR, "payloads")
+)
+PAYLOAD_ARCHIVE_RETENTION_DAYS = int(os.getenv("PAYLOAD_ARCHIVE_RETENTION_DAYS", "7"))
+# Dashboard summary (defi.summary): movers listed and their minimum TVL, USD
+SUMMARY_TOP_MOVERS = int(os.getenv("SUMMARY_TOP_MOVERS", "10"))
+SUMMARY_MOVERS_MIN_TVL = float(os.getenv("SUMMARY_MOVERS_MIN_TVL", "1000000"))
+# Distribution quantile sketches (defi.sketches): relative error, days kept
+SKETCH_RELATIVE_ACCURACY = float(os.getenv("SKETCH_RELATIVE_ACCURACY", "0.01"))
+SKETCH_HISTORY_DAYS = int(os.getenv("SKETCH_HISTORY_DAYS", "90"))
+# Anomaly detection (defi.anomalies): days of history, robust z-score cut-off,
+# history needed, minimum scale as a fraction of the median, minimum spiked APY,
+# 1h/1d protocol TVL drops (percent) flagged outright and the minimum TVL (USD)
+# of a protocol for them, days flags are kept
+ANOMALY_WINDOW_DAYS = int(os.getenv("ANOMALY_WINDOW_DAYS", "30"))
+ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", "5"))
+ANOMALY_MIN_HISTORY = int(os.getenv("ANOMALY_MIN_HISTORY", "7"))
+ANOMALY_MIN_SCALE = float(os.getenv("ANOMALY_MIN_SCALE", "0.02"))
+ANOMALY_MIN_APY = float(os.getenv("ANOMALY_MIN_APY", "10"))
+ANOMALY_FAST_DRAIN_1H = float(os.getenv("ANOMALY_FAST_DRAIN_1H", "25"))
+ANOMALY_FAST_DRAIN_1D = float(os.getenv("ANOMALY_FAST_DRAIN_1D", "50"))
+ANOMALY_MIN_TVL = float(os.getenv("ANOMALY_MIN_TVL", "1000000"))
+ANOMALY_RETENTION_DAYS = int(os.getenv("ANOMALY_RETENTION_DAYS", "30"))
+# Protocol TVL correlations (defi.correlations): protocols by TVL, days of
+# returns, days two protocols need in common, matrix dtype, rows per block
+CORRELATION_PROTOCOLS = int(os.getenv("CORRELATION_PROTOCOLS", "300"))
+CORRELATION_WINDOW_DAYS = int(os.getenv("CORRELATION_WINDOW_DAYS", "90"))
+CORRELATION_MIN_DAYS = int(os.getenv("CORRELATION_MIN_DAYS", "20"))
+CORRELATION_FLOAT32 = os.getenv("CORRELATION_FLOAT32", "True").lower() == "true"
+CORRELATION_BLOCK_SIZE = int(os.getenv("CORRELATION_BLOCK_SIZE", "128"))
+# History backfills (defi.backfill): requests in flight, requests per second
+# per upstream host (0 = unlimited), attempts per key, first retry delay in
+# seconds, keys stored per transaction, days of history kept (0 = all)
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "16"))
+BACKFILL_RATE = float(os.getenv("BACKFILL_RATE", "10"))
+BACKFILL_MAX_ATTEMPTS = int(os.getenv("BACKFILL_MAX_ATTEMPTS", "5"))
+BACKFILL_BACKOFF = float(os.getenv("BACKFILL_BACKOFF", "1"))
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "200"))
+BACKFILL_DAYS = int(os.getenv("BACKFILL_DAYS", "365"))
+
+# Columnar snapshots written at ingest and memory-mapped by the API
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(BASE_DIR, "snapshots"))
+SNAPSHOT_RETENTION = int(os.getenv("SNAPSHOT_RETENTION", "3"))
+
+# In-memory index serving /api/yield-data/; workers re-check the yield
+# generation at most once per interval and rebuild when it moved
+YIELD_INDEX_ENABLED = os.getenv("YIELD_INDEX_ENABLED", "True").lower() == "true"
+YIELD_INDEX_CHECK_INTERVAL = float(os.getenv("YIELD_INDEX_CHECK_INTERVAL", "1.0"))
+
+# Bulk exports stream this many rows per database fetch / encoded chunk
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+
+# Upstream HTTP client. Base URLs can point at `manage.py replay_upstream`
+# to run ingestion offline against recorded payloads
+DEFILLAMA_YIELDS_URL = os.getenv("DEFILLAMA_YIELDS_URL", "https://yields.llama.fi")
+DEFILLAMA_API_URL = os.getenv("DEFILLAMA_API_URL", "https://api.llama.fi")
+COINGECKO_API_URL = os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3")
+SNAPSHOT_HUB_URL = os.getenv("SNAPSHOT_HUB_URL", "https://hub.snapshot.org")
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+
+# Per-host request budgets, "host=rate/burst,...": requests a second and how
+# many may go at once. Hosts not listed get UPSTREAM_DEFAULT_RATE (0 =
+# unlimited). Budgets are per process; split the quota between workers
+UPSTREAM_RATE_LIMITS = {}
+for _item in os.getenv(
+    "UPSTREAM_RATE_LIMITS",
+    "api.coingecko.com=0.5/5,pro-api.coingecko.com=8/20,api.llama.fi=5/10,"
+    "yields.llama.fi=5/10,hub.snapshot.org=1/5",
+).split(","):
+    if _item.strip():
+        _host, _, _budget = _item.partition("=")
+        _rate, _, _burst = _budget.partition("/")
+        UPSTREAM_RATE_LIMITS[_host.strip()] = (float(_rate), int(_burst or 1))
+UPSTREAM_DEFAULT_RATE = float(os.getenv("UPSTREAM_DEFAULT_RATE", "0"))
+# Attempts per request; timeouts, 429s and 5xx are retried after
+# UPSTREAM_BACKOFF * 2**attempt seconds (jittered, capped) or Retry-After
+UPSTREAM_MAX_ATTEMPTS = int(os.getenv("UPSTREAM_MAX_ATTEMPTS", "3"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "10"))
+# Fail a request rather than wait longer than this for its turn
+UPSTREAM_MAX_WAIT = float(os.getenv("UPSTREAM_MAX_WAIT", "30"))
+# Stop calling a host for UPSTREAM_BREAKER_COOLDOWN seconds after this many
+# failures in a row; the last good data is served meanwhile
+UPSTREAM_BREAKER_THRESHOLD = int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5"))
+UPSTREAM_BREAKER_COOLDOWN = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30"))
+
+# Server-Timing headers and /api/metrics/ for every /api/ request
+REQUEST_METRICS_ENABLED = os.getenv("REQUEST_METRICS_ENABLED", "True").lower() == "true"
+
+# Recorded upstream payloads used by `manage.py benchmark`
+BENCHMARK_FIXTURE_DIR = os.getenv(
+    "BENCHMARK_FIXTURE_DIR", os.path.join(BASE_DIR, "benchmarks", "fixtures")
+)
+
 # API Keys
 COINGECKO_API_KEY = os.getenv("COINGECKO_API_KEY")
 if not COINGECKO_API_KEY:
@@ -21,5 +21,6 @@ from django.urls import path, include
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/async/", include("defi.async_urls")),
     path("api/", include("defi.urls")),
 ]